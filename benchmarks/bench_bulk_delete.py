@@ -0,0 +1,75 @@
+"""
+benchmarks/bench_bulk_delete.py
+Compares removal of many OCRedFiles with their files:
+  before - OCRedFile.delete() for each instance (remove_file() and remove_pdf() save the instance before DELETE)
+  after - OCRedFile.bulk_delete(), chunked set-based DELETEs and files removed by a pool of threads
+Each run fills a scratch SQLite database and a scratch media directory with --rows OCRedFiles,
+each OCRedFile has an uploaded file and a searchable PDF.
+usage: python benchmarks/bench_bulk_delete.py [--rows 2000] [--output result.json]
+"""
+__author__ = 'shmakovpn <shmakovpn@yandex.ru>'
+__date__ = '2026-10-18'
+
+import os
+import time
+import hashlib
+import argparse
+import tempfile
+from common import setup_django, write_report
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument('--rows', type=int, default=2000)
+parser.add_argument('--output', default=None)
+args = parser.parse_args()
+
+work_dir = tempfile.mkdtemp(prefix='ocr_bench_delete_')
+setup_django(os.path.join(work_dir, 'db.sqlite3'), work_dir)
+
+from django.db import transaction
+from ocr.models import OCRedFile, OCRedHash
+
+
+def fill(rows):
+    """
+    Creates rows OCRedFiles, their OCRedHashes, uploaded files and searchable PDFs
+    :param rows: the number of OCRedFiles
+    :return: None
+    """
+    os.makedirs(os.path.join(work_dir, 'upload'), exist_ok=True)
+    os.makedirs(os.path.join(work_dir, 'pdf'), exist_ok=True)
+    start = (OCRedFile.objects.order_by('-pk').values_list('pk', flat=True).first() or 0) + 1
+    ocred_files = []
+    hashes = []
+    for pk in range(start, start + rows):
+        md5_value = hashlib.md5('file{}'.format(pk).encode()).hexdigest()
+        for name in ('upload/{}.png'.format(pk), 'pdf/{}.pdf'.format(md5_value)):
+            with open(os.path.join(work_dir, name), 'wb') as f:
+                f.write(b'0' * 1024)
+        ocred_files.append(OCRedFile(id=pk, md5=md5_value, file='upload/{}.png'.format(pk), file_type='image/png',
+                                     ocred_pdf='pdf/{}.pdf'.format(md5_value), ocred_pdf_md5=md5_value[::-1],
+                                     text='bench'))
+        hashes.append(OCRedHash(md5=md5_value, kind=OCRedHash.KIND_FILE, ocred_file_id=pk))
+    with transaction.atomic():
+        OCRedFile.objects.bulk_create(ocred_files)
+        OCRedHash.objects.bulk_create(hashes)
+
+
+def delete_each():
+    for ocred_file in OCRedFile.objects.all():
+        ocred_file.delete()
+
+
+def main():
+    results = {}
+    for name, func in (('before', delete_each), ('after', OCRedFile.bulk_delete)):
+        fill(args.rows)
+        started = time.monotonic()
+        func()
+        seconds = time.monotonic() - started
+        results[name] = {'seconds': seconds, 'rows_per_second': args.rows / seconds if seconds else None}
+    results['speedup'] = results['before']['seconds'] / results['after']['seconds']
+    write_report({'benchmark': 'bulk_delete', 'rows': args.rows, 'results': results}, args.output)
+
+
+if __name__ == '__main__':
+    main()
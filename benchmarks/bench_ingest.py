@@ -0,0 +1,243 @@
+"""
+benchmarks/bench_ingest.py
+Measures the ingest throughput of OCR Server on the synthetic corpus of benchmarks/corpus.py:
+  save - a document is stored by OCRedFile.save like the admin stores it
+  upload - a document is posted to the upload/ API view by an authenticated client, OCR is synchronous
+Each mode runs in a new process with a scratch SQLite database and MEDIA_ROOT, so peak RSS of a mode
+is not affected by other modes. The corpus is ingested --repeat times, OCRedFiles are removed between rounds.
+The report has for each mode, in total and by the kind of documents:
+  docs_per_second, pages_per_second - documents and pages divided by the sum of latencies
+  latency_p50, latency_p99 - seconds of a document (nearest rank)
+  peak_rss_bytes - the peak RSS of the process of the mode,
+  peak_child_rss_bytes - the peak RSS of the largest subprocess (tesseract, ocrmypdf)
+  stages - percentiles of stages of OCRedFile.stage_timings
+With --baseline the report is compared with a saved report: a throughput lower or a latency or peak RSS higher
+by more than --tolerance is a regression, the benchmark exits with the code 1 if there are regressions.
+usage: python benchmarks/bench_ingest.py [--modes save upload] [--corpus /tmp/ocr_bench_corpus] [--dpi 150 300]
+                                         [--pages 1 4] [--seed 1] [--kinds text_pdf png ...] [--repeat 1]
+                                         [--baseline baseline.json] [--tolerance 0.1] [--output result.json]
+"""
+__author__ = 'shmakovpn <shmakovpn@yandex.ru>'
+__date__ = '2026-10-18'
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import multiprocessing
+from io import BytesIO
+from common import setup_django, write_report
+from corpus import KINDS, make_corpus
+
+MODES = ('save', 'upload')
+# metrics compared with the baseline: (name, True if a higher value is better)
+COMPARED = (('docs_per_second', True), ('pages_per_second', True), ('latency_p50', False), ('latency_p99', False),
+            ('peak_rss_bytes', False))
+
+
+def ingest_save(document, content):
+    """
+    Stores the document by OCRedFile.save
+    :param document: a document of the manifest
+    :param content: the content of the document
+    :return: None
+    """
+    from ocr.models import OCRedFile
+    ocred_file = OCRedFile(file_type=document['content_type'])
+    ocred_file.file.save(name=document['name'], content=BytesIO(content), save=False)
+    ocred_file.save()
+
+
+def ingest_upload(client, document, content):
+    """
+    Posts the document to the upload/ API view
+    :param client: an authenticated APIClient
+    :param document: a document of the manifest
+    :param content: the content of the document
+    :return: None
+    """
+    from django.urls import reverse
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    response = client.post(reverse('ocr:upload'),
+                           {'file': SimpleUploadedFile(document['name'], content, document['content_type'])},
+                           format='multipart')
+    if response.status_code != 201:
+        raise RuntimeError('upload/ returned {} for {}'.format(response.status_code, document['name']))
+
+
+def summarize(rows):
+    """
+    Returns throughput and latencies of ingested documents
+    :param rows: a list of (document, seconds)
+    :return: a dict {'docs', 'pages', 'bytes', 'seconds', 'docs_per_second', 'pages_per_second',
+        'latency_p50', 'latency_p99', 'latency_max'}
+    """
+    from ocr.stages import percentile
+    latencies = sorted(seconds for document, seconds in rows)
+    seconds = sum(latencies)
+    pages = sum(document['pages'] for document, _ in rows)
+    return {
+        'docs': len(rows),
+        'pages': pages,
+        'bytes': sum(document['bytes'] for document, _ in rows),
+        'seconds': seconds,
+        'docs_per_second': len(rows) / seconds if seconds else None,
+        'pages_per_second': pages / seconds if seconds else None,
+        'latency_p50': percentile(latencies, 50),
+        'latency_p99': percentile(latencies, 99),
+        'latency_max': latencies[-1] if latencies else None,
+    }
+
+
+def run_mode(queue, mode, corpus, documents, repeat):
+    """
+    Ingests documents repeat times in the mode, it runs in a new process
+    :param queue: the queue of the result
+    :param mode: 'save' or 'upload'
+    :param corpus: the folder of the corpus
+    :param documents: documents of the manifest
+    :param repeat: the number of rounds
+    :return: None, the result of the mode is put to the queue
+    """
+    scratch = tempfile.mkdtemp(prefix='ocr_bench_ingest_')
+    try:
+        setup_django(os.path.join(scratch, 'db.sqlite3'), os.path.join(scratch, 'media'))
+        from django.conf import settings
+        from django.test.utils import setup_test_environment
+        from django.contrib.auth.models import User
+        from rest_framework.test import APIClient
+        from ocr.models import OCRedFile
+        settings.OCR_ASYNC = False  # upload/ OCRs the file instead of queuing it
+        setup_test_environment()  # the test client is allowed as 'testserver'
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('bench'))
+        contents = {}
+        for document in documents:
+            with open(os.path.join(corpus, document['name']), 'rb') as f:
+                contents[document['name']] = f.read()
+        rows = []
+        stages = []
+        for round_number in range(repeat):
+            for document in documents:
+                content = contents[document['name']]
+                started = time.perf_counter()
+                if mode == 'save':
+                    ingest_save(document, content)
+                else:
+                    ingest_upload(client, document, content)
+                rows.append((document, time.perf_counter() - started))
+                print('{} {} {:.3f}s'.format(mode, document['name'], rows[-1][1]))
+            if round_number == repeat - 1:
+                stages = OCRedFile.stage_stats(percents=(50, 99))
+            OCRedFile.bulk_delete()  # the next round ingests the same documents again
+        by_kind = {}
+        for row in rows:
+            by_kind.setdefault(row[0]['kind'], []).append(row)
+        result = {
+            'total': summarize(rows),
+            'kinds': {kind: summarize(kind_rows) for kind, kind_rows in sorted(by_kind.items())},
+            'peak_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            'peak_child_rss_bytes': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024,
+            'stages': stages,
+        }
+        result['total']['peak_rss_bytes'] = result['peak_rss_bytes']
+        queue.put(result)
+    except Exception as e:
+        queue.put({'error': '{}: {}'.format(type(e).__name__, e)})
+        raise
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def run_isolated(mode, corpus, documents, repeat):
+    """
+    Runs the mode in a new process
+    :param mode: 'save' or 'upload'
+    :param corpus: the folder of the corpus
+    :param documents: documents of the manifest
+    :param repeat: the number of rounds
+    :return: the result of run_mode
+    """
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=run_mode, args=(queue, mode, corpus, documents, repeat))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compares results of modes with results of the baseline report
+    :param results: {mode: result of run_mode}
+    :param baseline: a saved report of the benchmark
+    :param tolerance: a relative change which is not a regression, e.g. 0.1
+    :return: a list of dicts {'mode', 'kind', 'metric', 'baseline', 'current', 'change', 'regression'},
+        change is relative, a positive change is an improvement
+    """
+    comparison = []
+    for mode, result in sorted(results.items()):
+        previous = baseline.get('results', {}).get(mode)
+        if not previous or 'error' in result or 'error' in previous:
+            continue
+        groups = [('total', result['total'], previous['total'])]
+        groups += [(kind, stats, previous['kinds'][kind]) for kind, stats in sorted(result['kinds'].items())
+                   if kind in previous.get('kinds', {})]
+        for kind, current, old in groups:
+            for metric, higher_is_better in COMPARED:
+                if not current.get(metric) or not old.get(metric):
+                    continue
+                if higher_is_better:
+                    change = (current[metric] - old[metric]) / old[metric]
+                else:
+                    change = (old[metric] - current[metric]) / old[metric]
+                comparison.append({'mode': mode, 'kind': kind, 'metric': metric, 'baseline': old[metric],
+                                   'current': current[metric], 'change': change, 'regression': change < -tolerance})
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=MODES)
+    parser.add_argument('--corpus', default=os.path.join('/tmp', 'ocr_bench_corpus'))
+    parser.add_argument('--dpi', type=int, nargs='+', default=[150, 300])
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--kinds', nargs='+', default=list(KINDS), choices=KINDS)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--baseline', default=None)
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+    manifest = make_corpus(args.corpus, args.dpi, args.pages, args.seed)
+    documents = [document for document in manifest['documents'] if document['kind'] in args.kinds]
+    results = {mode: run_isolated(mode, args.corpus, documents, args.repeat) for mode in args.modes}
+    report = {
+        'benchmark': 'ingest',
+        'corpus': dict(manifest['params'], kinds=args.kinds, documents=len(documents)),
+        'repeat': args.repeat,
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpus': os.cpu_count()},
+        'results': results,
+    }
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        report['baseline'] = {'path': args.baseline, 'tolerance': args.tolerance,
+                              'same_corpus': baseline.get('corpus') == report['corpus']}
+        report['comparison'] = compare(results, baseline, args.tolerance)
+        regressions = [row for row in report['comparison'] if row['regression']]
+    write_report(report, args.output)
+    if regressions or any('error' in result for result in results.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+benchmarks/bench_md5_lookup.py
+Compares md5 lookups before and after the OCRedHash index on a table of many OCRedFiles:
+  before - the dedup check runs two exists() queries, the second one scans the table
+           because ocred_pdf_md5 is not indexed, lookups by md5 or ocred_pdf_md5 use Q(md5) | Q(ocred_pdf_md5)
+  after - the dedup check and lookups are one query of the unique index of OCRedHash
+The table is filled in a scratch SQLite database which is kept between runs.
+usage: python benchmarks/bench_md5_lookup.py [--rows 1000000] [--lookups 200] [--database /tmp/ocr_bench.sqlite3]
+"""
+__author__ = 'shmakovpn <shmakovpn@yandex.ru>'
+__date__ = '2026-10-18'
+
+import os
+import sys
+import random
+import hashlib
+import argparse
+from common import setup_django, measure, write_report
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument('--rows', type=int, default=1000000)
+parser.add_argument('--lookups', type=int, default=200)
+parser.add_argument('--database', default=os.path.join('/tmp', 'ocr_bench_md5.sqlite3'))
+parser.add_argument('--output', default=None)
+args = parser.parse_args()
+
+setup_django(args.database)
+
+from django.db import transaction
+from django.db.models import Q
+from ocr.models import OCRedFile, OCRedHash
+
+
+def fake_md5(value):
+    return hashlib.md5(value.encode()).hexdigest()
+
+
+def fill(rows, batch_size=10000):
+    """
+    Adds OCRedFiles and their OCRedHashes up to rows, each OCRedFile has md5 and ocred_pdf_md5
+    :param rows: the number of OCRedFiles
+    :param batch_size: the number of OCRedFiles inserted in one transaction
+    :return: None
+    """
+    start = OCRedFile.objects.count()
+    for first in range(start, rows, batch_size):
+        ids = range(first + 1, min(first + batch_size, rows) + 1)
+        with transaction.atomic():
+            OCRedFile.objects.bulk_create([
+                OCRedFile(id=pk, md5=fake_md5('file{}'.format(pk)), ocred_pdf_md5=fake_md5('pdf{}'.format(pk)),
+                          file='bench', file_type='application/pdf', text='')
+                for pk in ids])
+            OCRedHash.objects.bulk_create(
+                [OCRedHash(md5=fake_md5('file{}'.format(pk)), kind=OCRedHash.KIND_FILE, ocred_file_id=pk)
+                 for pk in ids] +
+                [OCRedHash(md5=fake_md5('pdf{}'.format(pk)), kind=OCRedHash.KIND_PDF, ocred_file_id=pk)
+                 for pk in ids])
+        sys.stderr.write('{} rows\r'.format(ids[-1]))
+
+
+def check_before(hashes):
+    for md5_value in hashes:
+        OCRedFile.objects.filter(md5=md5_value).exists() or OCRedFile.objects.filter(ocred_pdf_md5=md5_value).exists()
+
+
+def check_after(hashes):
+    for md5_value in hashes:
+        OCRedFile.is_valid_ocr_md5(md5_value)
+
+
+def lookup_before(hashes):
+    for md5_value in hashes:
+        OCRedFile.objects.filter(Q(md5=md5_value) | Q(ocred_pdf_md5=md5_value)).first()
+
+
+def lookup_after(hashes):
+    for md5_value in hashes:
+        OCRedFile.objects.filter(hashes__md5=md5_value).first()
+
+
+def main():
+    fill(args.rows)
+    random.seed(0)
+    pks = [random.randint(1, args.rows) for _ in range(args.lookups)]
+    # a new upload (miss) and uploads of a known file or of a known searchable PDF (hits)
+    cases = {
+        'new': [fake_md5('new{}'.format(pk)) for pk in pks],
+        'file': [fake_md5('file{}'.format(pk)) for pk in pks],
+        'pdf': [fake_md5('pdf{}'.format(pk)) for pk in pks],
+    }
+    results = {}
+    for case, hashes in cases.items():
+        for name, func in (('check', (check_before, check_after)), ('lookup', (lookup_before, lookup_after))):
+            before = measure(func[0], (hashes, ))
+            after = measure(func[1], (hashes, ))
+            results['{}_{}'.format(name, case)] = {
+                'before_ms_per_lookup': before['seconds'] * 1000 / len(hashes),
+                'after_ms_per_lookup': after['seconds'] * 1000 / len(hashes),
+            }
+    write_report({'benchmark': 'md5_lookup', 'rows': args.rows, 'results': results}, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+benchmarks/bench_pdf_analysis.py
+Compares parsing of an uploaded PDF before and after the single-parse analysis stage:
+  before - pdf_info, pdf2pages and PyPDF2 (page count for splitting) parse the document separately
+  after - pdf_analyze parses the document once and returns metadata, page count, per-page text and statistics
+Large PDFs are made by repeating pages of the test files.
+usage: python benchmarks/bench_pdf_analysis.py [--pages 50 200 500] [--repeat 3] [--output result.json]
+"""
+__author__ = 'shmakovpn <shmakovpn@yandex.ru>'
+__date__ = '2026-10-18'
+
+import os
+import argparse
+from common import TESTS_DIR, setup_django, measure_isolated, write_report
+
+setup_django()
+
+from ocr.utils import read_binary_file, pdf_info, pdf2pages, get_pdf_reader, pdf_analyze, pdf_merge
+
+
+def separate_parses(content):
+    pdf_info(content)
+    pdf2pages(content)
+    get_pdf_reader(content).numPages
+
+
+def single_parse(content):
+    pdf_analyze(content)
+
+
+def make_pdf(num_pages):
+    """
+    Makes a PDF of num_pages pages alternating a page with text and a scanned page without text
+    :param num_pages: the number of pages
+    :return: a content of the pdf file as bytes
+    """
+    text_page = read_binary_file(os.path.join(TESTS_DIR, 'deming.pdf'))
+    scanned_page = read_binary_file(os.path.join(TESTS_DIR, 'test_eng_notext.pdf'))
+    return pdf_merge([text_page if page % 2 else scanned_page for page in range(num_pages)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, nargs='+', default=[50, 200, 500])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+    results = []
+    for num_pages in args.pages:
+        content = make_pdf(num_pages)
+        before = measure_isolated(separate_parses, (content, ), args.repeat)
+        after = measure_isolated(single_parse, (content, ), args.repeat)
+        results.append({
+            'pages': num_pages,
+            'bytes': len(content),
+            'before': before,
+            'after': after,
+            'speedup': before['seconds'] / after['seconds'] if after['seconds'] else None,
+        })
+    write_report({'benchmark': 'pdf_analysis', 'results': results}, args.output)
+
+
+if __name__ == '__main__':
+    main()
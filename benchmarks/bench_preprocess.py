@@ -0,0 +1,132 @@
+"""
+benchmarks/bench_preprocess.py
+Compares OCR of images by tesseract as they are uploaded and after the preprocessing stage:
+  seconds - the wall time of the preprocessing and tesseract for each image
+  accuracy - the similarity of the recognized text and the expected text (difflib ratio of normalized texts)
+  stages - seconds of each stage of the preprocessing
+The corpus is a folder of images, the expected text of an image is in the file of the same name with '.txt' extension.
+Without --corpus phone photo like images are made from test images of the ocr application:
+they are upscaled --scale times and put on an unevenly lit colored background.
+usage: python benchmarks/bench_preprocess.py [--corpus folder] [--scale 6] [--stages downscale grayscale ...]
+                                             [--repeat 1] [--output result.json]
+"""
+__author__ = 'shmakovpn <shmakovpn@yandex.ru>'
+__date__ = '2026-10-18'
+
+import os
+import re
+import time
+import difflib
+import argparse
+from io import BytesIO
+from common import TESTS_DIR, setup_django, write_report
+
+setup_django()
+
+from ocr.utils import read_binary_file, ocr_img2str
+from ocr.preprocess import preprocess_image, PREPROCESS_STAGES
+
+SAMPLES = {
+    'test_eng.png': 'A some english text to test Tesseract',
+    'test_rus.png': 'Проверяем tesseract',
+}
+
+
+def make_photo(content, scale):
+    """
+    Makes a large photo like image from the image: upscaled, colored and with the gradient of lighting
+    :param content: an image as bytes
+    :param scale: the scale of the image
+    :return: the JPEG image as bytes
+    """
+    from PIL import Image, ImageChops
+    image = Image.open(BytesIO(content)).convert('RGB')
+    image = image.resize((image.width * scale, image.height * scale), Image.LANCZOS)
+    photo = Image.new('RGB', (image.width + 100 * scale, image.height + 100 * scale), (235, 225, 205))
+    photo.paste(image, (50 * scale, 50 * scale))
+    lighting = Image.linear_gradient('L').resize(photo.size).point(lambda value: 255 - value // 3).convert('RGB')
+    photo = ImageChops.multiply(photo, lighting)
+    output = BytesIO()
+    photo.save(output, 'JPEG', quality=92)
+    return output.getvalue()
+
+
+def load_corpus(args):
+    """
+    Returns a list of (name, content, expected text) of images of the corpus
+    :param args: arguments of the benchmark
+    :return: a list of tuples
+    """
+    if not args.corpus:
+        return [(name, make_photo(read_binary_file(os.path.join(TESTS_DIR, name)), args.scale), text)
+                for name, text in SAMPLES.items()]
+    corpus = []
+    for name in sorted(os.listdir(args.corpus)):
+        base, extension = os.path.splitext(name)
+        expected = os.path.join(args.corpus, base + '.txt')
+        if extension.lower() == '.txt' or not os.path.isfile(expected):
+            continue
+        with open(expected, encoding='utf-8') as f:
+            corpus.append((name, read_binary_file(os.path.join(args.corpus, name)), f.read()))
+    return corpus
+
+
+def accuracy(text, expected):
+    """
+    Returns the similarity of the recognized text and the expected text from 0 to 1
+    :param text: the recognized text
+    :param expected: the expected text
+    :return: float
+    """
+    def normalize(value):
+        return re.sub(r'\s+', ' ', value).strip().lower()
+    return difflib.SequenceMatcher(None, normalize(text), normalize(expected)).ratio()
+
+
+def ocr(content, stages, repeat):
+    """
+    Recognizes the image repeat times, the image is preprocessed if stages is not None
+    :param content: an image as bytes
+    :param stages: stages of the preprocessing or None
+    :param repeat: the number of runs
+    :return: the best result {'seconds', 'text', 'bytes', 'stages'}
+    """
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        timings = {}
+        image = content
+        if stages is not None:
+            image, timings = preprocess_image(content, stages)
+        text = ocr_img2str(image)
+        result = {'seconds': time.perf_counter() - started, 'text': text, 'bytes': len(image), 'stages': timings}
+        if best is None or result['seconds'] < best['seconds']:
+            best = result
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', default=None)
+    parser.add_argument('--scale', type=int, default=6)
+    parser.add_argument('--stages', nargs='*', default=list(PREPROCESS_STAGES), choices=PREPROCESS_STAGES)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+    results = []
+    for name, content, expected in load_corpus(args):
+        before = ocr(content, None, args.repeat)
+        after = ocr(content, args.stages, args.repeat)
+        results.append({
+            'image': name,
+            'bytes': len(content),
+            'before': {'seconds': before['seconds'], 'accuracy': accuracy(before['text'], expected)},
+            'after': {'seconds': after['seconds'], 'accuracy': accuracy(after['text'], expected),
+                      'bytes': after['bytes'], 'stages': after['stages']},
+            'speedup': before['seconds'] / after['seconds'] if after['seconds'] else None,
+        })
+    write_report({'benchmark': 'preprocess', 'stages': args.stages, 'results': results}, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+benchmarks/bench_text_compression.py
+Compares storing of OCRedFile.text as is and compressed by zlib and zstd (if the zstandard package is installed):
+  db_bytes - the size of the scratch SQLite database after VACUUM
+  text_bytes - the size of stored values of OCRedFile.text
+  rows_per_second - the throughput of inserting OCRedFiles by bulk_create
+  read_seconds - the mean latency of reading the text of a random OCRedFile by md5
+Texts are generated from a fixed vocabulary, --pages pages of about 2 KB for each OCRedFile.
+usage: python benchmarks/bench_text_compression.py [--rows 2000] [--pages 4] [--reads 500] [--output result.json]
+"""
+__author__ = 'shmakovpn <shmakovpn@yandex.ru>'
+__date__ = '2026-10-18'
+
+import os
+import time
+import random
+import hashlib
+import argparse
+import tempfile
+from common import setup_django, write_report
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument('--rows', type=int, default=2000)
+parser.add_argument('--pages', type=int, default=4)
+parser.add_argument('--reads', type=int, default=500)
+parser.add_argument('--output', default=None)
+args = parser.parse_args()
+
+work_dir = tempfile.mkdtemp(prefix='ocr_bench_text_')
+database = os.path.join(work_dir, 'db.sqlite3')
+setup_django(database, work_dir)
+
+from django.conf import settings
+from django.db import connection, transaction
+from ocr.models import OCRedFile
+from ocr.fields import zstandard
+
+WORDS = ('the', 'of', 'and', 'agreement', 'invoice', 'total', 'amount', 'payment', 'date', 'company',
+         'contract', 'section', 'shall', 'party', 'services', 'period', 'number', 'address', 'signature',
+         'quality', 'management', 'system', 'process', 'customer', 'delivery', 'price', 'tax', 'account')
+
+
+def make_text(rnd, pages):
+    """
+    Returns a text of pages separated by the form feed like a text OCRed by tesseract
+    :param rnd: random.Random
+    :param pages: the number of pages
+    :return: the text
+    """
+    return '\f'.join(
+        '\n'.join(' '.join(rnd.choice(WORDS) for _ in range(12)) + ' {}'.format(rnd.randint(1, 99999))
+                  for _ in range(30))
+        for _ in range(pages))
+
+
+def run(algorithm):
+    """
+    Fills the emptied database by OCRedFiles with texts compressed by the algorithm and measures it
+    :param algorithm: '' - no compression, 'zlib' or 'zstd'
+    :return: a dict of results
+    """
+    settings.OCR_TEXT_COMPRESSION = algorithm
+    OCRedFile.objects.all().delete()
+    with connection.cursor() as cursor:
+        cursor.execute('VACUUM')
+    rnd = random.Random(0)
+    md5s = [hashlib.md5('file{}'.format(pk).encode()).hexdigest() for pk in range(args.rows)]
+    ocred_files = [OCRedFile(md5=md5_value, file_type='image/png', text=make_text(rnd, args.pages))
+                   for md5_value in md5s]
+    started = time.perf_counter()
+    with transaction.atomic():
+        OCRedFile.objects.bulk_create(ocred_files, batch_size=500)
+    insert_seconds = time.perf_counter() - started
+    with connection.cursor() as cursor:
+        cursor.execute('VACUUM')
+        cursor.execute('SELECT SUM(LENGTH(CAST(text AS BLOB))) FROM ocr_ocredfile')
+        text_bytes = cursor.fetchone()[0]
+    started = time.perf_counter()
+    for md5_value in rnd.sample(md5s, min(args.reads, len(md5s))):
+        len(OCRedFile.objects.only('text').get(md5=md5_value).text)
+    read_seconds = (time.perf_counter() - started) / min(args.reads, len(md5s))
+    return {
+        'db_bytes': os.path.getsize(database),
+        'text_bytes': text_bytes,
+        'rows_per_second': args.rows / insert_seconds,
+        'read_seconds': read_seconds,
+    }
+
+
+def main():
+    results = {}
+    for algorithm in ('', 'zlib', 'zstd'):
+        if algorithm == 'zstd' and zstandard is None:
+            continue
+        results[algorithm or 'plain'] = run(algorithm)
+    for name, result in results.items():
+        result['ratio'] = results['plain']['text_bytes'] / result['text_bytes']
+    write_report({'benchmark': 'text_compression', 'rows': args.rows, 'pages': args.pages, 'results': results},
+                 args.output)
+
+
+if __name__ == '__main__':
+    main()
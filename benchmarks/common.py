@@ -0,0 +1,100 @@
+"""
+benchmarks/common.py
+This file contains helpers shared by benchmarks of OCR Server
+"""
+__author__ = 'shmakovpn <shmakovpn@yandex.ru>'
+__date__ = '2026-10-18'
+
+import os
+import sys
+import json
+import time
+import resource
+import tracemalloc
+import multiprocessing
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # directory of the ocr_server project
+TESTS_DIR = os.path.join(BASE_DIR, 'ocr', 'tests')  # directory of test files of the ocr application
+
+
+def setup_django(database=None, media_root=None):
+    """
+    Makes the ocr_server project importable and sets Django up
+    :param database: a path of an SQLite database used instead of the database of the project,
+        tables are created in it if they do not exist
+    :param media_root: a directory used instead of MEDIA_ROOT of the project
+    :return: None
+    """
+    if BASE_DIR not in sys.path:
+        sys.path.insert(0, BASE_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ocr_server.settings')
+    import django
+    from django.conf import settings
+    if database:
+        settings.DATABASES['default'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': database}
+    if media_root:
+        settings.MEDIA_ROOT = media_root
+    django.setup()
+    if database:
+        from django.core.management import call_command
+        call_command('migrate', run_syncdb=True, verbosity=0)
+
+
+def measure(func, args=(), repeat=1):
+    """
+    Runs func(*args) repeat times, then runs it once more tracing python memory allocations
+    :param func: a function to measure
+    :param args: arguments of the function
+    :param repeat: the number of timed runs
+    :return: {'seconds': the best wall time, 'mean_seconds': the mean wall time,
+              'peak_python_bytes': the peak of memory allocated by python while the function runs}
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'seconds': min(times), 'mean_seconds': sum(times) / len(times), 'peak_python_bytes': peak}
+
+
+def _measure_child(queue, func, args, repeat):
+    result = measure(func, args, repeat)
+    result['peak_rss_bytes'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    queue.put(result)
+
+
+def measure_isolated(func, args=(), repeat=1):
+    """
+    Measures func(*args) in a new process, so peak RSS includes memory allocated by C extensions
+    and it is not affected by previous measurements.
+    func must be defined at the module level of the benchmark.
+    :param func: a function to measure
+    :param args: arguments of the function
+    :param repeat: the number of timed runs
+    :return: the result of measure with 'peak_rss_bytes'
+    """
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_measure_child, args=(queue, func, args, repeat))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def write_report(report, output=None):
+    """
+    Prints the report as JSON and writes it to the output file if it is not None
+    :param report: a dict
+    :param output: a path of a JSON file
+    :return: None
+    """
+    text = json.dumps(report, indent=2, sort_keys=True)
+    print(text)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
@@ -0,0 +1,223 @@
+"""
+benchmarks/corpus.py
+Generates a reproducible synthetic corpus of uploads for benchmarks of OCR Server:
+  text_pdf - a PDF with a text layer on every page
+  scan_pdf - a PDF of scanned pages without text, every page is an image of text
+  mixed_pdf - a PDF alternating a page with text and a scanned page
+  png, jpeg - a scanned page
+  tiff - a multi-page TIFF of scanned pages
+Scanned pages are A4 images of text rendered at each of --dpi, documents have each of --pages
+(PNG and JPEG have one page, a mixed PDF has at least two pages).
+Documents are made by reportlab and Pillow from words chosen by a generator seeded with --seed and the name
+of the document, so the same parameters make the same files. The corpus is written to --folder
+with manifest.json describing documents, an existing corpus made with the same parameters is reused.
+usage: python benchmarks/corpus.py [--folder /tmp/ocr_bench_corpus] [--dpi 150 300] [--pages 1 4] [--seed 1]
+"""
+__author__ = 'shmakovpn <shmakovpn@yandex.ru>'
+__date__ = '2026-10-18'
+
+import os
+import json
+import random
+import hashlib
+import argparse
+from io import BytesIO
+
+KINDS = ('text_pdf', 'scan_pdf', 'mixed_pdf', 'png', 'jpeg', 'tiff')
+CONTENT_TYPES = {'pdf': 'application/pdf', 'png': 'image/png', 'jpg': 'image/jpeg', 'tif': 'image/tiff'}
+WORDS = (
+    'the', 'server', 'recognizes', 'text', 'of', 'scanned', 'documents', 'and', 'images', 'every', 'page',
+    'is', 'stored', 'with', 'its', 'searchable', 'copy', 'report', 'invoice', 'contract', 'number', 'date',
+    'amount', 'total', 'payment', 'delivery', 'customer', 'address', 'office', 'quality', 'management',
+    'process', 'system', 'result', 'table', 'chapter', 'section', 'figure', 'summary', 'annual', 'meeting',
+    'agreement', 'between', 'parties', 'shall', 'within', 'days', 'after', 'receipt', 'written', 'notice',
+)
+FONTS = ('DejaVuSans.ttf', 'LiberationSans-Regular.ttf', 'FreeSans.ttf', 'Arial.ttf')
+A4_INCHES = (8.27, 11.69)
+LINES_PER_PAGE = 40
+WORDS_PER_LINE = 10
+FONT_POINTS = 12
+
+
+def page_lines(rnd):
+    """
+    Returns lines of random words of a page
+    :param rnd: a random generator of the document
+    :return: a list of strings
+    """
+    return [' '.join(rnd.choice(WORDS) for _ in range(WORDS_PER_LINE)).capitalize()
+            for _ in range(LINES_PER_PAGE)]
+
+
+def load_font(size):
+    """
+    Returns a TrueType font of the size in pixels, the default bitmap font if none of FONTS is found
+    :param size: pixels
+    :return: PIL.ImageFont
+    """
+    from PIL import ImageFont
+    for name in FONTS:
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    print('corpus: none of {} is found, scanned pages use the bitmap font'.format(', '.join(FONTS)))
+    return ImageFont.load_default()
+
+
+def scan_page(lines, dpi):
+    """
+    Renders lines as a grayscale A4 page scanned at dpi
+    :param lines: lines of text
+    :param dpi: dots per inch
+    :return: PIL.Image
+    """
+    from PIL import Image, ImageDraw
+    width, height = int(A4_INCHES[0] * dpi), int(A4_INCHES[1] * dpi)
+    image = Image.new('L', (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    font = load_font(FONT_POINTS * dpi // 72)
+    line_height = FONT_POINTS * dpi * 3 // 144  # 1.5 lines
+    for index, line in enumerate(lines):
+        draw.text((dpi, dpi + index * line_height), line, fill=0, font=font)
+    return image
+
+
+def make_pdf(rnd, pages, dpi, scanned):
+    """
+    Makes a PDF of A4 pages
+    :param rnd: a random generator of the document
+    :param pages: the number of pages
+    :param dpi: dots per inch of scanned pages
+    :param scanned: a function returning True if the page with the index is scanned
+    :return: the PDF as bytes
+    """
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.utils import ImageReader
+    output = BytesIO()
+    pdf = canvas.Canvas(output, pagesize=A4, invariant=1)  # invariant - no timestamps, the same bytes every time
+    for page in range(pages):
+        lines = page_lines(rnd)
+        if scanned(page):
+            pdf.drawImage(ImageReader(scan_page(lines, dpi)), 0, 0, width=A4[0], height=A4[1])
+        else:
+            pdf.setFont('Helvetica', FONT_POINTS)
+            for index, line in enumerate(lines):
+                pdf.drawString(72, A4[1] - 72 - index * FONT_POINTS * 1.5, line)
+        pdf.showPage()
+    pdf.save()
+    return output.getvalue()
+
+
+def make_image(rnd, pages, dpi, image_format):
+    """
+    Makes an image of scanned pages
+    :param rnd: a random generator of the document
+    :param pages: the number of pages, more than one page is saved as frames of a TIFF
+    :param dpi: dots per inch
+    :param image_format: 'PNG', 'JPEG' or 'TIFF'
+    :return: the image as bytes
+    """
+    images = [scan_page(page_lines(rnd), dpi) for _ in range(pages)]
+    output = BytesIO()
+    if image_format == 'TIFF':
+        images[0].save(output, 'TIFF', dpi=(dpi, dpi), compression='tiff_deflate', save_all=True,
+                       append_images=images[1:])
+    elif image_format == 'JPEG':
+        images[0].save(output, 'JPEG', dpi=(dpi, dpi), quality=85)
+    else:
+        images[0].save(output, image_format, dpi=(dpi, dpi))
+    return output.getvalue()
+
+
+def plan(dpis, page_counts):
+    """
+    Returns documents of the corpus
+    :param dpis: dots per inch of scanned pages
+    :param page_counts: numbers of pages of documents
+    :return: a list of dicts {'name', 'kind', 'pages', 'dpi'}, dpi of a text PDF is None
+    """
+    documents = []
+    for pages in page_counts:
+        documents.append({'name': 'text_pdf_{}p.pdf'.format(pages), 'kind': 'text_pdf', 'pages': pages, 'dpi': None})
+    for dpi in dpis:
+        for pages in page_counts:
+            documents.append({'name': 'scan_pdf_{}dpi_{}p.pdf'.format(dpi, pages), 'kind': 'scan_pdf',
+                              'pages': pages, 'dpi': dpi})
+            if pages > 1:
+                documents.append({'name': 'mixed_pdf_{}dpi_{}p.pdf'.format(dpi, pages), 'kind': 'mixed_pdf',
+                                  'pages': pages, 'dpi': dpi})
+            documents.append({'name': 'tiff_{}dpi_{}p.tif'.format(dpi, pages), 'kind': 'tiff',
+                              'pages': pages, 'dpi': dpi})
+        documents.append({'name': 'png_{}dpi_1p.png'.format(dpi), 'kind': 'png', 'pages': 1, 'dpi': dpi})
+        documents.append({'name': 'jpeg_{}dpi_1p.jpg'.format(dpi), 'kind': 'jpeg', 'pages': 1, 'dpi': dpi})
+    return documents
+
+
+def make_document(document, seed):
+    """
+    Makes the content of the document
+    :param document: a dict of plan()
+    :param seed: the seed of the corpus
+    :return: bytes
+    """
+    rnd = random.Random('{}:{}'.format(seed, document['name']))  # a string seed is the same in every process
+    kind, pages, dpi = document['kind'], document['pages'], document['dpi']
+    if kind == 'text_pdf':
+        return make_pdf(rnd, pages, dpi, lambda page: False)
+    if kind == 'scan_pdf':
+        return make_pdf(rnd, pages, dpi, lambda page: True)
+    if kind == 'mixed_pdf':
+        return make_pdf(rnd, pages, dpi, lambda page: page % 2 == 1)
+    return make_image(rnd, pages, dpi, {'png': 'PNG', 'jpeg': 'JPEG', 'tiff': 'TIFF'}[kind])
+
+
+def make_corpus(folder, dpis=(150, 300), page_counts=(1, 4), seed=1, regenerate=False):
+    """
+    Writes the corpus to the folder or reuses the corpus made with the same parameters
+    :param folder: the folder of the corpus
+    :param dpis: dots per inch of scanned pages
+    :param page_counts: numbers of pages of documents
+    :param seed: the seed of the random generator
+    :param regenerate: True - the corpus is written again even if it exists
+    :return: the manifest {'params', 'documents': [{'name', 'kind', 'content_type', 'pages', 'dpi', 'bytes', 'md5'}]}
+    """
+    params = {'dpi': sorted(dpis), 'pages': sorted(page_counts), 'seed': seed}
+    manifest_path = os.path.join(folder, 'manifest.json')
+    if not regenerate and os.path.isfile(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest['params'] == params and all(os.path.isfile(os.path.join(folder, document['name']))
+                                                for document in manifest['documents']):
+            return manifest
+    os.makedirs(folder, exist_ok=True)
+    documents = []
+    for document in plan(params['dpi'], params['pages']):
+        content = make_document(document, seed)
+        with open(os.path.join(folder, document['name']), 'wb') as f:
+            f.write(content)
+        document.update({'content_type': CONTENT_TYPES[document['name'].rsplit('.', 1)[1]], 'bytes': len(content),
+                         'md5': hashlib.md5(content).hexdigest()})
+        documents.append(document)
+        print('corpus: {} {} bytes'.format(document['name'], len(content)))
+    manifest = {'params': params, 'documents': documents}
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--folder', default=os.path.join('/tmp', 'ocr_bench_corpus'))
+    parser.add_argument('--dpi', type=int, nargs='+', default=[150, 300])
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--regenerate', action='store_true')
+    args = parser.parse_args()
+    manifest = make_corpus(args.folder, args.dpi, args.pages, args.seed, args.regenerate)
+    print(json.dumps(manifest, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,17 +2,17 @@ from django.core.exceptions import PermissionDenied
 from django.contrib import admin
 from django.contrib.admin.actions import delete_selected as delete_selected_
 from django.http import HttpResponseRedirect
-from django.utils.html import format_html
+from django.utils.html import format_html, format_html_join
 from django.urls import path, reverse
 from .forms import *
+from .stages import parse_stage_timings
 
 
 def delete_selected(modeladmin, request, queryset):
     if not modeladmin.has_delete_permission(request):
         raise PermissionDenied
     if request.POST.get('post'):
-        for obj in queryset:
-            obj.delete()
+        OCRedFile.bulk_delete(queryset)
     else:
         return delete_selected_(modeladmin, request, queryset)
 
@@ -130,7 +130,7 @@ class OCRedFileAdmin(admin.ModelAdmin):
         if not obj:
             return (
                 (None, {
-                    'fields': ('file', 'file_type',)
+                    'fields': ('file', 'file_type', 'lang', )
                 }),
             )
         return (
@@ -138,7 +138,7 @@ class OCRedFileAdmin(admin.ModelAdmin):
                 'fields': ('file', 'ocred_pdf',)
             }),
             (None, {
-                'fields': ('file_type', )
+                'fields': ('file_type', 'lang', )
             }),
             (None, {
                 'fields': (('md5', 'ocred_pdf_md5'), )
@@ -146,6 +146,9 @@ class OCRedFileAdmin(admin.ModelAdmin):
             (None, {
                 'fields': (('uploaded', 'ocred',), 'pdf_info', )
             }),
+            (None, {
+                'fields': ('stage_timings_table', )
+            }),
             (None, {
                 'fields': ('text', )
             })
@@ -161,7 +164,25 @@ class OCRedFileAdmin(admin.ModelAdmin):
         """
         if not obj:
             return ()
-        return ('uploaded', 'ocred', )
+        return ('uploaded', 'ocred', 'lang', 'stage_timings_table', )
+
+    def stage_timings_table(self, obj):
+        """
+        This function returns the table of stages of the processing of the file
+        :param obj: the current instance of the OCRedFile model
+        :return: html of the table: stage, wall seconds, CPU seconds, bytes, throughput
+        """
+        stages = parse_stage_timings(obj.stage_timings)
+        if not stages:
+            return '-'
+        rows = format_html_join(
+            '', '<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>',
+            ((name, '{:.3f}'.format(timing['wall']), '{:.3f}'.format(timing['cpu']), timing['bytes'],
+              '{:.2f}'.format(timing['bytes'] / timing['wall'] / 1024 / 1024) if timing['wall'] else '-')
+             for name, timing in stages.items()))
+        return format_html('<table><tr><th>stage</th><th>wall, s</th><th>CPU, s</th><th>bytes</th><th>MB/s</th></tr>'
+                           '{}</table>', rows)
+    stage_timings_table.short_description = 'Timings of stages'
 
     def process_file_remove(self, request, ocredfile_id, *args, **kwargs):
         try:
@@ -260,4 +281,19 @@ class OCRedFileAdmin(admin.ModelAdmin):
         return super(OCRedFileAdmin, self).delete_model(request, obj)
 
 
-admin.site.register(OCRedFile, OCRedFileAdmin)
\ No newline at end of file
+admin.site.register(OCRedFile, OCRedFileAdmin)
+
+
+class OCRJobAdmin(admin.ModelAdmin):
+    """
+    The ModelAdmin for the model OCRJob
+    """
+    list_display = ('id', 'md5', 'file_type', 'status', 'queued', 'started', 'finished', 'ocred_file')
+    list_filter = ('status', )
+    readonly_fields = ('md5', 'file', 'file_type', 'status', 'error', 'ocred_file', 'queued', 'started', 'finished')
+
+    def has_add_permission(self, request):
+        return False
+
+
+admin.site.register(OCRJob, OCRJobAdmin)
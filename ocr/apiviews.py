@@ -10,12 +10,22 @@ from rest_framework.views import APIView
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.parsers import FileUploadParser, MultiPartParser
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
 from django.contrib.auth import authenticate
-from django.db.models import Q
 from .models import *
 from .serializers import *
 from .exceptions import *
 from django.conf import settings
+from ocr import settings as ocr_default_settings
+from .cache import md5_cache
+from .fields import decompress_text
+from .supervisor import supervisor
+from .metrics import metrics
+from django.http import HttpResponse
+import time
+from .export import export_queryset, export_ndjson, export_watermark, parse_export_filters
+from django.http import StreamingHttpResponse
 
 
 class OcrApiView(APIView):
@@ -36,6 +46,7 @@ class UploadFile(OcrApiView):
     """
 
     parser_classes = (MultiPartParser,)
+    UPLOAD_RESULTS = {201: 'created', 200: 'duplicate', 202: 'queued'}  # results of uploads by status codes
 
     def post(self, request,):
         """
@@ -48,16 +59,31 @@ class UploadFile(OcrApiView):
         :param request: rest framework request
         :return: rest framework response
         """
+        started = time.perf_counter()
+        response = self.upload(request)
+        metrics.observe('ocr_stage_seconds', time.perf_counter() - started, stage='upload')
+        metrics.inc('ocr_uploads_total', result=self.UPLOAD_RESULTS.get(response.status_code, 'error'))
+        return response
+
+    def upload(self, request):
+        """
+        Uploads the 'file' to OCR Server, see post
+        :param request: rest framework request
+        :return: rest framework response
+        """
         if 'file' not in request.FILES:
             return Response({
                 'error': True,
                 'message': 'A file does not present',
             }, status=status.HTTP_400_BAD_REQUEST)
-        ocred_file_serializer = OCRedFileSerializer(data={'file': request.FILES['file']})
+        ocred_file_serializer = OCRedFileSerializer(data={
+            'file': request.FILES['file'],
+            'lang': request.data.get('lang', ''),  # languages of tesseract, 'auto' - languages of the detected script
+        })
         try:
             ocred_file_serializer.is_valid(raise_exception=True)
         except (Md5DuplicationError, Md5PdfDuplicationError) as e:
-            ocred_file = OCRedFile.objects.get(Q(md5=e.md5) | Q(ocred_pdf_md5=e.md5))
+            ocred_file = OCRedFile.objects.get(hashes__md5=e.md5)
             ocred_file_serializer = OCRedFileSerializer(ocred_file, many=False)
             data = ocred_file_serializer.data
             return Response({
@@ -73,7 +99,32 @@ class UploadFile(OcrApiView):
                 'message': e.message,
                 'file_type': e.file_type,
             }, status=status.HTTP_400_BAD_REQUEST)
-        ocred_file_serializer.save()
+        except LangError as e:
+            return Response({
+                'error': True,
+                'code': e.code,
+                'message': e.message,
+                'lang': e.lang,
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if getattr(settings, 'OCR_ASYNC', ocr_default_settings.ASYNC):
+            # the file will be OCRed by an ocr_worker process
+            job = OCRJob.enqueue(request.FILES['file'], ocred_file_serializer.md5,
+                                 ocred_file_serializer.validated_data.get('lang', ''))
+            return Response({
+                'error': False,
+                'created': False,
+                'queued': True,
+                'job': job.id,
+                'data': OCRJobSerializer(job).data,
+            }, status=status.HTTP_202_ACCEPTED)
+        try:
+            ocred_file_serializer.save()
+        except ProcessError as e:  # ProcessTimeoutError too
+            return Response({
+                'error': True,
+                'code': e.code,
+                'message': e.message,
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         data = ocred_file_serializer.data
         return Response({
             'error': False,
@@ -82,19 +133,103 @@ class UploadFile(OcrApiView):
         }, status=status.HTTP_201_CREATED)
 
 
+class JobStatus(OcrApiView):
+    """
+    Returns the status (queued/running/done/failed) and timestamps of the OCRJob, \
+    the result of OCR is included when the OCRJob is done
+    """
+    def get(self, request, job_id):
+        """
+        Returns the status (queued/running/done/failed) and timestamps of the OCRJob, \
+        the result of OCR is included when the OCRJob is done
+        :param request: rest framework request
+        :param job_id: the id of the OCRJob
+        :return: rest framework response
+        """
+        try:
+            job = OCRJob.objects.select_related('ocred_file').get(pk=job_id)
+        except OCRJob.DoesNotExist:
+            return Response({
+                'error': False,
+                'exists': False,
+            }, status=status.HTTP_204_NO_CONTENT)
+        response = {
+            'error': False,
+            'exists': True,
+            'data': OCRJobSerializer(job).data,
+        }
+        if job.status == OCRJob.STATUS_DONE and job.ocred_file:
+            response['result'] = OCRedFileSerializer(job.ocred_file).data
+        return Response(response, status=status.HTTP_200_OK)
+
+
 class OCRedFileList(OcrApiView):
     """
-    Returns list of OCRedFile instances in JSON format 2019-03-20
+    Returns list of OCRedFile instances in JSON format 2019-03-20.
+    OCRedFiles are ordered from the newest, pages are paginated by the 'cursor' query parameter,
+    the 'fields' query parameter is a comma separated list of returned fields, all fields except 'text' by default.
     """
+    # fields of OCRedFileSerializer returned by the api, 'file' and 'ocred_pdf' are removed by it
+    FIELDS = tuple(name for name in OCRedFileSerializer.Meta.fields if name not in ('file', 'ocred_pdf'))
+    DEFAULT_FIELDS = tuple(name for name in FIELDS if name != 'text')
+
     def get(self, request, ):
         """
         Returns a list of OCRedFile instances in JSON format 2019-03-24
         :param request: rest framework request
         :return: rest framework response
         """
-        ocred_files = OCRedFile.objects.all()[:20]
-        data = OCRedFileSerializer(ocred_files, many=True).data
-        return Response(data, status=status.HTTP_200_OK)
+        try:
+            limit = int(request.query_params.get('limit', api_settings.PAGE_SIZE or 10))
+        except ValueError:
+            return Response({
+                'error': True,
+                'message': "The 'limit' parameter must be a number",
+            }, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, getattr(settings, 'OCR_LIST_MAX_LIMIT', ocr_default_settings.LIST_MAX_LIMIT)))
+        fields = self.DEFAULT_FIELDS
+        if request.query_params.get('fields'):
+            fields = tuple(name.strip() for name in request.query_params['fields'].split(',') if name.strip())
+            wrong_fields = [name for name in fields if name not in self.FIELDS]
+            if wrong_fields:
+                return Response({
+                    'error': True,
+                    'message': "Wrong fields '{}', allowed fields are '{}'".format(
+                        ','.join(wrong_fields), ','.join(self.FIELDS)),
+                }, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            queryset = OCRedFile.listing(request.query_params.get('cursor'))
+        except CursorError as e:
+            return Response({
+                'error': True,
+                'code': e.code,
+                'message': e.message,
+            }, status=status.HTTP_400_BAD_REQUEST)
+        computed_fields = [name for name in fields if name in OCRedFileSerializer.COMPUTED_FIELDS]
+        db_fields = {'id', 'uploaded'}.union(name for name in fields if name not in computed_fields)
+        if computed_fields:
+            # properties of OCRedFile are needed, instances are serialized with only the needed columns
+            for name in computed_fields:
+                db_fields.update(OCRedFileSerializer.COMPUTED_FIELDS[name])
+            ocred_files = list(queryset.only(*db_fields)[:limit + 1])
+            last = ocred_files[limit - 1] if len(ocred_files) > limit else None
+            keys = (last.uploaded, last.pk) if last else None
+            data = OCRedFileSerializer(ocred_files[:limit], many=True, fields=fields).data
+        else:
+            # the lightweight path, rows are returned as dicts without instances of OCRedFile
+            rows = list(queryset.values(*db_fields)[:limit + 1])
+            last = rows[limit - 1] if len(rows) > limit else None
+            keys = (last['uploaded'], last['id']) if last else None
+            data = [{name: decompress_text(row[name]) if name == 'text' else row[name] for name in fields}
+                    for row in rows[:limit]]
+        next_url = None
+        if keys:
+            next_url = replace_query_param(request.build_absolute_uri(), 'cursor', OCRedFile.encode_cursor(*keys))
+        return Response({
+            'error': False,
+            'next': next_url,
+            'data': data,
+        }, status=status.HTTP_200_OK)
 
 
 class Md5(OcrApiView):
@@ -109,18 +244,190 @@ class Md5(OcrApiView):
         :param request: rest framework request
         :return: rest framework response
         """
+        data = md5_cache.get(md5)
+        if data is None:
+            try:
+                ocred_file = OCRedFile.objects.get(hashes__md5=md5)
+            except OCRedFile.DoesNotExist:
+                return Response({
+                    'error': False,
+                    'exists': False,
+                }, status=status.HTTP_204_NO_CONTENT)
+            data = dict(OCRedFileSerializer(ocred_file).data)
+            md5_cache.set(md5, data, len(data.get('text') or ''))
+        return Response({
+            'error': False,
+            'exists': True,
+            'data': data,
+        }, status=status.HTTP_200_OK)
+
+
+class Md5CacheStats(OcrApiView):
+    """
+    Returns counters of the cache of the <md5:md5>/ view of the process which handles the request
+    """
+    def get(self, request, ):
+        """
+        Returns counters of the cache of the <md5:md5>/ view of the process which handles the request
+        :param request: rest framework request
+        :return: rest framework response
+        """
+        return Response({
+            'error': False,
+            'data': md5_cache.stats(),
+        }, status=status.HTTP_200_OK)
+
+
+class SubprocessStats(OcrApiView):
+    """
+    Returns counters of subprocesses of tesseract and ocrmypdf of the process which handles the request
+    """
+    def get(self, request, ):
+        """
+        Returns counters of subprocesses of tesseract and ocrmypdf of the process which handles the request
+        :param request: rest framework request
+        :return: rest framework response
+        """
+        return Response({
+            'error': False,
+            'data': supervisor.stats(),
+        }, status=status.HTTP_200_OK)
+
+
+class Metrics(OcrApiView):
+    """
+    Returns metrics of all processes of OCR Server in the text format of Prometheus
+    """
+    def get(self, request, ):
+        """
+        Returns metrics of all processes of OCR Server in the text format of Prometheus
+        :param request: rest framework request
+        :return: http response
+        """
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class Md5Text(OcrApiView):
+    """
+    Returns texts of the requested pages of an already uploaded file, \
+    or message that a file with md5=md5 or ocred_pdf_md5=md5 not found. \
+    The 'page' query parameter is a number of the page or a range of pages like '2-5', the first page by default
+    """
+    def get(self, request, md5=md5):
+        """
+        Returns texts of the requested pages of an already uploaded file, \
+        or message that a file with md5=md5 or ocred_pdf_md5=md5 not found. \
+        The 'page' query parameter is a number of the page or a range of pages like '2-5', the first page by default
+        :param request: rest framework request
+        :return: rest framework response
+        """
+        pages = request.query_params.get('page', '1')
         try:
-            ocred_file = OCRedFile.objects.get(Q(md5=md5) | Q(ocred_pdf_md5=md5))
+            first, last = pages.split('-', 1) if '-' in pages else (pages, pages)
+            first, last = int(first), int(last)
+        except ValueError:
+            return Response({
+                'error': True,
+                'message': "The 'page' parameter '{}' is not a number or a range of pages".format(pages),
+            }, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            # the text is not loaded, only the requested pages are read from the database
+            ocred_file = OCRedFile.objects.defer('text').get(hashes__md5=md5)
         except OCRedFile.DoesNotExist:
             return Response({
                 'error': False,
                 'exists': False,
             }, status=status.HTTP_204_NO_CONTENT)
-        data = OCRedFileSerializer(ocred_file).data
+        try:
+            pages_text = ocred_file.get_text_pages(first, last)
+        except PageRangeError as e:
+            return Response({
+                'error': True,
+                'code': e.code,
+                'message': e.message,
+                'num_pages': e.num_pages,
+            }, status=status.HTTP_400_BAD_REQUEST)
         return Response({
             'error': False,
             'exists': True,
-            'data': data,
+            'md5': ocred_file.md5,
+            'num_pages': ocred_file.text_num_pages,
+            'pages': [{'page': page, 'text': page_text} for page, page_text in zip(range(first, last + 1), pages_text)],
+        }, status=status.HTTP_200_OK)
+
+
+class Export(OcrApiView):
+    """
+    Streams OCRedFiles as NDJSON, one JSON object per line. 'fields' is a comma separated list of exported fields,
+    'since', 'uploaded_from', 'uploaded_to', 'ocred_from', 'ocred_to' are ISO 8601 datetimes filtering rows.
+    The X-OCR-Watermark header is the 'since' of the next incremental export.
+    """
+    def get(self, request, ):
+        """
+        Streams OCRedFiles as NDJSON
+        :param request: rest framework request
+        :return: StreamingHttpResponse
+        """
+        watermark = export_watermark()
+        fields = None
+        if request.query_params.get('fields'):
+            fields = [name.strip() for name in request.query_params['fields'].split(',') if name.strip()]
+        try:
+            queryset = export_queryset(fields, **parse_export_filters(request.query_params))
+        except ValueError as e:
+            return Response({
+                'error': True,
+                'message': str(e),
+            }, status=status.HTTP_400_BAD_REQUEST)
+        response = StreamingHttpResponse(export_ndjson(queryset), content_type='application/x-ndjson')
+        response['X-OCR-Watermark'] = watermark.isoformat()
+        return response
+
+
+class Search(OcrApiView):
+    """
+    Searches pages of OCRedFiles which contain all words of the 'q' query parameter, \
+    returns md5, the number of the page, the score and the snippet with highlighted words for each found page, \
+    the best matches go first. 'limit' and 'offset' query parameters are used to paginate found pages
+    """
+    def get(self, request, ):
+        """
+        Searches pages of OCRedFiles which contain all words of the 'q' query parameter, \
+        returns md5, the number of the page, the score and the snippet with highlighted words for each found page, \
+        the best matches go first. 'limit' and 'offset' query parameters are used to paginate found pages
+        :param request: rest framework request
+        :return: rest framework response
+        """
+        query = request.query_params.get('q', '')
+        try:
+            limit = int(request.query_params.get('limit',
+                                                 getattr(settings, 'OCR_SEARCH_LIMIT',
+                                                         ocr_default_settings.SEARCH_LIMIT)))
+            offset = int(request.query_params.get('offset', 0))
+        except ValueError:
+            return Response({
+                'error': True,
+                'message': "The 'limit' and 'offset' parameters must be numbers",
+            }, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(0, min(limit, getattr(settings, 'OCR_SEARCH_MAX_LIMIT', ocr_default_settings.SEARCH_MAX_LIMIT)))
+        try:
+            results = OCRedFile.search(query, limit, max(0, offset))
+        except SearchQueryError as e:
+            return Response({
+                'error': True,
+                'code': e.code,
+                'message': e.message,
+            }, status=status.HTTP_400_BAD_REQUEST)
+        except SearchNotSupported as e:
+            return Response({
+                'error': True,
+                'code': e.CODE,
+                'message': e.message,
+            }, status=status.HTTP_501_NOT_IMPLEMENTED)
+        return Response({
+            'error': False,
+            'query': query,
+            'results': results,
         }, status=status.HTTP_200_OK)
 
 
@@ -138,7 +445,7 @@ class RemoveMd5(OcrApiView):
         :return: rest framework response
         """
         try:
-            ocred_file = OCRedFile.objects.get(Q(md5=md5) | Q(ocred_pdf_md5=md5))
+            ocred_file = OCRedFile.objects.get(hashes__md5=md5)
         except OCRedFile.DoesNotExist:
             return Response({
                 'error': False,
@@ -163,14 +470,13 @@ class RemoveAll(OcrApiView):
         :param request: rest framework request
         :return: rest framework response
         """
-        ocred_files = OCRedFile.objects.all()
-        num_ocred_files = ocred_files.count()
-        for ocred_file in ocred_files:
-            ocred_file.delete()
+        result = OCRedFile.bulk_delete()
         return Response({
             'error': False,
             'removed': True,
-            'count': num_ocred_files,
+            'count': result['count'],
+            'seconds': result['seconds'],
+            'rows_per_second': result['rows_per_second'],
         }, status=status.HTTP_200_OK)
 
 
@@ -186,7 +492,7 @@ class RemoveFileMd5(OcrApiView):
         :return: rest framework response
         """
         try:
-            ocred_file = OCRedFile.objects.get(Q(md5=md5) | Q(ocred_pdf_md5=md5))
+            ocred_file = OCRedFile.objects.get(hashes__md5=md5)
         except OCRedFile.DoesNotExist:
             return Response({
                 'error': False,
@@ -218,14 +524,14 @@ class RemoveFileAll(OcrApiView):
         :param request: rest framework request
         :return: rest framework response
         """
-        old_counter = OCRedFile.Counters.num_removed_files
+        count = 0
         ocred_files = OCRedFile.objects.all()
         for ocred_file in ocred_files:
-            ocred_file.remove_file()
+            count += ocred_file.remove_file()
         return Response({
             'error': False,
             'removed': True,
-            'count': OCRedFile.Counters.num_removed_files-old_counter,
+            'count': count,
         }, status=status.HTTP_200_OK)
 
 
@@ -241,7 +547,7 @@ class RemovePdfMd5(OcrApiView):
         :return: rest framework response
         """
         try:
-            ocred_file = OCRedFile.objects.get(Q(md5=md5) | Q(ocred_pdf_md5=md5))
+            ocred_file = OCRedFile.objects.get(hashes__md5=md5)
         except OCRedFile.DoesNotExist:
             return Response({
                 'error': False,
@@ -273,14 +579,14 @@ class RemovePdfAll(OcrApiView):
         :param request: rest framework request
         :return: rest framework response
         """
-        old_counter = OCRedFile.Counters.num_removed_pdf
+        count = 0
         ocred_files = OCRedFile.objects.all()
         for ocred_file in ocred_files:
-            ocred_file.remove_pdf()
+            count += ocred_file.remove_pdf()
         return Response({
             'error': False,
             'removed': True,
-            'count': OCRedFile.Counters.num_removed_pdf - old_counter,
+            'count': count,
         }, status=status.HTTP_200_OK)
 
 
@@ -296,7 +602,7 @@ class CreatePdfMd5(OcrApiView):
         :return: rest framework response
         """
         try:
-            ocred_file = OCRedFile.objects.get(Q(md5=md5) | Q(ocred_pdf_md5=md5))
+            ocred_file = OCRedFile.objects.get(hashes__md5=md5)
         except OCRedFile.DoesNotExist:
             return Response({
                 'error': False,
@@ -328,14 +634,14 @@ class CreatePdfAll(OcrApiView):
         :param request: rest framework request
         :return: rest framework response
         """
-        old_counter = OCRedFile.Counters.num_created_pdf
+        count = 0
         ocred_files = OCRedFile.objects.all()
         for ocred_file in ocred_files:
-            ocred_file.create_pdf()
+            count += ocred_file.create_pdf()
         return Response({
             'error': False,
             'created': True,
-            'count': OCRedFile.Counters.num_created_pdf - old_counter,
+            'count': count,
         }, status=status.HTTP_200_OK)
 
 
@@ -345,16 +651,20 @@ class Clean(OcrApiView):
     """
     def get(self, request, ):
         """
-        Removes 'files' and 'ocred_pdfs' that are not related with any the OCRedFile 2019-04-13
-        :param request: not used
+        Removes 'files' and 'ocred_pdfs' that are not related with any the OCRedFile 2019-04-13. \
+        With 'dry_run=1' files are only reported. The report of each folder contains counters \
+        and up to OCR_CLEAN_REPORT_LIMIT paths of removed files.
+        :param request: rest framework request
         :return: rest framework response
         """
-        removed_files, removed_pdfs = OCRedFile.cleanup()
+        dry_run = request.query_params.get('dry_run', '') in ('1', 'true', 'True')
+        reports = OCRedFile.cleanup(dry_run=dry_run)
         return Response({
-            'removed files': removed_files,
-            'removed files count': len(removed_files),
-            'removed ocred_pdf': removed_pdfs,
-            'remoced ocred_pdf count': len(removed_pdfs),
+            'error': False,
+            'dry_run': dry_run,
+            'removed files count': reports['files']['removed'],
+            'remoced ocred_pdf count': reports['pdf']['removed'],
+            'reports': reports,
         })
 
 
@@ -368,6 +678,7 @@ class Ttl(OcrApiView):
     Removes all OCRedFile.ocred_pdfs whose OCRedFile.uploaded+OCR_PDF_TTL lower current datetime
          if OCR_PDF_TTL does not 0,
          (NOTE: if OCR_PDF_TTL<0 all OCRedFile.ocred_pdfs will be removed, use only for tests). 2019-04-13
+    The sweep stops when OCR_TTL_TIME_BUDGET is spent, 'complete' is False then and the next request continues it.
     """
     def get(self, request, ):
         """
@@ -382,9 +693,32 @@ class Ttl(OcrApiView):
         :param request: not used
         :return: rest framework response
         """
-        counter, files_counter, pdf_counter = OCRedFile.ttl()
+        result = OCRedFile.ttl_sweep(
+            time_budget=getattr(settings, 'OCR_TTL_TIME_BUDGET', ocr_default_settings.TTL_TIME_BUDGET))
         return Response({
-            'removed': counter,
-            'files_removed': files_counter,
-            'pdf_removed': pdf_counter,
+            'removed': result['removed'],
+            'files_removed': result['files_removed'],
+            'pdf_removed': result['pdf_removed'],
+            'complete': result['complete'],
+            'lag': result['lag'],
         })
+
+
+class TtlStatus(OcrApiView):
+    """
+    Returns the progress of the current (or the last) sweep of the TTL sweeper: \
+    when it was started and finished, counters of removed OCRedFiles, files and searchable PDFs \
+    and the lag, seconds since the TTL of the oldest row which is still not processed was expired
+    """
+    def get(self, request, ):
+        """
+        Returns the progress of the current (or the last) sweep of the TTL sweeper: \
+        when it was started and finished, counters of removed OCRedFiles, files and searchable PDFs \
+        and the lag, seconds since the TTL of the oldest row which is still not processed was expired
+        :param request: not used
+        :return: rest framework response
+        """
+        return Response({
+            'error': False,
+            'data': TtlSweepSerializer(TtlSweep.get()).data,
+        }, status=status.HTTP_200_OK)
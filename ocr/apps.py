@@ -5,6 +5,7 @@ __author__ = 'shmakovpn <shmakovpn@yandex.ru>'
 __date__ = '2019-04-03'
 
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class OcrConfig(AppConfig):
@@ -13,3 +14,12 @@ class OcrConfig(AppConfig):
     """
     name = 'ocr'
     verbose_name = 'OCR Server'
+
+    def ready(self):
+        """
+        Connects the creation of the full-text search index to migrate, \
+        the index is an SQLite FTS5 virtual table that can not be described by a model
+        :return: None
+        """
+        from .search import post_migrate_create_search_index
+        post_migrate.connect(post_migrate_create_search_index, sender=self)
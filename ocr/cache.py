@@ -0,0 +1,125 @@
+"""
+ocr/cache.py
+This file contains the in-process LRU cache of serialized OCRedFiles returned by the <md5:md5>/ API view.
+Each process has its own cache, entries are invalidated by the process which changes an OCRedFile,
+so OCR_MD5_CACHE_TTL limits how long other processes may return a stale entry.
+An entry holds the whole OCRed text, so the cache is limited by OCR_MD5_CACHE_MAX_BYTES of texts too.
+"""
+__author__ = 'shmakovpn <shmakovpn@yandex.ru>'
+__date__ = '2026-10-18'
+
+import time
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from ocr import settings as ocr_default_settings
+
+
+class LRUCache:
+    """
+    A bounded thread safe LRU cache, entries expire after ttl seconds
+    """
+    def __init__(self, max_size, ttl, max_bytes=0):
+        """
+        LRUCache constructor
+        :param max_size: the maximum number of entries, 0 disables the cache
+        :param ttl: seconds after which an entry expires
+        :param max_bytes: the maximum sum of sizes of entries, 0 - unlimited
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key: (value, expiration time, size)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns the value of the key or None if it is not cached or it is expired
+        :param key:
+        :return: the cached value or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.monotonic():
+                del self._entries[key]
+                self.bytes -= entry[2]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, size=0):
+        """
+        Caches the value of the key, the least recently used entries are removed when the cache is full
+        :param key:
+        :param value:
+        :param size: the size of the value e.g. the length of the text of a serialized OCRedFile
+        :return: None
+        """
+        if self.max_size <= 0:
+            return
+        if self.max_bytes and size > self.max_bytes:
+            self.invalidate(key)  # the value is larger than the whole cache
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[2]
+            self._entries[key] = (value, time.monotonic() + self.ttl, size)
+            self.bytes += size
+            while len(self._entries) > self.max_size or (self.max_bytes and self.bytes > self.max_bytes):
+                self.bytes -= self._entries.popitem(last=False)[1][2]
+
+    def invalidate(self, *keys):
+        """
+        Removes entries of the keys, None keys are skipped
+        :param keys:
+        :return: None
+        """
+        with self._lock:
+            for key in keys:
+                if key is not None:
+                    entry = self._entries.pop(key, None)
+                    if entry is not None:
+                        self.bytes -= entry[2]
+
+    def clear(self):
+        """
+        Removes all entries and resets counters
+        :return: None
+        """
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Returns counters of the cache
+        :return: dict {'size', 'max_size', 'bytes', 'max_bytes', 'ttl', 'hits', 'misses', 'hit_ratio'}
+        """
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / requests if requests else None,
+            }
+
+
+# serialized OCRedFiles by md5 or ocred_pdf_md5
+md5_cache = LRUCache(getattr(settings, 'OCR_MD5_CACHE_SIZE', ocr_default_settings.MD5_CACHE_SIZE),
+                     getattr(settings, 'OCR_MD5_CACHE_TTL', ocr_default_settings.MD5_CACHE_TTL),
+                     getattr(settings, 'OCR_MD5_CACHE_MAX_BYTES', ocr_default_settings.MD5_CACHE_MAX_BYTES))
@@ -6,6 +6,7 @@ __author__ = 'shmakovpn <shmakovpn@yandex.ru>'
 __date__ = '2019-03-21'
 
 
+import signal
 from django.core.exceptions import ValidationError
 
 
@@ -67,3 +68,131 @@ class DoesNotSaved(ValueError):
             message="Try to use the instance of OCRedFile that does not saved",
             code=self.CODE
         )
+
+
+class PageRangeError(ValidationError):
+    """
+    The requested pages do not exist in the OCRed content
+    """
+    pages = None
+    CODE = 'wrong_page_range'
+
+    def __init__(self, pages, num_pages):
+        """
+        Creates PageRangeError exception
+        :param pages: the requested pages
+        :param num_pages: the number of pages of the OCRed content
+        """
+        self.pages = pages
+        self.num_pages = num_pages
+        super(PageRangeError, self).__init__(
+            message="The requested pages '{}' do not exist, the number of pages is {}".format(pages, num_pages),
+            code=self.CODE,
+        )
+
+
+class SearchNotSupported(NotImplementedError):
+    """
+    The full-text search index is disabled or it is not supported by the database backend
+    """
+    CODE = 'search_not_supported'
+    message = 'The full-text search is disabled or it is not supported by the database backend'
+
+
+class SearchQueryError(ValidationError):
+    """
+    The full-text search query is empty or it is wrong
+    """
+    query = None
+    CODE = 'wrong_search_query'
+
+    def __init__(self, query):
+        """
+        Creates SearchQueryError exception
+        :param query: the full-text search query
+        """
+        self.query = query
+        super(SearchQueryError, self).__init__(
+            message="The full-text search query '{}' is empty or it is wrong".format(query),
+            code=self.CODE,
+        )
+
+
+class LangError(ValidationError):
+    """
+    The requested languages of tesseract are not allowed
+    """
+    lang = None
+    CODE = 'wrong_lang'
+
+    def __init__(self, lang):
+        """
+        Creates LangError exception
+        :param lang: the requested languages
+        """
+        self.lang = lang
+        super(LangError, self).__init__(
+            message="The languages '{}' are not allowed".format(lang),
+            code=self.CODE,
+        )
+
+
+class ProcessError(RuntimeError):
+    """
+    A subprocess of OCR exited with an error code or it was killed by a signal, e.g. by a limit of the supervisor
+    """
+    CODE = 'process_failed'
+
+    def __init__(self, command, returncode, message=None):
+        """
+        Creates ProcessError exception
+        :param command: the name of the command e.g. 'tesseract'
+        :param returncode: the exit code, a negative code is the number of the signal
+        :param message: the message, it is made of the exit code by default
+        """
+        self.command = command
+        self.returncode = returncode
+        if message:
+            self.message = message
+        elif returncode < 0:
+            self.message = "'{}' was killed by the signal {}".format(command, -returncode)
+        else:
+            self.message = "'{}' exited with the code {}".format(command, returncode)
+        self.code = self.CODE
+        super(ProcessError, self).__init__(self.message)
+
+
+class ProcessTimeoutError(ProcessError):
+    """
+    A subprocess of OCR was killed because it did not finish in time
+    """
+    CODE = 'process_timeout'
+
+    def __init__(self, command, timeout):
+        """
+        Creates ProcessTimeoutError exception
+        :param command: the name of the command e.g. 'ocrmypdf'
+        :param timeout: seconds of the timeout
+        """
+        self.timeout = timeout
+        super(ProcessTimeoutError, self).__init__(command, -signal.SIGKILL,
+                                                  "'{}' was killed after {} seconds".format(command, timeout))
+
+
+class CursorError(ValidationError):
+    """
+    The cursor of the keyset pagination is wrong
+    """
+    cursor = None
+    CODE = 'wrong_cursor'
+
+    def __init__(self, cursor):
+        """
+        Creates CursorError exception
+        :param cursor: the cursor of the keyset pagination
+        """
+        self.cursor = cursor
+        super(CursorError, self).__init__(
+            message="The cursor '{}' is wrong".format(cursor),
+            code=self.CODE,
+        )
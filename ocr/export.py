@@ -0,0 +1,117 @@
+"""
+ocr/export.py
+This file contains the bulk export of OCRedFiles as NDJSON, one JSON object per line.
+Rows are read by QuerySet.values().iterator(), so the memory does not depend on the number of exported OCRedFiles.
+"""
+__author__ = 'shmakovpn <shmakovpn@yandex.ru>'
+__date__ = '2026-10-18'
+
+import json
+from datetime import timedelta
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from ocr import settings as ocr_default_settings
+from .models import OCRedFile
+from .fields import decompress_text
+
+
+# fields of OCRedFile which can be exported
+EXPORT_FIELDS = (
+    'id',
+    'md5',
+    'file_type',
+    'lang',
+    'uploaded',
+    'ocred',
+    'updated',
+    'ocred_pdf_md5',
+    'pdf_num_pages',
+    'pdf_author',
+    'pdf_creation_date',
+    'pdf_creator',
+    'pdf_mod_date',
+    'pdf_producer',
+    'pdf_title',
+    'text',
+)
+
+# filters of the export and lookups of OCRedFile they use
+EXPORT_FILTERS = {
+    'since': 'updated__gte',
+    'uploaded_from': 'uploaded__gte',
+    'uploaded_to': 'uploaded__lt',
+    'ocred_from': 'ocred__gte',
+    'ocred_to': 'ocred__lt',
+}
+
+
+def parse_export_filters(params):
+    """
+    This function converts values of filters of the export to datetimes
+    :param params: a dict like object, keys are names of EXPORT_FILTERS, values are ISO 8601 datetimes
+    :return: a dict of filters with datetime values
+    """
+    filters = {}
+    for name in EXPORT_FILTERS:
+        value = params.get(name)
+        if not value:
+            continue
+        if not isinstance(value, str):
+            filters[name] = value
+            continue
+        try:
+            filters[name] = parse_datetime(value)
+        except ValueError:
+            filters[name] = None
+        if filters[name] is None:
+            raise ValueError("The '{}' filter '{}' is not a datetime".format(name, value))
+    return filters
+
+
+def export_queryset(fields=None, **filters):
+    """
+    This function returns the QuerySet of exported rows.
+    The incremental export ('since') is ordered by 'updated', so the index of 'updated' is used,
+    removed OCRedFiles are not reported by it.
+    :param fields: exported fields, EXPORT_FIELDS by default
+    :param filters: 'since', 'uploaded_from', 'uploaded_to', 'ocred_from', 'ocred_to' datetimes
+    :return: QuerySet of dicts
+    """
+    fields = fields or EXPORT_FIELDS
+    wrong_fields = [name for name in fields if name not in EXPORT_FIELDS]
+    if wrong_fields:
+        raise ValueError("Wrong fields '{}', allowed fields are '{}'".format(
+            ','.join(wrong_fields), ','.join(EXPORT_FIELDS)))
+    queryset = OCRedFile.objects.filter(**{EXPORT_FILTERS[name]: value for name, value in filters.items()})
+    if filters.get('since'):
+        queryset = queryset.order_by('updated', 'id')
+    else:
+        queryset = queryset.order_by('id')
+    return queryset.values(*fields)
+
+
+def export_watermark():
+    """
+    This function returns the watermark of an export which is starting,
+    it is passed as 'since' to the next incremental export
+    :return: datetime
+    """
+    lag = getattr(settings, 'OCR_EXPORT_WATERMARK_LAG', ocr_default_settings.EXPORT_WATERMARK_LAG)
+    return timezone.now() - timedelta(seconds=lag)
+
+
+def export_ndjson(queryset, chunk_size=None):
+    """
+    This function is a generator of NDJSON lines of rows of the QuerySet
+    :param queryset: QuerySet of dicts returned by export_queryset()
+    :param chunk_size: the number of rows fetched from the database at once, OCR_EXPORT_CHUNK_SIZE by default
+    :return: a generator of strings, each string is a JSON object terminated by a newline
+    """
+    if chunk_size is None:
+        chunk_size = getattr(settings, 'OCR_EXPORT_CHUNK_SIZE', ocr_default_settings.EXPORT_CHUNK_SIZE)
+    for row in queryset.iterator(chunk_size=chunk_size):
+        if 'text' in row:
+            row['text'] = decompress_text(row['text'])
+        yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
@@ -0,0 +1,132 @@
+"""
+ocr/fields.py
+This file contains model fields of OCR Server.
+CompressedTextField stores long texts compressed by zlib or zstd (if the zstandard package is installed),
+a compressed value is a marker of the algorithm followed by base85 of compressed UTF-8,
+so it is stored in the same text column as a plain value and both kinds of values may be mixed in a table.
+Base85 adds 25% to compressed bytes (base64 adds 33%) and its alphabet is ASCII, so a value takes one byte
+per character in any text column; values written by previous versions in base64 are still read.
+"""
+__author__ = 'shmakovpn <shmakovpn@yandex.ru>'
+__date__ = '2026-10-18'
+
+import zlib
+import base64
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+from django.conf import settings
+from ocr import settings as ocr_default_settings
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# markers of compressed values, the escape character does not occur in OCRed texts
+COMPRESSION_MARKERS = {
+    'zlib': '\x1bzlib~',
+    'zstd': '\x1bzstd~',
+}
+# markers of base64 values of previous versions
+BASE64_MARKERS = {
+    'zlib': '\x1bzlib:',
+    'zstd': '\x1bzstd:',
+}
+MARKER_LENGTH = 6
+# {marker: (algorithm, decoding function)}
+DECODERS = dict(
+    [(marker, (algorithm, base64.b85decode)) for algorithm, marker in COMPRESSION_MARKERS.items()]
+    + [(marker, (algorithm, base64.b64decode)) for algorithm, marker in BASE64_MARKERS.items()]
+)
+
+
+def is_compressed_text(value):
+    """
+    This function returns True if the value is compressed by compress_text()
+    :param value: a stored value of CompressedTextField
+    :return: boolean
+    """
+    return isinstance(value, str) and value[:MARKER_LENGTH] in DECODERS
+
+
+def compress_text(value, algorithm=None, level=None, min_size=None):
+    """
+    This function compresses the text, compressed values and texts which do not get smaller are returned as is
+    :param value: a text
+    :param algorithm: 'zlib', 'zstd' or '' (no compression), OCR_TEXT_COMPRESSION by default
+    :param level: the level of compression, OCR_TEXT_COMPRESSION_LEVEL by default
+    :param min_size: shorter texts are not compressed, OCR_TEXT_COMPRESSION_MIN_SIZE by default
+    :return: the compressed text
+    """
+    if algorithm is None:
+        algorithm = getattr(settings, 'OCR_TEXT_COMPRESSION', ocr_default_settings.TEXT_COMPRESSION)
+    if not algorithm or not isinstance(value, str) or is_compressed_text(value):
+        return value
+    if min_size is None:
+        min_size = getattr(settings, 'OCR_TEXT_COMPRESSION_MIN_SIZE', ocr_default_settings.TEXT_COMPRESSION_MIN_SIZE)
+    if len(value) < min_size:
+        return value
+    if level is None:
+        level = getattr(settings, 'OCR_TEXT_COMPRESSION_LEVEL', ocr_default_settings.TEXT_COMPRESSION_LEVEL)
+    if algorithm == 'zstd':
+        if zstandard is None:
+            raise ImportError("OCR_TEXT_COMPRESSION='zstd' requires the zstandard package")
+        content = zstandard.ZstdCompressor(level=level).compress(value.encode('utf-8'))
+    elif algorithm == 'zlib':
+        content = zlib.compress(value.encode('utf-8'), level)
+    else:
+        raise ValueError("Wrong algorithm of compression '{}'".format(algorithm))
+    compressed = COMPRESSION_MARKERS[algorithm] + base64.b85encode(content).decode('ascii')
+    if len(compressed) >= len(value):
+        return value
+    return compressed
+
+
+def decompress_text(value):
+    """
+    This function decompresses the text compressed by compress_text(), other values are returned as is
+    :param value: a stored value of CompressedTextField
+    :return: the text
+    """
+    if not is_compressed_text(value):
+        return value
+    algorithm, decode = DECODERS[value[:MARKER_LENGTH]]
+    content = decode(value[MARKER_LENGTH:])
+    if algorithm == 'zstd':
+        if zstandard is None:
+            raise ImportError('The text is compressed by zstd, it requires the zstandard package')
+        return zstandard.ZstdDecompressor().decompress(content).decode('utf-8')
+    return zlib.decompress(content).decode('utf-8')
+
+
+class CompressedTextDescriptor(DeferredAttribute):
+    """
+    The descriptor of CompressedTextField, a loaded value is decompressed on the first access to the attribute
+    """
+    def __get__(self, instance, cls=None):
+        value = super(CompressedTextDescriptor, self).__get__(instance, cls)
+        if instance is not None and is_compressed_text(value):
+            value = instance.__dict__[self.field_name] = decompress_text(value)
+        return value
+
+
+class CompressedTextField(models.TextField):
+    """
+    The text field which is compressed on save if OCR_TEXT_COMPRESSION is set,
+    a loaded value is decompressed on the first access to the attribute of the model,
+    so texts which are loaded but not read cost nothing.
+    QuerySet.values() returns stored values, they are decompressed by decompress_text().
+    Lookups by the content (contains, startswith, ...) and database functions do not work with compressed values.
+    """
+    def contribute_to_class(self, cls, name, **kwargs):
+        super(CompressedTextField, self).contribute_to_class(cls, name, **kwargs)
+        setattr(cls, self.attname, CompressedTextDescriptor(self.attname))
+
+    def pre_save(self, model_instance, add):
+        value = model_instance.__dict__.get(self.attname)
+        if is_compressed_text(value):
+            return value  # the text was not read since it was loaded, it is saved as it is stored
+        return super(CompressedTextField, self).pre_save(model_instance, add)
+
+    def get_prep_value(self, value):
+        return compress_text(super(CompressedTextField, self).get_prep_value(value))
@@ -0,0 +1,30 @@
+"""
+ocr/management/commands/ocr_clean.py
+Removes uploaded files, searchable PDFs and hOCRs that are not related with any OCRedFile
+"""
+__author__ = 'shmakovpn <shmakovpn@yandex.ru>'
+__date__ = '2026-10-18'
+
+import json
+from django.core.management.base import BaseCommand
+from ocr.models import OCRedFile
+
+
+class Command(BaseCommand):
+    help = 'Removes uploaded files, searchable PDFs and hOCRs that are not related with any OCRedFile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='only report files that are not related with any OCRedFile')
+        parser.add_argument('--rate', type=float, default=None,
+                            help='the maximum number of removed files per second (OCR_CLEAN_RATE by default)')
+        parser.add_argument('--min-age', type=float, default=None,
+                            help='seconds, files modified later are not removed (OCR_CLEAN_MIN_AGE by default)')
+        parser.add_argument('--report-limit', type=int, default=None,
+                            help='the maximum number of reported paths for each folder '
+                                 '(OCR_CLEAN_REPORT_LIMIT by default)')
+
+    def handle(self, *args, **options):
+        reports = OCRedFile.cleanup(dry_run=options['dry_run'], rate=options['rate'], min_age=options['min_age'],
+                                    report_limit=options['report_limit'])
+        self.stdout.write(json.dumps(reports, indent=2))
@@ -0,0 +1,58 @@
+"""
+ocr/management/commands/ocr_compress_text.py
+Compresses or decompresses stored texts of OCRedFiles in batches
+"""
+__author__ = 'shmakovpn <shmakovpn@yandex.ru>'
+__date__ = '2026-10-18'
+
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models.functions import Substr
+from ocr import settings as ocr_default_settings
+from ocr.models import OCRedFile
+from ocr.fields import compress_text, decompress_text, is_compressed_text, COMPRESSION_MARKERS, MARKER_LENGTH
+
+
+class Command(BaseCommand):
+    help = 'Compresses or decompresses stored texts of OCRedFiles in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--algorithm', choices=('zlib', 'zstd', 'none'), default=None,
+                            help="the compression of texts, OCR_TEXT_COMPRESSION by default, 'none' decompresses texts")
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='the number of OCRedFiles converted in one transaction')
+
+    def handle(self, *args, **options):
+        configured = getattr(settings, 'OCR_TEXT_COMPRESSION', ocr_default_settings.TEXT_COMPRESSION)
+        algorithm = options['algorithm'] or configured or 'none'
+        if algorithm == 'none' and configured:
+            raise CommandError('OCR_TEXT_COMPRESSION must be disabled to decompress texts, they are compressed on save')
+        converted = 0
+        skipped = 0
+        last_pk = 0
+        queryset = OCRedFile.objects.exclude(text__isnull=True).order_by('id')\
+            .annotate(marker=Substr('text', 1, MARKER_LENGTH, output_field=models.TextField()))
+        while True:
+            rows = list(queryset.filter(id__gt=last_pk).values_list('id', 'marker', 'text')[:options['batch_size']])
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            with transaction.atomic():
+                for pk, marker, text in rows:
+                    if algorithm == 'none':
+                        if not is_compressed_text(marker):
+                            skipped += 1
+                            continue
+                        value = decompress_text(text)
+                    else:
+                        if marker == COMPRESSION_MARKERS[algorithm]:
+                            skipped += 1
+                            continue
+                        value = compress_text(decompress_text(text), algorithm)
+                        if not is_compressed_text(value) and not is_compressed_text(marker):
+                            skipped += 1  # the text is too short to be compressed
+                            continue
+                    OCRedFile.objects.filter(pk=pk).update(text=value)
+                    converted += 1
+        self.stdout.write('{} texts converted to {}, {} texts skipped'.format(converted, algorithm, skipped))
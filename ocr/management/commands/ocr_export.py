@@ -0,0 +1,57 @@
+"""
+ocr/management/commands/ocr_export.py
+Exports OCRedFiles as NDJSON, one JSON object per line
+"""
+__author__ = 'shmakovpn <shmakovpn@yandex.ru>'
+__date__ = '2026-10-18'
+
+import os
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from ocr.export import export_queryset, export_ndjson, export_watermark, parse_export_filters
+
+
+class Command(BaseCommand):
+    help = 'Exports OCRedFiles as NDJSON, one JSON object per line'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='-',
+                            help='the NDJSON file, stdout by default')
+        parser.add_argument('--fields', default=None,
+                            help='a comma separated list of exported fields, all fields by default')
+        parser.add_argument('--since', default=None,
+                            help='export only OCRedFiles updated since the ISO 8601 datetime')
+        parser.add_argument('--watermark-file', default=None,
+                            help='the incremental export, the file stores the watermark of the previous export, '
+                                 'it is used as --since and it is replaced by the watermark of this export')
+        for name in ('uploaded_from', 'uploaded_to', 'ocred_from', 'ocred_to'):
+            parser.add_argument('--' + name.replace('_', '-'), dest=name, default=None,
+                                help='the ISO 8601 datetime filter of OCRedFile.{}'.format(name.split('_')[0]))
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='the number of rows fetched from the database at once (OCR_EXPORT_CHUNK_SIZE by default)')
+
+    def handle(self, *args, **options):
+        watermark = export_watermark()
+        if options['watermark_file'] and not options['since'] and os.path.isfile(options['watermark_file']):
+            with open(options['watermark_file']) as file:
+                options['since'] = file.read().strip()
+        fields = None
+        if options['fields']:
+            fields = [name.strip() for name in options['fields'].split(',') if name.strip()]
+        try:
+            queryset = export_queryset(fields, **parse_export_filters(options))
+        except ValueError as e:
+            raise CommandError(str(e))
+        output = sys.stdout if options['output'] == '-' else open(options['output'], 'w', encoding='utf-8')
+        rows = 0
+        try:
+            for line in export_ndjson(queryset, options['chunk_size']):
+                output.write(line)
+                rows += 1
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        if options['watermark_file']:
+            with open(options['watermark_file'], 'w') as file:
+                file.write(watermark.isoformat())
+        self.stderr.write('{} OCRedFiles exported, the watermark is {}'.format(rows, watermark.isoformat()))
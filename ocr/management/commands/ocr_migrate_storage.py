@@ -0,0 +1,87 @@
+"""
+ocr/management/commands/ocr_migrate_storage.py
+Moves stored files of OCRedFiles to the content-addressed layout (OCR_STORAGE_SHARD_LEVELS, OCR_STORAGE_SHARD_WIDTH)
+"""
+__author__ = 'shmakovpn <shmakovpn@yandex.ru>'
+__date__ = '2026-10-18'
+
+import os
+import time
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.files.storage import default_storage
+from ocr import settings as ocr_default_settings
+from ocr.models import OCRedFile
+from ocr.storage import content_name, link_stored_file
+
+
+class Command(BaseCommand):
+    help = 'Moves stored files of OCRedFiles to the content-addressed layout, the server keeps working meanwhile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='the number of OCRedFiles processed in one batch')
+        parser.add_argument('--sleep', type=float, default=0,
+                            help='seconds between batches, it limits the load of a disk')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='only count files which are not in the content-addressed layout')
+
+    def handle(self, *args, **options):
+        labels = (
+            getattr(settings, 'OCR_STORE_FILES_DISABLED_LABEL', ocr_default_settings.STORE_FILES_DISABLED_LABEL),
+            getattr(settings, 'OCR_STORE_PDF_DISABLED_LABEL', ocr_default_settings.STORE_PDF_DISABLED_LABEL),
+            getattr(settings, 'OCR_FILE_REMOVED_LABEL', ocr_default_settings.FILE_REMOVED_LABEL),
+            getattr(settings, 'OCR_PDF_REMOVED_LABEL', ocr_default_settings.PDF_REMOVED_LABEL),
+        )
+        fields = (
+            ('file', getattr(settings, 'OCR_FILES_UPLOAD_TO', ocr_default_settings.FILES_UPLOAD_TO)),
+            ('ocred_pdf', getattr(settings, 'OCR_PDF_UPLOAD_TO', ocr_default_settings.PDF_UPLOAD_TO)),
+            ('ocred_hocr', getattr(settings, 'OCR_HOCR_UPLOAD_TO', ocr_default_settings.HOCR_UPLOAD_TO)),
+        )
+        counters = {'moved': 0, 'missing': 0, 'changed': 0}
+        last_pk = 0
+        while True:
+            rows = list(OCRedFile.objects.filter(id__gt=last_pk).order_by('id')
+                        .values('id', 'md5', 'file', 'ocred_pdf', 'ocred_hocr')[:options['batch_size']])
+            if not rows:
+                break
+            last_pk = rows[-1]['id']
+            for row in rows:
+                for field, upload_to in fields:
+                    name = row[field]
+                    if not name or not name.startswith(upload_to) or any(label in name for label in labels):
+                        continue
+                    target = content_name(upload_to, row['md5'], os.path.splitext(name)[1].lower())
+                    if name == target:
+                        continue
+                    if options['dry_run']:
+                        counters['moved'] += 1
+                        continue
+                    counters[self.move(row, field, name, target)] += 1
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        self.stdout.write('{moved} files moved, {missing} files missing, '
+                          '{changed} files changed concurrently'.format(**counters))
+
+    @staticmethod
+    def move(row, field, name, target):
+        """
+        Moves the file of the field of the OCRedFile to the target name.
+        The file is linked to the target name, then the row is updated, then the old name is removed,
+        so the file is accessible by the name stored in the row during the move.
+        A download url of an uploaded file changes if its flat name was not its md5,
+        the cache of <md5:md5>/ of the server returns the old url until OCR_MD5_CACHE_TTL expires.
+        :param row: a dict of 'id' and 'md5' of the OCRedFile
+        :param field: 'file', 'ocred_pdf' or 'ocred_hocr'
+        :param name: the current name of the file
+        :param target: the name of the file in the content-addressed layout
+        :return: 'moved', 'missing' or 'changed'
+        """
+        if not link_stored_file(name, target):
+            return 'missing'
+        if not OCRedFile.objects.filter(pk=row['id'], **{field: name}).update(**{field: target}):
+            return 'changed'  # the file was removed or replaced meanwhile, the target is an orphan for ocr_clean
+        link_stored_file(name, target)  # the target could be removed by a concurrent ocr_clean as an orphan
+        if os.path.isfile(default_storage.path(name)):
+            os.remove(default_storage.path(name))
+        return 'moved'
@@ -0,0 +1,81 @@
+"""
+ocr/management/commands/ocr_reindex.py
+Rebuilds the md5 index (OCRedHash) and the full-text search index of OCRed texts
+"""
+__author__ = 'shmakovpn <shmakovpn@yandex.ru>'
+__date__ = '2026-10-18'
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from ocr.models import OCRedFile, OCRedHash
+from ocr.search import is_search_enabled, drop_search_index, create_search_index, index_many
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the md5 index (OCRedHash) and the full-text search index of OCRed texts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--index', choices=('all', 'hashes', 'search'), default='all',
+                            help='the index to rebuild, all by default')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='the number of OCRedFiles indexed in one transaction')
+
+    def handle(self, *args, **options):
+        if options['index'] in ('all', 'hashes'):
+            self.reindex_hashes(options['batch_size'])
+        if options['index'] in ('all', 'search'):
+            if is_search_enabled():
+                self.reindex_search(options['batch_size'])
+            elif options['index'] == 'search':
+                raise CommandError('The full-text search is disabled or it is not supported by the database backend')
+
+    def reindex_hashes(self, batch_size):
+        """
+        Rebuilds OCRedHash from OCRedFile.md5 and OCRedFile.ocred_pdf_md5
+        :param batch_size: the number of OCRedFiles indexed in one transaction
+        :return: None
+        """
+        OCRedHash.objects.all().delete()
+        hashes = 0
+        batch = []
+        rows = OCRedFile.objects.order_by('id').values_list('id', 'md5', 'ocred_pdf_md5')
+        for pk, md5_value, pdf_md5_value in rows.iterator(chunk_size=batch_size):
+            batch.append(OCRedHash(md5=md5_value, kind=OCRedHash.KIND_FILE, ocred_file_id=pk))
+            if pdf_md5_value:
+                batch.append(OCRedHash(md5=pdf_md5_value, kind=OCRedHash.KIND_PDF, ocred_file_id=pk))
+            if len(batch) >= batch_size:
+                with transaction.atomic():
+                    OCRedHash.objects.bulk_create(batch)
+                hashes += len(batch)
+                batch = []
+        if batch:
+            with transaction.atomic():
+                OCRedHash.objects.bulk_create(batch)
+            hashes += len(batch)
+        self.stdout.write('{} md5 indexed'.format(hashes))
+
+    def reindex_search(self, batch_size):
+        """
+        Rebuilds the full-text search index
+        :param batch_size: the number of OCRedFiles indexed in one transaction
+        :return: None
+        """
+        drop_search_index()
+        create_search_index()
+        documents = 0
+        pages = 0
+        batch = []
+        ocred_files = OCRedFile.objects.exclude(text__isnull=True).exclude(text='')\
+            .only('id', 'uploaded', 'text', 'text_page_offsets').order_by('id')
+        for ocred_file in ocred_files.iterator(chunk_size=batch_size):
+            batch.append((ocred_file.pk, ocred_file.get_text_pages(1, ocred_file.text_num_pages)))
+            if len(batch) >= batch_size:
+                with transaction.atomic():
+                    pages += index_many(batch)
+                documents += len(batch)
+                batch = []
+        if batch:
+            with transaction.atomic():
+                pages += index_many(batch)
+            documents += len(batch)
+        self.stdout.write('{} pages of {} OCRedFiles indexed'.format(pages, documents))
@@ -0,0 +1,45 @@
+"""
+ocr/management/commands/ocr_stage_stats.py
+Reports percentiles of wall and CPU seconds of stages of the processing of OCRedFiles
+grouped by the content type and the number of pages
+"""
+__author__ = 'shmakovpn <shmakovpn@yandex.ru>'
+__date__ = '2026-10-18'
+
+import json
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from ocr.models import OCRedFile
+
+
+class Command(BaseCommand):
+    help = 'Reports percentiles of wall and CPU seconds of stages of OCRedFiles by the content type and pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stage', action='append', default=None,
+                            help='the stage to report, e.g. ocr, it can be repeated (all stages by default)')
+        parser.add_argument('--percentile', type=float, nargs='+', default=[50, 95],
+                            help='percentiles of seconds (50 95 by default)')
+        parser.add_argument('--file-type', default=None, help='the content type of files, e.g. application/pdf')
+        parser.add_argument('--days', type=float, default=None, help='only files uploaded in the last days')
+        parser.add_argument('--json', action='store_true', help='output the report as JSON')
+
+    def handle(self, *args, **options):
+        queryset = OCRedFile.objects.all()
+        if options['file_type']:
+            queryset = queryset.filter(file_type=options['file_type'])
+        if options['days']:
+            queryset = queryset.filter(uploaded__gte=timezone.now() - timedelta(days=options['days']))
+        percents = [int(percent) if percent == int(percent) else percent for percent in options['percentile']]
+        report = OCRedFile.stage_stats(stages=options['stage'], percents=percents, queryset=queryset)
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        columns = ['file_type', 'pages', 'stage', 'count', 'bytes']
+        for percent in percents:
+            columns += ['wall_p{}'.format(percent), 'cpu_p{}'.format(percent)]
+        self.stdout.write('\t'.join(columns))
+        for row in report:
+            self.stdout.write('\t'.join('{:.3f}'.format(row[column]) if isinstance(row[column], float)
+                                        else str(row[column]) for column in columns))
@@ -0,0 +1,43 @@
+"""
+ocr/management/commands/ocr_ttl.py
+Runs the TTL sweeper which removes OCRedFiles, files and searchable PDFs whose TTL is expired
+"""
+__author__ = 'shmakovpn <shmakovpn@yandex.ru>'
+__date__ = '2026-10-18'
+
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from ocr import settings as ocr_default_settings
+from ocr.models import OCRedFile, TtlSweep
+
+
+class Command(BaseCommand):
+    help = 'Runs the TTL sweeper which removes OCRedFiles, files and searchable PDFs whose TTL is expired'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='sweep again after the interval until the process is stopped')
+        parser.add_argument('--interval', type=float, default=None,
+                            help='seconds between sweeps (OCR_TTL_SWEEP_INTERVAL by default)')
+        parser.add_argument('--time-budget', type=float, default=None,
+                            help='seconds, a sweep stops after the batch which exceeds it and will be continued')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='the number of OCRedFiles in a batch (OCR_TTL_BATCH_SIZE by default)')
+        parser.add_argument('--reset', action='store_true',
+                            help='reset cursors, files and searchable PDFs of all expired rows will be checked again')
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        if interval is None:
+            interval = getattr(settings, 'OCR_TTL_SWEEP_INTERVAL', ocr_default_settings.TTL_SWEEP_INTERVAL)
+        if options['reset']:
+            TtlSweep.reset()
+        while True:
+            result = OCRedFile.ttl_sweep(time_budget=options['time_budget'], batch_size=options['batch_size'])
+            self.stdout.write('{} OCRedFiles, {} files, {} searchable PDFs removed, complete: {}, lag: {:.0f}s'.format(
+                result['removed'], result['files_removed'], result['pdf_removed'], result['complete'], result['lag']))
+            if not options['loop']:
+                break
+            if result['complete']:
+                time.sleep(interval)
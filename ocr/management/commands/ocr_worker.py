@@ -0,0 +1,31 @@
+"""
+ocr/management/commands/ocr_worker.py
+Runs a pool of OCR worker processes which process OCRJobs queued by /upload/ when OCR_ASYNC is True
+"""
+__author__ = 'shmakovpn <shmakovpn@yandex.ru>'
+__date__ = '2026-10-18'
+
+from django.core.management.base import BaseCommand
+from ocr.models import OCRJob
+from ocr.worker import run_workers
+
+
+class Command(BaseCommand):
+    help = 'Runs a pool of OCR worker processes which process queued OCRJobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=None,
+                            help='the number of worker processes (OCR_WORKER_PROCESSES by default)')
+        parser.add_argument('--interval', type=float, default=None,
+                            help='seconds between polls of an empty queue (OCR_WORKER_POLL_INTERVAL by default)')
+        parser.add_argument('--once', action='store_true',
+                            help='exit when the queue becomes empty')
+        parser.add_argument('--requeue-running', action='store_true',
+                            help='queue again OCRJobs left running by killed workers')
+
+    def handle(self, *args, **options):
+        if options['requeue_running']:
+            count = OCRJob.objects.filter(status=OCRJob.STATUS_RUNNING)\
+                .update(status=OCRJob.STATUS_QUEUED, started=None)
+            self.stdout.write('{} running OCRJobs queued again'.format(count))
+        run_workers(processes=options['processes'], interval=options['interval'], once=options['once'])
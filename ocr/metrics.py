@@ -0,0 +1,239 @@
+"""
+ocr/metrics.py
+This file contains the registry of metrics of OCR Server: counters and histograms of seconds of stages.
+A process adds increments to its pending series, a background thread of the process flushes them
+to the Metric model every OCR_METRICS_FLUSH_INTERVAL seconds by one UPDATE of all changed series
+and one INSERT of new series, so requests do not wait for the database to count metrics.
+Values are aggregated by all processes of the server and they survive restarts.
+The metrics/ API view returns them in the text format of Prometheus.
+"""
+__author__ = 'shmakovpn <shmakovpn@yandex.ru>'
+__date__ = '2026-10-18'
+
+import os
+import re
+import time
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+from django.conf import settings
+from ocr import settings as ocr_default_settings
+
+
+# metrics: (type, help)
+METRICS = {
+    'ocr_uploads_total': ('counter', 'Files uploaded by upload/ by the result: created, duplicate, queued, error'),
+    'ocr_files_created_total': ('counter', 'Created OCRedFiles by the content type'),
+    'ocr_files_removed_total': ('counter', 'Removed OCRedFiles'),
+    'ocr_stored_files_removed_total': ('counter', 'Removed stored files of OCRedFiles by the kind: file, pdf'),
+    'ocr_pdfs_created_total': ('counter', 'Searchable PDFs created on demand'),
+    'ocr_stage_seconds': ('histogram', 'Seconds of stages: upload, hash, pdf_parse, preprocess, ocr, storage, index'),
+    'ocr_subprocesses_total': ('counter', 'Subprocesses of OCR by the command and the result: '
+                                          'ok, failed, killed, signaled'),
+    'ocr_subprocess_wait_seconds': ('histogram', 'Seconds subprocesses of OCR waited for a free slot'),
+}
+
+FLUSH_BATCH_SIZE = 200  # series updated by one statement, SQLite allows 999 parameters of a statement
+
+logger = logging.getLogger(__name__)
+
+SERIES_RE = re.compile(r'^(\w+?)(_bucket|_sum|_count)?(?:\{(.*)\})?$')
+LE_RE = re.compile(r',?le="([^"]+)"')
+
+
+def series_name(name, labels):
+    """
+    This function returns the name of the series of the metric with the labels
+    :param name: the name of the metric with the suffix of the histogram e.g. 'ocr_stage_seconds_bucket'
+    :param labels: a list of (label, value), 'le' goes last
+    :return: the name of the series e.g. 'ocr_stage_seconds_bucket{stage="ocr",le="0.5"}'
+    """
+    if not labels:
+        return name
+    return '{}{{{}}}'.format(name, ','.join('{}="{}"'.format(label, str(value).replace('"', "'"))
+                                            for label, value in labels))
+
+
+def series_order(series):
+    """
+    This function returns the key of the order of series, buckets of a histogram are ordered by their bounds
+    :param series: the name of the series
+    :return: a tuple
+    """
+    match = SERIES_RE.match(series)
+    name, suffix, labels = match.groups() if match else (series, None, None)
+    labels = labels or ''
+    le = LE_RE.search(labels)
+    bound = float(le.group(1)) if le else 0.0
+    return name, LE_RE.sub('', labels), suffix or '', bound
+
+
+class Registry:
+    """
+    A thread safe registry of metrics of the process, increments are flushed to the database
+    """
+    def __init__(self, buckets, flush_interval):
+        """
+        Registry constructor
+        :param buckets: upper bounds of buckets of histograms, seconds
+        :param flush_interval: seconds between flushes, 0 - increments are flushed immediately
+        """
+        self.buckets = tuple(sorted(buckets))
+        self.flush_interval = flush_interval
+        self._pending = {}  # series: increment
+        self._lock = threading.Lock()
+        self._flusher_pid = None  # the process which runs the flushing thread, a forked process starts its own
+
+    def add(self, series):
+        """
+        Adds increments to pending series, they are flushed by the flushing thread
+        or immediately if flush_interval is 0
+        :param series: a dict {series: increment}
+        :return: None
+        """
+        with self._lock:
+            for name, increment in series.items():
+                self._pending[name] = self._pending.get(name, 0) + increment
+            start_flusher = self.flush_interval and self._flusher_pid != os.getpid()
+            if start_flusher:
+                self._flusher_pid = os.getpid()
+        if not self.flush_interval:
+            self.flush()
+        elif start_flusher:
+            threading.Thread(target=self._flush_forever, name='ocr-metrics-flush', daemon=True).start()
+
+    def _flush_forever(self):
+        """
+        The target of the flushing thread, it flushes pending series every flush_interval seconds
+        :return: None
+        """
+        from django.db import connection
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+            connection.close()  # the connection of the thread is not closed by the request cycle
+
+    def inc(self, name, value=1, **labels):
+        """
+        Increments the counter
+        :param name: the name of the counter in METRICS
+        :param value: the increment
+        :param labels: values of labels of the series
+        :return: None
+        """
+        self.add({series_name(name, sorted(labels.items())): value})
+
+    def observe(self, name, seconds, **labels):
+        """
+        Adds the observation to the histogram
+        :param name: the name of the histogram in METRICS
+        :param seconds: the observed value
+        :param labels: values of labels of the series
+        :return: None
+        """
+        labels = sorted(labels.items())
+        series = {
+            series_name(name + '_sum', labels): seconds,
+            series_name(name + '_count', labels): 1,
+            series_name(name + '_bucket', labels + [('le', '+Inf')]): 1,
+        }
+        for bound in self.buckets:
+            # every bucket is added, so it exists in the output before an observation falls into it
+            series[series_name(name + '_bucket', labels + [('le', bound)])] = 1 if seconds <= bound else 0
+        self.add(series)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Observes seconds of the block of the with statement in the histogram
+        :param name: the name of the histogram in METRICS
+        :param labels: values of labels of the series
+        :return: None
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def flush(self):
+        """
+        Adds pending increments to the Metric model, they are kept until the next flush if the database fails
+        :return: None
+        """
+        from django.db import transaction, IntegrityError
+        from django.db.models import F, Case, When, Value, FloatField
+        from .models import Metric  # the registry is used by models
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        flushed = set()
+        try:
+            items = sorted(pending.items())
+            for start in range(0, len(items), FLUSH_BATCH_SIZE):
+                batch = dict(items[start:start + FLUSH_BATCH_SIZE])
+                with transaction.atomic():
+                    existing = set(Metric.objects.filter(series__in=batch).values_list('series', flat=True))
+                    if existing:
+                        Metric.objects.filter(series__in=existing).update(value=F('value') + Case(
+                            *[When(series=series, then=Value(batch[series])) for series in existing],
+                            output_field=FloatField()))
+                    new = [Metric(series=series, value=increment) for series, increment in batch.items()
+                           if series not in existing]
+                    try:
+                        with transaction.atomic():
+                            Metric.objects.bulk_create(new)
+                    except IntegrityError:
+                        # some series were created by another process meanwhile
+                        for metric in new:
+                            if not Metric.objects.filter(series=metric.series).update(
+                                    value=F('value') + metric.value):
+                                metric.save()
+                flushed.update(batch)
+        except Exception as e:
+            # e.g. the database is not migrated yet, increments are kept until the next flush
+            logger.warning('metrics flush failed: %s', e)
+            with self._lock:
+                for series, increment in pending.items():
+                    if series not in flushed:
+                        self._pending[series] = self._pending.get(series, 0) + increment
+
+    def values(self):
+        """
+        Flushes pending increments and returns values of all series of all processes
+        :return: a dict {series: value}
+        """
+        from .models import Metric
+        self.flush()
+        return dict(Metric.objects.values_list('series', 'value'))
+
+    def value(self, name, **labels):
+        """
+        Returns the value of the series of the counter aggregated by all processes
+        :param name: the name of the counter
+        :param labels: values of labels of the series
+        :return: the value, 0 if the series does not exist
+        """
+        return self.values().get(series_name(name, sorted(labels.items())), 0)
+
+    def render(self):
+        """
+        Returns values of all series in the text format of Prometheus
+        :return: a string
+        """
+        lines = []
+        described = set()
+        for series, value in sorted(self.values().items(), key=lambda item: series_order(item[0])):
+            name = series_order(series)[0]
+            if name not in described and name in METRICS:
+                described.add(name)
+                lines.append('# HELP {} {}'.format(name, METRICS[name][1]))
+                lines.append('# TYPE {} {}'.format(name, METRICS[name][0]))
+            lines.append('{} {}'.format(series, repr(float(value)) if value != int(value) else int(value)))
+        return '\n'.join(lines) + '\n'
+
+
+# metrics of the process
+metrics = Registry(getattr(settings, 'OCR_METRICS_BUCKETS', ocr_default_settings.METRICS_BUCKETS),
+                   getattr(settings, 'OCR_METRICS_FLUSH_INTERVAL', ocr_default_settings.METRICS_FLUSH_INTERVAL))
+atexit.register(metrics.flush)
@@ -1,12 +1,30 @@
 import os
-from django.db import models
+import time
+import base64
+from concurrent.futures import ThreadPoolExecutor
+from django.db import models, transaction, IntegrityError
 from django.conf import settings
 from ocr import settings as ocr_default_settings
 from datetime import datetime
 from django.utils import timezone
 from django.urls import reverse
-from .utils import md5, ocr_img2str, pdf2text, ocr_img2pdf, pdf_info, pdf_need_ocr, ocr_pdf, read_binary_file
+from .utils import md5, ocr_pdf, read_binary_file
+from .utils import ocr_img2outputs, hocr2pdf, pdf2pages, pdf_pages_need_ocr, ocr_pdf_pages, pdf_analyze
+from .utils import split_text_pages, text_page_offsets, image_frames, ocr_img_frames
+from .utils import tesseract_lang, detect_image_lang, detect_text_lang, pdf_sample_text
+from .search import index_pages, unindex, unindex_many, search_pages, make_snippet, is_search_enabled
+from .cache import md5_cache
+from .reconcile import reconcile
+from .fields import CompressedTextField, is_compressed_text, MARKER_LENGTH
+from .storage import content_name, ensure_folder, link_stored_file
+from .preprocess import preprocess_image
+from .metrics import metrics
+from .stages import StageTimer, stage_percentiles
+from django.db.models import Q
+from django.db.models.functions import Substr
+from django.utils.dateparse import parse_datetime
 from io import BytesIO
+from django.core.files.base import ContentFile
 from django.utils.translation import gettext_lazy as _
 from .exceptions import *
 
@@ -21,6 +39,8 @@ def set_ocredfile_name(instance, filename=None):
     upload_to = getattr(settings, 'OCR_FILES_UPLOAD_TO', ocr_default_settings.FILES_UPLOAD_TO)
     if not getattr(settings, 'OCR_STORE_FILES', ocr_default_settings.STORE_FILES):
         filename = getattr(settings, 'OCR_STORE_FILES_DISABLED_LABEL', ocr_default_settings.STORE_FILES_DISABLED_LABEL)
+    elif instance.md5:
+        return content_name(upload_to, instance.md5, os.path.splitext(filename)[1].lower())
     return upload_to + filename
 
 
@@ -37,24 +57,82 @@ def set_pdffile_name(instance, filename=None):
         if instance.md5:
             filename += '_' + instance.md5
     elif instance.md5:
-        filename = instance.md5
+        return content_name(upload_to, instance.md5, '.pdf')
     else:
         filename = instance.file.name
     return upload_to + filename + '.pdf'
 
 
+def set_hocrfile_name(instance, filename=None):
+    """
+    This function returns a filename for OCRedFile.ocred_hocr
+    :param instance: an instance of the OCRedFile model
+    :param filename: does not use
+    :return: a filename for OCRedFile.ocred_hocr
+    """
+    upload_to = getattr(settings, 'OCR_HOCR_UPLOAD_TO', ocr_default_settings.HOCR_UPLOAD_TO)
+    return content_name(upload_to, instance.md5, '.hocr')
+
+
+def set_jobfile_name(instance, filename=None):
+    """
+    This function returns a filename for OCRJob.file
+    :param instance: an instance of the OCRJob model
+    :param filename: a name of a uploaded file
+    :return: a filename for OCRJob.file
+    """
+    upload_to = getattr(settings, 'OCR_JOBS_UPLOAD_TO', ocr_default_settings.JOBS_UPLOAD_TO)
+    return upload_to + filename
+
+
+def remove_stored_files(names, threads=None):
+    """
+    This function removes files of FileFields of OCRedFile from a disk by a pool of threads,
+    empty names and labels used instead of names of files which do not exist are skipped
+    :param names: names of files of FileFields
+    :param threads: the number of threads, OCR_BULK_DELETE_THREADS by default
+    :return: the number of removed files
+    """
+    if threads is None:
+        threads = getattr(settings, 'OCR_BULK_DELETE_THREADS', ocr_default_settings.BULK_DELETE_THREADS)
+    labels = (
+        getattr(settings, 'OCR_FILE_REMOVED_LABEL', ocr_default_settings.FILE_REMOVED_LABEL),
+        getattr(settings, 'OCR_PDF_REMOVED_LABEL', ocr_default_settings.PDF_REMOVED_LABEL),
+        getattr(settings, 'OCR_STORE_FILES_DISABLED_LABEL', ocr_default_settings.STORE_FILES_DISABLED_LABEL),
+        getattr(settings, 'OCR_STORE_PDF_DISABLED_LABEL', ocr_default_settings.STORE_PDF_DISABLED_LABEL),
+    )
+    names = [name for name in names if name and not any(label in name for label in labels)]
+    if not names:
+        return 0
+    storage = OCRedFile._meta.get_field('file').storage
+
+    def remove(name):
+        try:
+            os.remove(storage.path(name))
+            return 1
+        except FileNotFoundError:
+            return 0
+
+    with ThreadPoolExecutor(max_workers=max(1, min(threads, len(names)))) as executor:
+        return sum(executor.map(remove, names))
+
+
 # Create your models here.
 class OCRedFile(models.Model):
     """
     The OCRedFile model class. Need to store information about uploaded file.
     """
     md5 = models.CharField('md5', max_length=32, unique=True, blank=True, )
-    file = models.FileField('uploaded file', upload_to=set_ocredfile_name, null=True)
+    file = models.FileField('uploaded file', upload_to=set_ocredfile_name, null=True, db_index=True)
     file_type = models.CharField('content type', max_length=20, blank=True, null=True, )
-    text = models.TextField('OCRed content', blank=True, null=True)
-    uploaded = models.DateTimeField('uploaded datetime', auto_now_add=True,)
+    text = CompressedTextField('OCRed content', blank=True, null=True)
+    # comma separated offsets of the ends of pages in 'text', a page owns the form feed after it
+    text_page_offsets = models.TextField('offsets of pages in OCRed content', blank=True, null=True)
+    uploaded = models.DateTimeField('uploaded datetime', auto_now_add=True, db_index=True)
     ocred = models.DateTimeField('OCRed datetime', blank=True, null=True)
-    ocred_pdf = models.FileField('Searchable PDF', upload_to=set_pdffile_name, null=True)
+    # the watermark of the incremental export, querysets updating OCRedFiles have to set it explicitly
+    updated = models.DateTimeField('updated datetime', auto_now=True, db_index=True)
+    ocred_pdf = models.FileField('Searchable PDF', upload_to=set_pdffile_name, null=True, db_index=True)
     ocred_pdf_md5 = models.CharField("Searchable PDF's md5", max_length=32, null=True, blank=True)
     pdf_num_pages = models.IntegerField("PDF's num pages", null=True, blank=True)  #
     # from ocred_pdf info
@@ -64,6 +142,14 @@ class OCRedFile(models.Model):
     pdf_mod_date = models.DateTimeField("PDF's mod date", blank=True, null=True)
     pdf_producer = models.CharField("PDF's producer", max_length=128, null=True, blank=True)
     pdf_title = models.CharField("PDF's title", max_length=128, null=True, blank=True)
+    ocred_hocr = models.FileField('hOCR', upload_to=set_hocrfile_name, null=True, blank=True)
+    # languages of tesseract which OCRed the file, requested languages until the file is OCRed
+    lang = models.CharField('languages', max_length=64, blank=True, default='')
+    LANG_AUTO = 'auto'  # the requested languages are languages of the detected script
+    # compact JSON {"stage": [wall seconds, CPU seconds, bytes]} of stages of the processing, see ocr/stages.py
+    stage_timings = models.TextField('timings of stages', blank=True, null=True)
+    preprocess_timings = None  # seconds of stages of the preprocessing of the image, it is not stored
+    stage_timer = None  # StageTimer of the processing, the serializer passes it with the measured hash stage
 
     @staticmethod
     def is_valid_file_type(file_type, raise_exception=False):
@@ -85,10 +171,28 @@ class OCRedFile(models.Model):
                 return False
         return True
 
+    @staticmethod
+    def is_valid_lang(lang, raise_exception=False):
+        """
+        This function checks that requested languages of tesseract are 'auto' or OCR_ALLOWED_LANGS joined by '+'
+        :param lang: requested languages e.g. 'rus+eng', '' - OCR_DEFAULT_LANG
+        :param raise_exception:
+        :return: boolean. True if lang contains a correct value
+        """
+        if not lang or lang == OCRedFile.LANG_AUTO:
+            return True
+        allowed_langs = getattr(settings, 'OCR_ALLOWED_LANGS', ocr_default_settings.ALLOWED_LANGS)
+        if len(lang) > 64 or not all(part in allowed_langs for part in lang.split('+')):
+            if raise_exception:
+                raise LangError(lang)
+            return False
+        return True
+
     @staticmethod
     def is_valid_ocr_md5(md5_value, raise_exception=False):
         """
         This function validates that the md5 does not already exist in the md5 field and ocred_pdf_md5.
+        Both are checked by one query of the unique index of OCRedHash.
         :param md5_value:
         :param raise_exception:
         :return: boolean. True if md5 does not already exist
@@ -98,12 +202,13 @@ class OCRedFile(models.Model):
                 raise ValidationError(_('The md5 value is empty'))
             else:
                 return False
-        if OCRedFile.objects.filter(md5=md5_value).exists():
+        kind = OCRedHash.objects.filter(md5=md5_value).values_list('kind', flat=True).first()
+        if kind == OCRedHash.KIND_FILE:
             if raise_exception:
                 raise Md5DuplicationError(md5_value)
             else:
                 return False
-        if OCRedFile.objects.filter(ocred_pdf_md5=md5_value).exists():
+        if kind == OCRedHash.KIND_PDF:
             if raise_exception:
                 raise Md5PdfDuplicationError(md5_value)
             else:
@@ -196,28 +301,33 @@ class OCRedFile(models.Model):
         """
         This function removes self.file.sile from a disk if it exists,
         renames self.file.name to 'file_removed' and then saves the model instance
-        :return: None
+        :return: boolean True
         """
         self.is_saved()  # checking that instance of OCRedFile is saved, raise DoesNotSaved exception otherwise
         if os.path.isfile(self.file.path):
             os.remove(self.file.path)
         self.file.name = getattr(settings, 'OCR_FILE_REMOVED_LABEL', ocr_default_settings.FILE_REMOVED_LABEL)
-        OCRedFile.Counters.num_removed_files += 1
         super(OCRedFile, self).save()
+        self.invalidate_cache()
+        metrics.inc('ocr_stored_files_removed_total', kind='file')
+        return True
 
     def remove_pdf(self):
         """
         This function removes self.pdf.file from a disk if it exists,
         renames self.pdf.name to 'pdf_removed' and then saves the model instance
-        :return: None
+        :return: boolean True if the searchable PDF was removed
         """
         self.is_saved()  # checking that instance of OCRedFile is saved, raise DoesNotSaved exception otherwise
-        if self.ocred_pdf:
-            if os.path.isfile(self.ocred_pdf.path):
-                os.remove(self.ocred_pdf.path)
-            self.ocred_pdf.name = getattr(settings, 'OCR_PDF_REMOVED_LABEL', ocr_default_settings.PDF_REMOVED_LABEL)
-            OCRedFile.Counters.num_removed_pdf += 1
-            super(OCRedFile, self).save()
+        if not self.ocred_pdf:
+            return False
+        if os.path.isfile(self.ocred_pdf.path):
+            os.remove(self.ocred_pdf.path)
+        self.ocred_pdf.name = getattr(settings, 'OCR_PDF_REMOVED_LABEL', ocr_default_settings.PDF_REMOVED_LABEL)
+        super(OCRedFile, self).save()
+        self.invalidate_cache()
+        metrics.inc('ocr_stored_files_removed_total', kind='pdf')
+        return True
 
     @property
     def is_pdf(self):
@@ -241,6 +351,17 @@ class OCRedFile(models.Model):
             return True
         return False
 
+    @property
+    def has_text(self):
+        """
+        This function returns True if the OCRed content is not empty,
+        the end of the last page is read from the index of pages, so a deferred text is not loaded
+        :return: boolean True if self.text is not empty
+        """
+        if self.text_page_offsets:
+            return int(self.text_page_offsets.rsplit(',', 1)[-1]) > 0
+        return bool(self.text)
+
     @property
     def can_create_pdf(self):
         """
@@ -255,7 +376,7 @@ class OCRedFile(models.Model):
             # OCRedPDF does not exits
             # or it was removed
             # or it's storing was disabled
-            if (not self.is_pdf or not self.has_pdf_text) and len(self.text):
+            if (not self.is_pdf or not self.has_pdf_text) and self.has_text:
                 # OCRedFile.file is an image or it is pdf without text
                 # and the result of ocring is not empty
                 return True
@@ -287,39 +408,221 @@ class OCRedFile(models.Model):
                                    'filename': os.path.basename(self.ocred_pdf.path)})
         return None
 
+    @property
+    def has_hocr(self):
+        """
+        This function returns True if hOCR of the OCRed image is stored
+        :return: boolean True if hOCR of the OCRed image is stored
+        """
+        self.is_saved()  # checking that instance of OCRedFile is saved, raise DoesNotSaved exception otherwise
+        if self.ocred_hocr:
+            if os.path.isfile(self.ocred_hocr.path):
+                return True
+        return False
+
+    def set_text_pages(self, pages_text, separator='\f'):
+        """
+        This function sets self.text from texts of pages and self.text_page_offsets, the index of pages in self.text
+        :param pages_text: a list of texts of pages
+        :param separator: a separator of pages in self.text
+        :return: None
+        """
+        self.text = separator.join(pages_text)
+        self.text_page_offsets = ','.join(str(offset) for offset in text_page_offsets(pages_text, separator))
+
+    def get_text_page_offsets(self):
+        """
+        This function returns offsets of the ends of pages in self.text
+        :return: a list of offsets
+        """
+        if self.text_page_offsets:
+            return [int(offset) for offset in self.text_page_offsets.split(',')]
+        # the index does not exist, pages are separated by the form feed in the text OCRed by tesseract or OCRmyPDF
+        return text_page_offsets(split_text_pages(self.text or ''), '\f')
+
+    @property
+    def text_num_pages(self):
+        """
+        This function returns the number of pages of self.text
+        :return: the number of pages of self.text
+        """
+        return len(self.get_text_page_offsets())
+
+    def get_text_pages(self, first, last=None):
+        """
+        This function returns texts of pages from first to last of self.text,
+        only this part of self.text is read from the database if self.text was deferred
+        :param first: the number of the first page, starting from 1
+        :param last: the number of the last page, the first page by default
+        :return: a list of texts of pages
+        """
+        self.is_saved()  # checking that instance of OCRedFile is saved, raise DoesNotSaved exception otherwise
+        offsets = self.get_text_page_offsets()
+        if last is None:
+            last = first
+        if first < 1 or last < first or last > len(offsets):
+            raise PageRangeError('{}-{}'.format(first, last), len(offsets))
+        start = offsets[first - 2] if first > 1 else 0
+        end = offsets[last - 1]
+        base = 0  # the offset of text in self.text
+        text = None
+        if 'text' in self.get_deferred_fields():
+            pages_text, marker = OCRedFile.objects.filter(pk=self.pk)\
+                .annotate(pages_text=Substr('text', start + 1, end - start, output_field=models.TextField()),
+                          marker=Substr('text', 1, MARKER_LENGTH, output_field=models.TextField()))\
+                .values_list('pages_text', 'marker')[0]
+            if not is_compressed_text(marker):
+                text = pages_text or ''
+                base = start
+        if text is None:
+            # the text is loaded entirely, a compressed text can not be sliced by the database
+            text = self.text or ''
+        starts = [start] + offsets[first - 1:last - 1]
+        return [text[page_start - base:page_end - base].rstrip('\f')
+                for page_start, page_end in zip(starts, offsets[first - 1:last])]
+
+    def stage(self, name, size=0):
+        """
+        This function returns the context manager measuring the stage of the processing of the file
+        :param name: the name of the stage, see ocr.stages.STAGES
+        :param size: processed bytes
+        :return: the context manager of the with statement
+        """
+        if self.stage_timer is None:
+            self.stage_timer = StageTimer()
+        return self.stage_timer.stage(name, size)
+
+    def prepare_image(self, content):
+        """
+        This function returns the image preprocessed for tesseract if OCR_PREPROCESS is enabled,
+        seconds of stages of the preprocessing are kept in self.preprocess_timings
+        :param content: the image as bytes
+        :return: the image as bytes
+        """
+        if not getattr(settings, 'OCR_PREPROCESS', ocr_default_settings.PREPROCESS):
+            return content
+        with self.stage('preprocess', len(content)):
+            content, timings = preprocess_image(content)
+        if self.preprocess_timings is None:
+            self.preprocess_timings = {}
+        for stage, seconds in timings.items():
+            # seconds of frames of a multi-frame image are summed
+            self.preprocess_timings[stage] = self.preprocess_timings.get(stage, 0) + seconds
+        return content
+
+    def ocr_image(self, content, configs):
+        """
+        This function recognizes the image by tesseract,
+        frames of a multi-page TIFF are recognized concurrently and their searchable PDFs are merged
+        :param content: the image as bytes
+        :param configs: tesseract output configs e.g. ('txt', 'pdf', 'hocr'), hOCR is not created for a multi-page TIFF
+        :return: {config: output}, texts of pages are separated by the form feed
+        """
+        self.preprocess_timings = None
+        frames = image_frames(content) if 'tiff' in self.file_type else []
+        if frames:
+            frames = [self.prepare_image(frame) for frame in frames]
+            lang = self.choose_lang(image=frames[0])
+            with self.stage('ocr', sum(len(frame) for frame in frames)):
+                return ocr_img_frames(frames, configs, lang=lang)
+        content = self.prepare_image(content)
+        lang = self.choose_lang(image=content)
+        with self.stage('ocr', len(content)):
+            return ocr_img2outputs(content, configs, lang)
+
+    def choose_lang(self, image=None, pages_text=None, need_ocr=None, pdf=None):
+        """
+        This function chooses languages of tesseract and records them in self.lang, also if OCR is not needed.
+        Languages requested by upload/ or OCR_DEFAULT_LANG are used as is,
+        'auto' is replaced by languages of the detected script: by tesseract OSD of the image,
+        by the text of pages of the PDF which have the text, otherwise by the text of the first page which needs OCR.
+        OCR_TESSERACT_LANG is used if the script is not detected.
+        :param image: the prepared image as bytes
+        :param pages_text: a list of texts of pages of the PDF
+        :param need_ocr: a list of booleans, True for each page of the PDF that needs to be OCRed
+        :param pdf: the PDF as bytes or PyPDF2.PdfFileReader
+        :return: languages of tesseract e.g. 'rus'
+        """
+        lang = self.lang or getattr(settings, 'OCR_DEFAULT_LANG', ocr_default_settings.DEFAULT_LANG)
+        if lang == OCRedFile.LANG_AUTO:
+            if image is not None:
+                lang = detect_image_lang(image)
+            else:
+                lang = detect_text_lang(''.join(text for text, need in zip(pages_text, need_ocr) if not need))
+                if not lang and True in need_ocr:
+                    # the sample page is recognized with all languages, it is cheaper than all pages
+                    lang = detect_text_lang(pdf_sample_text(pdf, need_ocr.index(True)))
+        self.lang = tesseract_lang(lang)
+        return self.lang
+
+    def invalidate_cache(self):
+        """
+        This function removes the serialized OCRedFile from the cache of the <md5:md5>/ API view
+        :return: None
+        """
+        md5_cache.invalidate(self.md5, self.ocred_pdf_md5)
+
+    def save_pdf_hash(self):
+        """
+        This function adds self.ocred_pdf_md5 to OCRedHash or replaces the md5 of the previous searchable PDF
+        :return: None
+        """
+        if not OCRedHash.objects.filter(ocred_file=self, kind=OCRedHash.KIND_PDF).update(md5=self.ocred_pdf_md5):
+            OCRedHash.objects.create(md5=self.ocred_pdf_md5, kind=OCRedHash.KIND_PDF, ocred_file=self)
+
     def create_pdf(self, admin_obj=None, request=None):
         """
         This function creates self.pdf.file if it is possible 2019-03-13
         :admin_obj: An admin instance of the model
         :request: A request instance of the current http request
-        :return: None
+        :return: boolean True if the searchable PDF was created
         """
         self.is_saved()  # checking that instance of OCRedFile is saved, raise DoesNotSaved exception otherwise
         if self.can_create_pdf:
             content = self.file.file.read()
             self.file.file.seek(0)
+            self.invalidate_cache()  # the previous ocred_pdf_md5 will be replaced
             if 'image' in self.file_type:
-                pdf_content = ocr_img2pdf(content)
+                if self.has_hocr:
+                    # reuse the stored result of OCR, it is the result of OCR of the prepared image
+                    pdf_content = hocr2pdf(read_binary_file(self.ocred_hocr.path).decode(), self.prepare_image(content))
+                else:
+                    pdf_content = self.ocr_image(content, ('pdf', )).get('pdf', b'')
                 filename = set_pdffile_name(self, True)
+                ensure_folder(filename)
                 pdf = open(filename, 'wb')
-                pdf.write(content)
+                pdf.write(pdf_content)
                 pdf.close()
                 self.ocred_pdf.name = filename
                 self.ocred_pdf_md5 = md5(pdf_content)
-                OCRedFile.Counters.num_created_pdf += 1
+                self.save_pdf_hash()
                 if admin_obj and request:
                     admin_obj.message_user(request,
                                            'PDF created')
             elif 'pdf' in self.file_type:
                 filename = set_pdffile_name(self, True)
-                ocr_pdf(content, filename)
+                ensure_folder(filename)
+                pages_text = pdf2pages(content)
+                need_ocr = pdf_pages_need_ocr(pages_text)
+                lang = self.choose_lang(pages_text=pages_text, need_ocr=need_ocr, pdf=content)
+                with self.stage('ocr', len(content)):
+                    if all(need_ocr):
+                        ocr_pdf(content, filename, lang=lang)
+                    else:
+                        ocr_pdf_pages(content, filename, need_ocr, lang=lang)
                 self.ocred_pdf.name = filename
                 self.ocred_pdf_md5 = md5(read_binary_file(filename))
-                OCRedFile.Counters.num_created_pdf += 1
+                self.save_pdf_hash()
                 if admin_obj and request:
                     admin_obj.message_user(request,
                                            'PDF created')
+            else:
+                return False
             super(OCRedFile, self).save()
+            self.invalidate_cache()
+            metrics.inc('ocr_pdfs_created_total')
+            return True
+        return False
 
     def __str__(self):
         if getattr(settings, 'OCR_STORE_FILES_DISABLED_LABEL', ocr_default_settings.STORE_FILES_DISABLED_LABEL) in self.file.name:
@@ -331,6 +634,10 @@ class OCRedFile(models.Model):
     class Meta:
         verbose_name = 'OCRedFile'
         verbose_name_plural = 'OCRedFiles'
+        indexes = [
+            # the order of the list/ api view, it is used by the keyset pagination
+            models.Index(fields=['-uploaded', '-id'], name='ocr_ocredfile_listing'),
+        ]
 
     def delete(self, *args, **kwargs):
         """
@@ -342,17 +649,23 @@ class OCRedFile(models.Model):
         self.is_saved()  # checking that instance of OCRedFile is saved, raise DoesNotSaved exception otherwise
         self.remove_file()
         self.remove_pdf()
-        OCRedFile.Counters.num_removed_instances += 1
+        if self.has_hocr:
+            os.remove(self.ocred_hocr.path)
+        if self.text:
+            unindex(self.pk, self.get_text_pages(1, self.text_num_pages))
+        self.invalidate_cache()
         super(OCRedFile, self).delete(*args, **kwargs)
+        metrics.inc('ocr_files_removed_total')
 
     def save(self, force_insert=False, force_update=False, using=None,
-             update_fields=None):
+             update_fields=None, md5_validated=False):
         """
         This function save the instance of the model, or create it
         :param force_insert:
         :param force_update:
         :param using:
         :param update_fields:
+        :param md5_validated: True if self.md5 was already validated by is_valid_ocr_md5
         :return: None
         """
         if self.is_saved(raise_exception=False):
@@ -360,28 +673,57 @@ class OCRedFile(models.Model):
         if not self.file_type:
             self.file_type = self.file.file.content_type
         OCRedFile.is_valid_file_type(file_type=self.file_type, raise_exception=True)
+        OCRedFile.is_valid_lang(self.lang, raise_exception=True)
         content = self.file.file.read()  # read content of the 'file' field
         self.file.file.seek(0)  # return the reading pointer of the 'file' file to start position
         # calculate md5 of 'file' field if if does not exist
         if not self.md5:
-            self.md5 = md5(content)
-        OCRedFile.is_valid_ocr_md5(md5_value=self.md5, raise_exception=True)
+            with self.stage('hash', len(content)):
+                self.md5 = md5(content)
+        if not md5_validated:
+            OCRedFile.is_valid_ocr_md5(md5_value=self.md5, raise_exception=True)
+        if self.file._committed and getattr(settings, 'OCR_STORE_FILES', ocr_default_settings.STORE_FILES):
+            # the file was stored before its md5 was known, it is moved to the content-addressed name
+            name = set_ocredfile_name(self, os.path.basename(self.file.name))
+            if name != self.file.name and link_stored_file(self.file.name, name):
+                if os.path.isfile(self.file.path):
+                    os.remove(self.file.path)
+                self.file.name = name
         # extract of ocr a content of the 'file' field if 'text' does not exist
         if not self.text:
             print('OCRedFile->save start OCR')
             if 'image' in self.file_type:
-                pdf_content = ocr_img2pdf(content)
-                self.text = pdf2text(pdf_content)
+                # one pass of tesseract produces the text, the searchable pdf if it is stored and hOCR if it is stored
+                store_pdf = getattr(settings, 'OCR_STORE_PDF', ocr_default_settings.STORE_PDF)
+                configs = ['txt']
+                if store_pdf:
+                    configs.append('pdf')
+                if getattr(settings, 'OCR_STORE_HOCR', ocr_default_settings.STORE_HOCR):
+                    configs.append('hocr')
+                outputs = self.ocr_image(content, configs)
+                text = outputs.get('txt', '')
+                if not text.strip():
+                    text = ''  # tesseract outputs only whitespaces for an image without text
+                self.set_text_pages(split_text_pages(text))
                 if len(self.text):
                     # create ocred_pdf only for an image that contains a text
-                    self.ocred_pdf_md5 = md5(pdf_content)
-                    if getattr(settings, 'OCR_STORE_PDF', ocr_default_settings.STORE_PDF):
-                        self.ocred_pdf.save(set_pdffile_name(self), BytesIO(pdf_content), False)
-                    else:
-                        self.ocred_pdf.name = set_pdffile_name(self)
+                    with self.stage('storage', len(outputs.get('pdf', b'')) if store_pdf else 0):
+                        if store_pdf:
+                            pdf_content = outputs.get('pdf', b'')
+                            self.ocred_pdf_md5 = md5(pdf_content)
+                            self.ocred_pdf.save(set_pdffile_name(self), BytesIO(pdf_content), False)
+                        else:
+                            # text only, the searchable pdf will be created by create_pdf on demand
+                            self.ocred_pdf.name = set_pdffile_name(self)
+                        if 'hocr' in outputs:
+                            self.ocred_hocr.save(set_hocrfile_name(self), ContentFile(outputs['hocr'].encode()),
+                                                 False)
                 self.ocred = timezone.now()
             elif 'pdf' in self.file_type:
-                info = pdf_info(content)
+                # the uploaded PDF is parsed once, metadata, pages text and the opened document are reused below
+                with self.stage('pdf_parse', len(content)):
+                    analysis = pdf_analyze(content)
+                info = analysis['info']
                 self.pdf_num_pages = info['numPages']
                 self.pdf_author = info['Author']
                 if info['CreationDate']:
@@ -391,14 +733,28 @@ class OCRedFile(models.Model):
                     self.pdf_mod_date = info['ModDate']
                 self.pdf_producer = info['Producer']
                 self.pdf_title = info['Title']
-                pdf_text = pdf2text(content)
-                # check that loaded PDF file contains text
-                if pdf_need_ocr(pdf_text):
-                    print('OCRedFile PDF OCR processing via OCRmyPDF')
+                pages_text = analysis['pages_text']
+                # check which pages of loaded PDF file contain text
+                need_ocr = pdf_pages_need_ocr(pages_text)
+                if any(need_ocr):
                     filename = set_pdffile_name(self)
-                    self.text = ocr_pdf(content, filename)
+                    ensure_folder(filename)
+                    lang = self.choose_lang(pages_text=pages_text, need_ocr=need_ocr, pdf=analysis['pdf_reader'])
+                    with self.stage('ocr', len(content)):
+                        if all(need_ocr):
+                            print('OCRedFile PDF OCR processing via OCRmyPDF')
+                            self.set_text_pages(split_text_pages(ocr_pdf(content, filename,
+                                                                         pdf_reader=analysis['pdf_reader'],
+                                                                         lang=lang)))
+                        else:
+                            # keep the text of pages that have it, OCR only image-only pages
+                            print('OCRedFile PDF OCR processing of image-only pages via OCRmyPDF')
+                            ocred_texts = iter(ocr_pdf_pages(content, filename, need_ocr,
+                                                             pdf_reader=analysis['pdf_reader'], lang=lang))
+                            self.set_text_pages([next(ocred_texts) if need else page_text
+                                                 for page_text, need in zip(pages_text, need_ocr)])
                     self.ocred = timezone.now()  # save datetime when uploaded PDF was ocred
-                    if len(self.text):
+                    if len(self.text) and os.path.isfile(filename):
                         # create ocred_pdf only for a pdf file that contains images with text
                         self.ocred_pdf.name = filename
                         self.ocred_pdf_md5 = md5(read_binary_file(filename))
@@ -412,70 +768,291 @@ class OCRedFile(models.Model):
                     print('OCRedFile PDF OCR finished')
                 else:
                     print('OCRedFile->save use text from loaded pdf')
-                    self.text = pdf_text
+                    self.choose_lang(pages_text=pages_text, need_ocr=need_ocr)  # 'auto' is detected by the text
+                    self.set_text_pages(pages_text, '')
             print('OCRedFile->save finished OCR: ')
-        super(OCRedFile, self).save(force_insert=False, force_update=False, using=None, update_fields=None)
+        try:
+            # the uploaded file is written by saving the row
+            with self.stage('storage', len(content)), transaction.atomic():
+                super(OCRedFile, self).save(force_insert=False, force_update=False, using=None, update_fields=None)
+                hashes = [OCRedHash(md5=self.md5, kind=OCRedHash.KIND_FILE, ocred_file=self)]
+                if self.ocred_pdf_md5:
+                    hashes.append(OCRedHash(md5=self.ocred_pdf_md5, kind=OCRedHash.KIND_PDF, ocred_file=self))
+                OCRedHash.objects.bulk_create(hashes)
+        except IntegrityError:
+            # the same file was saved concurrently after is_valid_ocr_md5
+            self.pk = None
+            self.uploaded = None
+            raise Md5DuplicationError(self.md5)
+        if self.text:
+            with self.stage('index', len(self.text.encode())):
+                index_pages(self.pk, self.get_text_pages(1, self.text_num_pages))
         if not getattr(settings, 'OCR_STORE_FILES', ocr_default_settings.STORE_FILES):
             os.remove(self.file.path)
-        OCRedFile.Counters.num_created_instances += 1
+        if self.stage_timer is not None:
+            # the storage and index stages are measured after the row is inserted
+            self.stage_timings = self.stage_timer.dumps()
+            self.updated = timezone.now()
+            OCRedFile.objects.filter(pk=self.pk).update(stage_timings=self.stage_timings, updated=self.updated)
+        metrics.inc('ocr_files_created_total', file_type=self.file_type)
+
+    @staticmethod
+    def bulk_delete(queryset=None, chunk_size=None, threads=None):
+        """
+        Removes OCRedFiles of the queryset like OCRedFile.delete() does, but chunk by chunk:
+        each chunk is removed from the database by set-based DELETEs in one transaction,
+        then files of the chunk are removed from a disk by a pool of threads.
+        Files are removed after the database, so an interruption leaves only files which cleanup() removes.
+        :param queryset: a queryset of OCRedFiles, all OCRedFiles by default
+        :param chunk_size: the number of OCRedFiles in a chunk, OCR_BULK_DELETE_CHUNK_SIZE by default
+        :param threads: the number of threads which remove files, OCR_BULK_DELETE_THREADS by default
+        :return: dict {'count': removed OCRedFiles, 'files': removed files, 'seconds', 'rows_per_second'}
+        """
+        if queryset is None:
+            queryset = OCRedFile.objects.all()
+        if chunk_size is None:
+            chunk_size = getattr(settings, 'OCR_BULK_DELETE_CHUNK_SIZE', ocr_default_settings.BULK_DELETE_CHUNK_SIZE)
+        started = time.monotonic()
+        count = 0
+        files = 0
+        last_pk = 0
+        while True:
+            rows = list(queryset.filter(pk__gt=last_pk).order_by('pk')
+                        .values_list('pk', 'md5', 'file', 'ocred_pdf', 'ocred_pdf_md5', 'ocred_hocr')[:chunk_size])
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            pks = [row[0] for row in rows]
+            with transaction.atomic():
+                if is_search_enabled():
+                    # the contentless index removes words of pages given by texts
+                    indexed = OCRedFile.objects.filter(pk__in=pks).exclude(text__isnull=True).exclude(text='')\
+                        .only('id', 'text', 'text_page_offsets')
+                    unindex_many((ocred_file.pk, ocred_file.get_text_pages(1, ocred_file.text_num_pages))
+                                 for ocred_file in indexed)
+                OCRJob.objects.filter(ocred_file_id__in=pks).update(ocred_file=None)
+                OCRedHash.objects.filter(ocred_file_id__in=pks).delete()
+                OCRedFile.objects.filter(pk__in=pks).only('pk').delete()
+            for row in rows:
+                md5_cache.invalidate(row[1], row[4])
+            files += remove_stored_files([name for row in rows for name in row[2:4] + row[5:]], threads)
+            count += len(rows)
+            # the same metrics as OCRedFile.delete() counts
+            metrics.inc('ocr_files_removed_total', len(rows))
+            metrics.inc('ocr_stored_files_removed_total', len(rows), kind='file')
+            metrics.inc('ocr_stored_files_removed_total', sum(1 for row in rows if row[3]), kind='pdf')
+        seconds = time.monotonic() - started
+        return {
+            'count': count,
+            'files': files,
+            'seconds': seconds,
+            'rows_per_second': count / seconds if seconds else None,
+        }
 
-    class Counters:
+    @staticmethod
+    def search(query, limit=None, offset=0):
         """
-        Counters of events 2019-03-25
+        Searches pages of OCRedFiles which contain all words of the query, the best matches go first
+        :param query: words to search
+        :param limit: the maximum number of found pages, OCR_SEARCH_LIMIT by default
+        :param offset: the number of skipped found pages
+        :return: a list of dicts {'md5', 'page', 'score', 'snippet'}
         """
-        num_removed_instances = 0  # number of removed instances of OCRedFile
-        num_removed_files = 0  # number of removed files from instances of OCRedFile
-        num_removed_pdf = 0  # number of removed ocred_pdfs from instances of OCRedFile
-        num_created_pdf = 0  # number of created ocred_pdfs in instances of OCRedFile
-        num_created_instances = 0  # number of created instances of OCRedFile
+        if limit is None:
+            limit = getattr(settings, 'OCR_SEARCH_LIMIT', ocr_default_settings.SEARCH_LIMIT)
+        found = search_pages(query, limit, offset)
+        highlight = getattr(settings, 'OCR_SEARCH_HIGHLIGHT', ocr_default_settings.SEARCH_HIGHLIGHT)
+        tokens = getattr(settings, 'OCR_SEARCH_SNIPPET_TOKENS', ocr_default_settings.SEARCH_SNIPPET_TOKENS)
+        # the index keeps no texts, snippets are made of texts of found OCRedFiles read by one query
+        ocred_files = OCRedFile.objects.filter(pk__in={page['id'] for page in found})\
+            .only('id', 'md5', 'text', 'text_page_offsets').in_bulk()
+        return [{'md5': ocred_files[page['id']].md5, 'page': page['page'], 'score': page['score'],
+                 'snippet': make_snippet(ocred_files[page['id']].get_text_pages(page['page'])[0], query.split(),
+                                         highlight, tokens)}
+                for page in found if page['id'] in ocred_files]
 
     @staticmethod
-    def cleanup():
-        """
-        Removes 'files' and 'ocred_pdfs' that are not related with any the OCRedFile 2019-04-13
-        :return: dict {'removed_files': [removed_files tuple], 'removed_pdf': [removed_pdf tuple]}
-        """
-        def remove_files(folder, files):
-            """
-            Removes all files in the 'folder' exclude 'files'
-            :param folder: the path to the folder in which will be files removed
-            :param files: files that will be excluded from removing
-            :return: the list of path of removed files
-            """
-            removed = []
-            for r, d, f in os.walk(folder):
-                for file in f:
-                    path = os.path.join(r, file)
-                    if path not in files:
-                        os.remove(path)
-                        removed.append(path)
-            return removed
-
-        files = tuple(OCRedFile.objects
-                      .exclude(
-                               file__in=getattr(settings,
-                                                'OCR_STORE_FILES_DISABLED_LABEL',
-                                                ocr_default_settings.STORE_FILES_DISABLED_LABEL))
-                      .exclude(
-                               file__in=getattr(settings,
-                                                'OCR_FILE_REMOVED_LABEL',
-                                                ocr_default_settings.FILE_REMOVED_LABEL))
-                      .values_list('file', flat=True))
-        removed_files = remove_files(getattr(settings, 'OCR_FILES_UPLOAD_TO', ocr_default_settings.FILES_UPLOAD_TO),
-                                     files)
-        pdfs = tuple(OCRedFile.objects
-                     .exclude(ocred_pdf__isnull=True)
-                     .exclude(
-                              ocred_pdf__in=getattr(settings,
-                                                    'OCR_STORE_PDF_DISABLED_LABEL',
-                                                    ocr_default_settings.STORE_PDF_DISABLED_LABEL))
-                     .exclude(
-                              ocred_pdf__in=getattr(settings,
-                                                    'OCR_PDF_REMOVED_LABEL',
-                                                    ocr_default_settings.PDF_REMOVED_LABEL))
-                     .values_list('ocred_pdf', flat=True))
-        removed_pdfs = remove_files(getattr(settings, 'OCR_PDF_UPLOAD_TO', ocr_default_settings.PDF_UPLOAD_TO), pdfs)
-        return removed_files, removed_pdfs
+    def stage_stats(stages=None, percents=(50, 95), queryset=None):
+        """
+        Aggregates stage_timings of OCRedFiles grouped by the content type and the number of pages
+        :param stages: names of aggregated stages, all stages by default
+        :param percents: percentiles of wall and CPU seconds
+        :param queryset: OCRedFiles to aggregate, all OCRedFiles by default
+        :return: a list of dicts {'file_type', 'pages', 'stage', 'count', 'bytes', 'wall_p50', 'cpu_p50', ...}
+        """
+        if queryset is None:
+            queryset = OCRedFile.objects.all()
+        rows = queryset.filter(stage_timings__isnull=False)\
+            .values_list('file_type', 'pdf_num_pages', 'text_page_offsets', 'stage_timings').iterator()
+        # an image has no pdf_num_pages, its pages are the frames of a multi-page TIFF
+        return stage_percentiles(((file_type, pdf_num_pages or len((offsets or '').split(',')), timings)
+                                  for file_type, pdf_num_pages, offsets, timings in rows), stages, percents)
+
+    @staticmethod
+    def encode_cursor(uploaded, pk):
+        """
+        Returns the cursor of the keyset pagination which points to the OCRedFile
+        :param uploaded: OCRedFile.uploaded
+        :param pk: OCRedFile.id
+        :return: the cursor, an url safe string
+        """
+        return base64.urlsafe_b64encode('{}|{}'.format(uploaded.isoformat(), pk).encode()).decode()
+
+    @staticmethod
+    def listing(cursor=None):
+        """
+        Returns OCRedFiles ordered by (-uploaded, -id) which follow the OCRedFile pointed by the cursor.
+        The query uses the ocr_ocredfile_listing index, so any page costs the same as the first one.
+        :param cursor: the cursor returned by encode_cursor or None for the first page
+        :return: QuerySet of OCRedFiles
+        """
+        queryset = OCRedFile.objects.order_by('-uploaded', '-id')
+        if cursor:
+            try:
+                uploaded, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+                uploaded, pk = parse_datetime(uploaded), int(pk)
+            except ValueError:
+                raise CursorError(cursor)
+            if uploaded is None:
+                raise CursorError(cursor)
+            queryset = queryset.filter(Q(uploaded__lt=uploaded) | Q(uploaded=uploaded, id__lt=pk))
+        return queryset
+
+    @staticmethod
+    def cleanup(dry_run=False, rate=None, min_age=None, report_limit=None):
+        """
+        Removes 'files', 'ocred_pdfs' and hOCRs that are not related with any the OCRedFile 2019-04-13.
+        Folders are scanned by streaming os.scandir, each file is checked against a set of absolute paths
+        of files of OCRedFiles, so the cost is linear in the number of files and rows.
+        :param dry_run: if True orphans are only reported
+        :param rate: the maximum number of removed files per second, OCR_CLEAN_RATE by default, 0 - no limit
+        :param min_age: seconds, files modified later are skipped, OCR_CLEAN_MIN_AGE by default
+        :param report_limit: the maximum number of paths of orphans reported for each folder,
+            OCR_CLEAN_REPORT_LIMIT by default
+        :return: dict {'files': report, 'pdf': report, 'hocr': report}, see reconcile()
+        """
+        if rate is None:
+            rate = getattr(settings, 'OCR_CLEAN_RATE', ocr_default_settings.CLEAN_RATE)
+        if min_age is None:
+            min_age = getattr(settings, 'OCR_CLEAN_MIN_AGE', ocr_default_settings.CLEAN_MIN_AGE)
+        if report_limit is None:
+            report_limit = getattr(settings, 'OCR_CLEAN_REPORT_LIMIT', ocr_default_settings.CLEAN_REPORT_LIMIT)
+        storage = OCRedFile._meta.get_field('file').storage
+        reports = {}
+        for name, field, upload_to in (
+                ('files', 'file', getattr(settings, 'OCR_FILES_UPLOAD_TO', ocr_default_settings.FILES_UPLOAD_TO)),
+                ('pdf', 'ocred_pdf', getattr(settings, 'OCR_PDF_UPLOAD_TO', ocr_default_settings.PDF_UPLOAD_TO)),
+                ('hocr', 'ocred_hocr', getattr(settings, 'OCR_HOCR_UPLOAD_TO', ocr_default_settings.HOCR_UPLOAD_TO)),
+        ):
+            folder = os.path.normpath(storage.path(upload_to))
+            known_paths = set()
+            names = OCRedFile.objects.exclude(**{field + '__isnull': True}).exclude(**{field: ''})\
+                .values_list(field, flat=True).iterator(chunk_size=10000)
+            for file_name in names:
+                known_paths.add(os.path.normpath(storage.path(file_name)))
+            reports[name] = reconcile(folder, known_paths, dry_run, rate, min_age, report_limit)
+        return reports
+
+    @staticmethod
+    def bulk_remove_files(pks, field='file', threads=None):
+        """
+        Removes files of OCRedFile.file or OCRedFile.ocred_pdf of OCRedFiles like remove_file() or remove_pdf() do,
+        but names of the field are replaced by one UPDATE and files are removed from a disk by a pool of threads
+        :param pks: ids of OCRedFiles
+        :param field: 'file' or 'ocred_pdf'
+        :param threads: the number of threads which remove files, OCR_BULK_DELETE_THREADS by default
+        :return: the number of OCRedFiles whose files were removed
+        """
+        if field == 'file':
+            label = getattr(settings, 'OCR_FILE_REMOVED_LABEL', ocr_default_settings.FILE_REMOVED_LABEL)
+        else:
+            label = getattr(settings, 'OCR_PDF_REMOVED_LABEL', ocr_default_settings.PDF_REMOVED_LABEL)
+        rows = list(OCRedFile.objects.filter(pk__in=pks).values_list('md5', 'ocred_pdf_md5', field))
+        OCRedFile.objects.filter(pk__in=pks).update(**{field: label, 'updated': timezone.now()})
+        for row in rows:
+            md5_cache.invalidate(row[0], row[1])
+        remove_stored_files([row[2] for row in rows], threads)
+        metrics.inc('ocr_stored_files_removed_total', len(rows), kind='file' if field == 'file' else 'pdf')
+        return len(rows)
+
+    @staticmethod
+    def ttl_sweep(time_budget=None, batch_size=None):
+        """
+        Removes OCRedFiles, OCRedFile.files and OCRedFile.ocred_pdfs whose TTL is expired like ttl() does,
+        but batch by batch in the order of the index of OCRedFile.uploaded until the time budget is spent.
+        Rows whose file or ocred_pdf is already removed (or was not stored) are skipped.
+        The stages which remove files and searchable PDFs keep their cursors in TtlSweep,
+        so the next call continues an interrupted sweep from the row where it stopped,
+        a new sweep starts from the oldest row, e.g. a searchable PDF created again after the previous sweep expires.
+        Progress of the current sweep and its lag are saved in TtlSweep after each batch.
+        :param time_budget: seconds, the sweep stops after the batch which exceeds it, None - no limit
+        :param batch_size: the number of OCRedFiles in a batch, OCR_TTL_BATCH_SIZE by default
+        :return: dict {'removed', 'files_removed', 'pdf_removed', 'complete': False if the time budget was spent,
+                       'lag': seconds since the TTL of the oldest row which is still not processed was expired}
+        """
+        if batch_size is None:
+            batch_size = getattr(settings, 'OCR_TTL_BATCH_SIZE', ocr_default_settings.TTL_BATCH_SIZE)
+        deadline = time.monotonic() + time_budget if time_budget is not None else None
+        current_datetime = timezone.now()
+        sweep = TtlSweep.get()
+        if sweep.finished or not sweep.started:
+            # a new sweep, otherwise the interrupted sweep is continued
+            sweep.started = current_datetime
+            sweep.finished = None
+            sweep.removed = sweep.files_removed = sweep.pdf_removed = 0
+            sweep.file_cursor_uploaded = sweep.ocred_pdf_cursor_uploaded = None
+            sweep.file_cursor_id = sweep.ocred_pdf_cursor_id = 0
+        result = {'removed': 0, 'files_removed': 0, 'pdf_removed': 0, 'complete': True, 'lag': 0.0}
+        stages = (
+            # (counter, field, ttl, the label of the removed field, the label of the disabled field)
+            ('removed', None, getattr(settings, 'OCR_TTL', ocr_default_settings.TTL), None, None),
+            ('files_removed', 'file', getattr(settings, 'OCR_FILES_TTL', ocr_default_settings.FILES_TTL),
+             getattr(settings, 'OCR_FILE_REMOVED_LABEL', ocr_default_settings.FILE_REMOVED_LABEL),
+             getattr(settings, 'OCR_STORE_FILES_DISABLED_LABEL', ocr_default_settings.STORE_FILES_DISABLED_LABEL)),
+            ('pdf_removed', 'ocred_pdf', getattr(settings, 'OCR_PDF_TTL', ocr_default_settings.PDF_TTL),
+             getattr(settings, 'OCR_PDF_REMOVED_LABEL', ocr_default_settings.PDF_REMOVED_LABEL),
+             getattr(settings, 'OCR_STORE_PDF_DISABLED_LABEL', ocr_default_settings.STORE_PDF_DISABLED_LABEL)),
+        )
+        for counter, field, ttl, removed_label, disabled_label in stages:
+            if ttl == 0:
+                continue
+            expired = OCRedFile.objects.filter(uploaded__lt=current_datetime - ttl)
+            if field:
+                # skip rows already in the target state
+                expired = expired.exclude(**{field: removed_label})\
+                    .exclude(**{field + '__contains': disabled_label})\
+                    .exclude(**{field + '__isnull': True}).exclude(**{field: ''})
+            while True:
+                pending = expired
+                if field:
+                    cursor_uploaded = getattr(sweep, field + '_cursor_uploaded')
+                    if cursor_uploaded:
+                        pending = pending.filter(uploaded__gte=cursor_uploaded)\
+                            .exclude(uploaded=cursor_uploaded, pk__lte=getattr(sweep, field + '_cursor_id'))
+                if deadline is not None and time.monotonic() >= deadline:
+                    result['complete'] = False
+                    oldest = pending.order_by('uploaded', 'pk').values_list('uploaded', flat=True).first()
+                    if oldest:
+                        result['lag'] = max(result['lag'], (current_datetime - ttl - oldest).total_seconds())
+                    break
+                rows = list(pending.order_by('uploaded', 'pk').values_list('pk', 'uploaded')[:batch_size])
+                if not rows:
+                    break
+                pks = [row[0] for row in rows]
+                if field:
+                    count = OCRedFile.bulk_remove_files(pks, field)
+                    setattr(sweep, field + '_cursor_uploaded', rows[-1][1])
+                    setattr(sweep, field + '_cursor_id', rows[-1][0])
+                else:
+                    count = OCRedFile.bulk_delete(OCRedFile.objects.filter(pk__in=pks))['count']
+                result[counter] += count
+                setattr(sweep, counter, getattr(sweep, counter) + count)
+                sweep.save()
+        sweep.lag = result['lag']
+        if result['complete']:
+            sweep.finished = timezone.now()
+        sweep.save()
+        return result
 
     @staticmethod
     def ttl():
@@ -490,26 +1067,218 @@ class OCRedFile(models.Model):
              (NOTE: if OCR_PDF_TTL<0 all OCRedFile.ocred_pdfs will be removed, use only for tests). 2019-04-13
         :return: (removed OCRedFiles counter, removed OCRedFile.files counter, removed OCRedFile.ocred_pdfs counter)
         """
-        ttl = getattr(settings, 'OCR_TTL', ocr_default_settings.TTL)
-        files_ttl = getattr(settings, 'OCR_FILES_TTL', ocr_default_settings.FILES_TTL)
-        pdf_ttl = getattr(settings, 'OCR_PDF_TTL', ocr_default_settings.PDF_TTL)
-        current_datetime = timezone.now()
-        counter = 0
-        files_counter = 0
-        pdf_counter = 0
-        if ttl != 0:
-            removing_datetime = current_datetime - ttl
-            for ocred_file in OCRedFile.objects.filter(uploaded__lt=removing_datetime):
-                ocred_file.delete()
-                counter += 1
-        if files_ttl != 0:
-            files_removing_datetime = current_datetime - files_ttl
-            for ocred_file in OCRedFile.objects.filter(uploaded__lt=files_removing_datetime):
-                ocred_file.remove_file()
-                files_counter += 1
-        if pdf_ttl != 0:
-            pdf_removing_datetime = current_datetime - pdf_ttl
-            for ocred_file in OCRedFile.objects.filter(uploaded__lt=pdf_removing_datetime):
-                ocred_file.remove_pdf()
-                pdf_counter += 1
-        return counter, files_counter, pdf_counter
+        result = OCRedFile.ttl_sweep()
+        return result['removed'], result['files_removed'], result['pdf_removed']
+
+
+class Metric(models.Model):
+    """
+    The Metric model class. It stores the value of a series of metrics aggregated by all processes, see ocr/metrics.py
+    """
+    series = models.CharField('series', max_length=255, unique=True)
+    value = models.FloatField('value', default=0)
+
+    class Meta:
+        verbose_name = 'Metric'
+        verbose_name_plural = 'Metrics'
+
+    def __str__(self):
+        return '{} {}'.format(self.series, self.value)
+
+
+class TtlSweep(models.Model):
+    """
+    The TtlSweep model class. Its only instance stores the progress of the TTL sweeper:
+    counters and the lag of the current (or the last) sweep
+    and cursors of the stages which remove files and searchable PDFs.
+    """
+    started = models.DateTimeField('started datetime', blank=True, null=True)
+    updated = models.DateTimeField('updated datetime', auto_now=True)
+    finished = models.DateTimeField('finished datetime', blank=True, null=True)  # None while the sweep is not complete
+    removed = models.IntegerField('removed OCRedFiles', default=0)
+    files_removed = models.IntegerField('removed files', default=0)
+    pdf_removed = models.IntegerField('removed searchable PDFs', default=0)
+    lag = models.FloatField('lag, seconds', blank=True, null=True)
+    file_cursor_uploaded = models.DateTimeField('uploaded datetime of the last processed file', blank=True, null=True)
+    file_cursor_id = models.IntegerField('id of the last processed file', default=0)
+    ocred_pdf_cursor_uploaded = models.DateTimeField('uploaded datetime of the last processed searchable PDF',
+                                                     blank=True, null=True)
+    ocred_pdf_cursor_id = models.IntegerField('id of the last processed searchable PDF', default=0)
+
+    class Meta:
+        verbose_name = 'TtlSweep'
+        verbose_name_plural = 'TtlSweeps'
+
+    @staticmethod
+    def get():
+        """
+        Returns the only instance of TtlSweep, creates it if it does not exist
+        :return: TtlSweep
+        """
+        sweep, created = TtlSweep.objects.get_or_create(pk=1)
+        return sweep
+
+    @staticmethod
+    def reset():
+        """
+        Resets cursors of stages, the next sweep will process all rows whose TTL is expired
+        :return: None
+        """
+        TtlSweep.objects.filter(pk=1).update(file_cursor_uploaded=None, file_cursor_id=0,
+                                            ocred_pdf_cursor_uploaded=None, ocred_pdf_cursor_id=0)
+
+
+class OCRedHash(models.Model):
+    """
+    The OCRedHash model class. Maps every known md5, of an uploaded file or of its searchable PDF, to the OCRedFile,
+    so the OCRedFile is found by md5 or ocred_pdf_md5 with one query of the unique index.
+    """
+    KIND_FILE = 'file'
+    KIND_PDF = 'pdf'
+    KIND_CHOICES = (
+        (KIND_FILE, 'uploaded file'),
+        (KIND_PDF, 'searchable PDF'),
+    )
+
+    md5 = models.CharField('md5', max_length=32, unique=True)
+    kind = models.CharField('kind', max_length=4, choices=KIND_CHOICES)
+    ocred_file = models.ForeignKey(OCRedFile, verbose_name='OCRedFile', related_name='hashes',
+                                   on_delete=models.CASCADE)
+
+    class Meta:
+        verbose_name = 'OCRedHash'
+        verbose_name_plural = 'OCRedHashes'
+
+    def __str__(self):
+        return '{} {} {}'.format(self.md5, self.kind, self.ocred_file_id)
+
+
+class OCRJob(models.Model):
+    """
+    The OCRJob model class. Stores a file uploaded when OCR_ASYNC is True until an ocr_worker process OCRs it.
+    Timestamps of each stage (queued, started, finished) are stored
+    to size web workers and OCR workers separately.
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_QUEUED, 'queued'),
+        (STATUS_RUNNING, 'running'),
+        (STATUS_DONE, 'done'),
+        (STATUS_FAILED, 'failed'),
+    )
+
+    md5 = models.CharField('md5', max_length=32, db_index=True)
+    file = models.FileField('uploaded file', upload_to=set_jobfile_name, null=True)
+    file_type = models.CharField('content type', max_length=20)
+    lang = models.CharField('languages', max_length=64, blank=True, default='')
+    status = models.CharField('status', max_length=8, choices=STATUS_CHOICES, default=STATUS_QUEUED, db_index=True)
+    error = models.TextField('error', blank=True, null=True)
+    ocred_file = models.ForeignKey(OCRedFile, verbose_name='OCRedFile', related_name='jobs',
+                                   on_delete=models.SET_NULL, null=True, blank=True)
+    queued = models.DateTimeField('queued datetime', auto_now_add=True)
+    started = models.DateTimeField('started datetime', blank=True, null=True)
+    finished = models.DateTimeField('finished datetime', blank=True, null=True)
+
+    class Meta:
+        verbose_name = 'OCRJob'
+        verbose_name_plural = 'OCRJobs'
+
+    def __str__(self):
+        return 'OCRJob ' + str(self.pk) + ' "' + str(self.md5) + '" ' + self.status
+
+    @staticmethod
+    def enqueue(file, md5_value, lang=''):
+        """
+        Stores the uploaded file as a new OCRJob,
+        or returns the OCRJob that is already queued or running for the same md5
+        :param file: an uploaded file
+        :param md5_value: the md5 of the uploaded file
+        :param lang: requested languages of tesseract, see OCRedFile.lang
+        :return: an instance of OCRJob
+        """
+        job = OCRJob.objects\
+            .filter(md5=md5_value, status__in=(OCRJob.STATUS_QUEUED, OCRJob.STATUS_RUNNING))\
+            .first()
+        if job:
+            return job
+        job = OCRJob(md5=md5_value, file_type=file.content_type, lang=lang)
+        job.file.save(os.path.basename(file.name), file, False)
+        job.save()
+        return job
+
+    @staticmethod
+    def next_queued():
+        """
+        Claims the oldest queued OCRJob
+        :return: the claimed instance of OCRJob or None if the queue is empty
+        """
+        for job in OCRJob.objects.filter(status=OCRJob.STATUS_QUEUED).order_by('queued', 'id')[:10]:
+            if job.claim():
+                return job
+        return None
+
+    def claim(self):
+        """
+        Marks the OCRJob as running, only one worker can claim an OCRJob
+        :return: boolean True if the OCRJob was claimed by the caller
+        """
+        started = timezone.now()
+        if not OCRJob.objects.filter(pk=self.pk, status=OCRJob.STATUS_QUEUED)\
+                .update(status=OCRJob.STATUS_RUNNING, started=started):
+            return False
+        self.status = OCRJob.STATUS_RUNNING
+        self.started = started
+        return True
+
+    def run(self):
+        """
+        OCRs the file of the claimed OCRJob by creating an OCRedFile,
+        then removes the file of the OCRJob
+        :return: None
+        """
+        ocred_file = None
+        try:
+            ocred_file = OCRedFile(md5=self.md5, file_type=self.file_type, lang=self.lang)
+            ocred_file.file.save(os.path.basename(self.file.name), self.file.file, False)
+            self.file.close()
+            try:
+                ocred_file.save()
+            except Md5DuplicationError:
+                # the same file was uploaded synchronously while the OCRJob was queued
+                if os.path.isfile(ocred_file.file.path):
+                    os.remove(ocred_file.file.path)
+                ocred_file = OCRedFile.objects.get(hashes__md5=self.md5)
+            self.ocred_file = ocred_file
+            self.status = OCRJob.STATUS_DONE
+        except Exception as e:
+            self.error = str(e)
+            self.status = OCRJob.STATUS_FAILED
+            if ocred_file is not None and ocred_file.pk is None:
+                # the OCRedFile was not saved, its stored files are not referenced by any row
+                for field in (ocred_file.file, ocred_file.ocred_pdf):
+                    if field and os.path.isfile(field.path):
+                        os.remove(field.path)
+        self.finished = timezone.now()
+        self.remove_file()
+        self.save()
+
+    def remove_file(self):
+        """
+        Removes the file of the OCRJob from a disk if it exists
+        :return: None
+        """
+        if self.file and os.path.isfile(self.file.path):
+            os.remove(self.file.path)
+
+    def delete(self, *args, **kwargs):
+        """
+        This function deletes the instance of the model and its file
+        :param args:
+        :param kwargs:
+        :return: None
+        """
+        self.remove_file()
+        super(OCRJob, self).delete(*args, **kwargs)
@@ -0,0 +1,172 @@
+"""
+ocr/preprocess.py
+This file contains the preprocessing of images before tesseract:
+downscale - large images are downscaled to OCR_PREPROCESS_DPI and OCR_PREPROCESS_MAX_SIZE pixels,
+grayscale - colors and 16 bits per channel are converted to 8 bit grayscale,
+binarize - the adaptive threshold, a pixel is black if it is darker than the mean of its neighbourhood,
+trim - uniform borders are cropped,
+then the image is encoded to PNG with the fast compression.
+Tesseract also builds the searchable PDF of the preprocessed image.
+"""
+__author__ = 'shmakovpn <shmakovpn@yandex.ru>'
+__date__ = '2026-10-18'
+
+import time
+from io import BytesIO
+from django.conf import settings
+from ocr import settings as ocr_default_settings
+
+
+PREPROCESS_STAGES = ('downscale', 'grayscale', 'binarize', 'trim')
+
+
+def get_setting(name):
+    """
+    This function returns the OCR_PREPROCESS_{name} setting
+    :param name: the name of the setting without the prefix
+    :return: the value of the setting
+    """
+    return getattr(settings, 'OCR_PREPROCESS_' + name, getattr(ocr_default_settings, 'PREPROCESS_' + name))
+
+
+def flatten(image):
+    """
+    This function puts the image with the transparency on the white background
+    :param image: PIL.Image
+    :return: PIL.Image without the alpha channel
+    """
+    from PIL import Image
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        background = Image.new('RGBA', image.size, 'white')
+        flattened = Image.alpha_composite(background, image.convert('RGBA')).convert('RGB')
+        flattened.info = image.info
+        return flattened
+    return image
+
+
+def to_grayscale(image):
+    """
+    This function converts the image to 8 bit grayscale
+    :param image: PIL.Image
+    :return: PIL.Image of the 'L' mode
+    """
+    if image.mode == 'L':
+        return image
+    if image.mode.startswith('I'):
+        # 16 bits per pixel
+        return image.convert('I').point(lambda value: value * (1 / 256.0)).convert('L')
+    if image.mode == 'CMYK':
+        image = image.convert('RGB')
+    return flatten(image).convert('L')
+
+
+def downscale(image):
+    """
+    This function downscales the image to OCR_PREPROCESS_DPI and to OCR_PREPROCESS_MAX_SIZE pixels of the longest side,
+    the resolution of the image is scaled too, so the size of a page of the searchable PDF is kept
+    :param image: PIL.Image
+    :return: PIL.Image
+    """
+    from PIL import Image
+    dpi = image.info.get('dpi', (0, 0))[0] or 0
+    scale = 1.0
+    target_dpi = get_setting('DPI')
+    if target_dpi and dpi > target_dpi:
+        scale = target_dpi / dpi
+    max_size = get_setting('MAX_SIZE')
+    if max_size and max(image.size) * scale > max_size:
+        scale = max_size / max(image.size)
+    if scale >= 1.0:
+        return image
+    if image.mode.startswith('I;16'):
+        image = image.convert('I')  # resampling of 16 bit images is supported for 32 bit integers
+    resized = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.LANCZOS)
+    if dpi:
+        resized.info['dpi'] = (dpi * scale, dpi * scale)
+    return resized
+
+
+def binarize(image):
+    """
+    This function binarizes the grayscale image by the adaptive threshold of Bradley and Roth,
+    a pixel is black if it is darker than the mean of the square of OCR_PREPROCESS_BINARIZE_RADIUS pixels around it
+    by more than OCR_PREPROCESS_BINARIZE_THRESHOLD of the mean, so uneven lighting of photos does not blacken areas
+    :param image: PIL.Image of the 'L' mode
+    :return: PIL.Image of the '1' mode
+    """
+    from PIL import Image, ImageFilter, ImageChops
+    mean = image.filter(ImageFilter.BoxBlur(get_setting('BINARIZE_RADIUS')))
+    scale = 1 / (1 - get_setting('BINARIZE_THRESHOLD'))
+    scaled = image.point(lambda value: min(255, int(value * scale)))
+    darkness = ImageChops.subtract(mean, scaled)  # max(0, mean - pixel * scale), it is not 0 for black pixels
+    binary = darkness.point(lambda value: 0 if value else 255).convert('1', dither=Image.NONE)
+    binary.info = image.info
+    return binary
+
+
+def trim(image):
+    """
+    This function crops uniform borders of the image keeping OCR_PREPROCESS_TRIM_MARGIN pixels around the content
+    :param image: PIL.Image of the 'L' or '1' mode
+    :return: PIL.Image
+    """
+    from PIL import ImageOps
+    content = ImageOps.invert(image.convert('L')).point(lambda value: 255 if value > 127 else 0)
+    bbox = content.getbbox()
+    if not bbox:
+        return image  # a blank image
+    margin = get_setting('TRIM_MARGIN')
+    bbox = (max(0, bbox[0] - margin), max(0, bbox[1] - margin),
+            min(image.width, bbox[2] + margin), min(image.height, bbox[3] + margin))
+    cropped = image.crop(bbox)
+    cropped.info = image.info
+    return cropped
+
+
+def preprocess_image(content, stages=None):
+    """
+    This function prepares the image for tesseract
+    :param content: an image as bytes
+    :param stages: names of PREPROCESS_STAGES applied in their order, OCR_PREPROCESS_STAGES by default
+    :return: (content, timings), the PNG image as bytes or the content as is if it is not readable by Pillow,
+        timings are seconds of each stage, 'load', 'encode' and 'total'
+    """
+    from PIL import Image
+    if stages is None:
+        stages = get_setting('STAGES')
+    started = time.perf_counter()
+    timings = {}
+    try:
+        image = Image.open(BytesIO(content))
+        image.load()
+    except (IOError, ValueError):
+        return content, timings
+    timings['load'] = time.perf_counter() - started
+    for stage in PREPROCESS_STAGES:
+        if stage not in stages:
+            continue
+        stage_started = time.perf_counter()
+        if stage == 'downscale':
+            image = downscale(image)
+        elif stage == 'grayscale':
+            image = to_grayscale(image)
+        elif stage == 'binarize':
+            image = binarize(to_grayscale(image))
+        elif stage == 'trim':
+            image = trim(image)
+        timings[stage] = time.perf_counter() - stage_started
+    stage_started = time.perf_counter()
+    if image.mode not in ('1', 'L', 'RGB'):
+        image = flatten(image)
+        if image.mode.startswith('I'):
+            image = to_grayscale(image)
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+    output = BytesIO()
+    kwargs = {'compress_level': 1}
+    if image.info.get('dpi'):
+        kwargs['dpi'] = tuple(round(value) for value in image.info['dpi'])
+    image.save(output, 'PNG', **kwargs)
+    timings['encode'] = time.perf_counter() - stage_started
+    timings['total'] = time.perf_counter() - started
+    return output.getvalue(), timings
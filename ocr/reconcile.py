@@ -0,0 +1,80 @@
+"""
+ocr/reconcile.py
+This file contains the reconciliation of stored files with the database:
+files of a folder which are not referenced by any row (orphans) are found by streaming os.scandir
+and checking each path against a set of absolute paths of referenced files.
+"""
+__author__ = 'shmakovpn <shmakovpn@yandex.ru>'
+__date__ = '2026-10-18'
+
+import os
+import time
+
+
+def scan_files(folder):
+    """
+    It yields os.DirEntry of files of the folder and its subfolders without building a list of them
+    :param folder: an absolute path of a folder
+    :return: a generator of os.DirEntry
+    """
+    folders = [folder]
+    while folders:
+        try:
+            with os.scandir(folders.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        folders.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry
+        except FileNotFoundError:
+            continue
+
+
+def reconcile(folder, known_paths, dry_run=False, rate=None, min_age=0, report_limit=100):
+    """
+    It removes files of the folder whose absolute paths are not in known_paths
+    :param folder: an absolute path of a folder
+    :param known_paths: a set of normalized absolute paths of files referenced by the database
+    :param dry_run: if True orphans are only reported
+    :param rate: the maximum number of removed files per second, None or 0 - no limit
+    :param min_age: seconds, files modified later are skipped, they may belong to a row which is being saved
+    :param report_limit: the maximum number of paths of orphans in the report
+    :return: dict {'folder', 'scanned': the number of files, 'orphans': the number of orphans,
+                   'removed': the number of removed files, 'bytes': the size of orphans,
+                   'paths': up to report_limit paths of orphans, 'truncated': True if not all paths are reported,
+                   'seconds'}
+    """
+    started = time.monotonic()
+    newest = time.time() - min_age
+    report = {'folder': folder, 'scanned': 0, 'orphans': 0, 'removed': 0, 'bytes': 0, 'paths': [],
+              'truncated': False}
+    for entry in scan_files(folder):
+        report['scanned'] += 1
+        if os.path.normpath(entry.path) in known_paths:
+            continue
+        try:
+            stat = entry.stat(follow_symlinks=False)
+        except FileNotFoundError:
+            continue
+        if stat.st_mtime > newest:
+            continue
+        report['orphans'] += 1
+        report['bytes'] += stat.st_size
+        if len(report['paths']) < report_limit:
+            report['paths'].append(entry.path)
+        else:
+            report['truncated'] = True
+        if dry_run:
+            continue
+        if rate:
+            # sleep if removing goes faster than the rate
+            delay = report['removed'] / rate - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+        try:
+            os.remove(entry.path)
+            report['removed'] += 1
+        except FileNotFoundError:
+            pass
+    report['seconds'] = time.monotonic() - started
+    return report
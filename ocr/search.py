@@ -0,0 +1,208 @@
+"""
+ocr/search.py
+This file contains the full-text search index of OCRed texts.
+The index is a contentless SQLite FTS5 table, each row of it is a page of OCRedFile.text.
+The rowid of a row is (OCRedFile.id << PAGE_BITS) + the number of the page, so a found row is a page of OCRedFile.
+The table keeps only the index of words, not a second copy of texts, so snippets are made of OCRedFile.text
+and a page is removed from the index by the 'delete' command of FTS5 with the same text as it was indexed.
+"""
+__author__ = 'shmakovpn <shmakovpn@yandex.ru>'
+__date__ = '2026-10-18'
+
+import re
+import html
+import unicodedata
+from django.conf import settings
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.utils import OperationalError
+from ocr import settings as ocr_default_settings
+from .exceptions import SearchNotSupported, SearchQueryError
+
+TABLE = 'ocr_ocredfile_fts'
+PAGE_BITS = 20  # up to 1048575 pages of an OCRedFile are indexed
+PAGE_MASK = (1 << PAGE_BITS) - 1
+CREATE_TABLE = "CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts5(text, content='', " \
+               "tokenize='unicode61 remove_diacritics 2')".format(TABLE)
+# a word of the unicode61 tokenizer: letters and digits, anything else separates words
+WORD = re.compile(r'[^\W_]+')
+
+
+def is_search_enabled(using=DEFAULT_DB_ALIAS):
+    """
+    This function returns True if OCR_SEARCH_INDEX is True and the database backend supports FTS5
+    :param using: the alias of the database
+    :return: boolean True if the full-text search index is used
+    """
+    if not getattr(settings, 'OCR_SEARCH_INDEX', ocr_default_settings.SEARCH_INDEX):
+        return False
+    return connections[using].vendor == 'sqlite'
+
+
+def create_search_index(using=DEFAULT_DB_ALIAS):
+    """
+    This function creates the full-text search index if it does not exist
+    :param using: the alias of the database
+    :return: None
+    """
+    if not is_search_enabled(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = %s", [TABLE])
+        row = cursor.fetchone()
+        if row and "content=''" not in row[0]:
+            # the index of a previous version stores copies of texts, it is rebuilt by ocr_reindex --index search
+            cursor.execute('DROP TABLE {}'.format(TABLE))
+        cursor.execute(CREATE_TABLE)
+
+
+def drop_search_index(using=DEFAULT_DB_ALIAS):
+    """
+    This function drops the full-text search index
+    :param using: the alias of the database
+    :return: None
+    """
+    if not is_search_enabled(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute('DROP TABLE IF EXISTS {}'.format(TABLE))
+
+
+def post_migrate_create_search_index(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    The post_migrate signal handler, it creates the full-text search index
+    :param sender: the AppConfig of the ocr application
+    :param using: the alias of the database
+    :param kwargs:
+    :return: None
+    """
+    create_search_index(using)
+
+
+def _page_rows(pk, pages_text):
+    return [((pk << PAGE_BITS) + page, page_text) for page, page_text in enumerate(pages_text, 1) if page_text.strip()]
+
+
+def fold_word(word):
+    """
+    This function returns the word as the unicode61 tokenizer indexes it: in lower case without diacritics
+    :param word: a word
+    :return: the folded word
+    """
+    return ''.join(char for char in unicodedata.normalize('NFKD', word.casefold())
+                   if not unicodedata.combining(char))
+
+
+def make_snippet(text, words, highlight, tokens=16):
+    """
+    This function returns the part of the text with the most of found words as HTML,
+    an OCRed text may contain any markup, so it is escaped
+    :param text: the text of a found page
+    :param words: words of the query
+    :param highlight: HTML marks of the start and the end of found words
+    :param tokens: the maximum number of words in the snippet
+    :return: the escaped snippet with highlighted found words
+    """
+    folded = {fold_word(word) for query_word in words for word in WORD.findall(query_word)}
+    found = list(WORD.finditer(text))
+    if not found:
+        return ''
+    hits = [index for index, match in enumerate(found) if fold_word(match.group()) in folded]
+    first = 0
+    if hits:
+        # windows of tokens words start a quarter of the window before a found word,
+        # the window containing the most of found words is the snippet
+        starts = [max(0, min(hit - tokens // 4, len(found) - tokens)) for hit in hits]
+        first = max(starts, key=lambda start: sum(1 for index in hits if start <= index < start + tokens))
+    window = found[first:first + tokens]
+    # the text before the first word and after the last word is kept at the start and the end of the page
+    position = window[0].start() if first else len(text) - len(text.lstrip())
+    parts = ['...' if first else '']
+    for match in window:
+        parts.append(html.escape(text[position:match.start()]))
+        if fold_word(match.group()) in folded:
+            parts += [highlight[0], html.escape(match.group()), highlight[1]]
+        else:
+            parts.append(html.escape(match.group()))
+        position = match.end()
+    parts.append('...' if first + tokens < len(found) else html.escape(text[position:].rstrip()))
+    return ''.join(parts)
+
+
+def index_pages(pk, pages_text, using=DEFAULT_DB_ALIAS):
+    """
+    This function appends pages of a new OCRedFile to the index
+    :param pk: the id of the OCRedFile
+    :param pages_text: a list of texts of pages
+    :param using: the alias of the database
+    :return: None
+    """
+    if not is_search_enabled(using):
+        return
+    index_many([(pk, pages_text)], using)
+
+
+def index_many(documents, using=DEFAULT_DB_ALIAS):
+    """
+    This function appends pages of many OCRedFiles to the index, it is used to rebuild the index
+    :param documents: an iterable of (the id of an OCRedFile, a list of texts of pages)
+    :param using: the alias of the database
+    :return: the number of indexed pages
+    """
+    rows = [row for pk, pages_text in documents for row in _page_rows(pk, pages_text)]
+    with connections[using].cursor() as cursor:
+        cursor.executemany('INSERT INTO {}(rowid, text) VALUES (%s, %s)'.format(TABLE), rows)
+    return len(rows)
+
+
+def unindex(pk, pages_text, using=DEFAULT_DB_ALIAS):
+    """
+    This function removes indexed pages of an OCRedFile
+    :param pk: the id of the OCRedFile
+    :param pages_text: a list of texts of pages as they were indexed
+    :param using: the alias of the database
+    :return: None
+    """
+    unindex_many([(pk, pages_text)], using)
+
+
+def unindex_many(documents, using=DEFAULT_DB_ALIAS):
+    """
+    This function removes indexed pages of many OCRedFiles,
+    a contentless table does not know indexed words of a row, so they are given by the texts of pages
+    :param documents: an iterable of (the id of an OCRedFile, a list of texts of pages as they were indexed)
+    :param using: the alias of the database
+    :return: None
+    """
+    if not is_search_enabled(using):
+        return
+    rows = [row for pk, pages_text in documents for row in _page_rows(pk, pages_text)]
+    with connections[using].cursor() as cursor:
+        cursor.executemany("INSERT INTO {table}({table}, rowid, text) VALUES ('delete', %s, %s)".format(table=TABLE),
+                           rows)
+
+
+def search_pages(query, limit=20, offset=0, using=DEFAULT_DB_ALIAS):
+    """
+    This function searches pages which contain all words of the query, the best matches (bm25) go first
+    :param query: words to search
+    :param limit: the maximum number of found pages
+    :param offset: the number of skipped found pages
+    :param using: the alias of the database
+    :return: a list of dicts {'id': the id of an OCRedFile, 'page': the number of the page, 'score'},
+        snippets are made by make_snippet of texts of found pages
+    """
+    if not is_search_enabled(using):
+        raise SearchNotSupported()
+    words = query.split()
+    if not words:
+        raise SearchQueryError(query)
+    # each word is quoted, so the query syntax of FTS5 can not be injected by a user
+    match = ' '.join('"{}"'.format(word.replace('"', '""')) for word in words)
+    try:
+        with connections[using].cursor() as cursor:
+            cursor.execute('SELECT rowid, rank FROM {table} WHERE {table} MATCH %s ORDER BY rank LIMIT %s OFFSET %s'
+                           .format(table=TABLE), [match, limit, offset])
+            rows = cursor.fetchall()
+    except OperationalError:
+        raise SearchQueryError(query)
+    return [{'id': rowid >> PAGE_BITS, 'page': rowid & PAGE_MASK, 'score': -rank} for rowid, rank in rows]
@@ -8,19 +8,35 @@ from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
 from .models import *
 from .utils import md5
+from .stages import StageTimer
 
 
 class OCRedFileSerializer(serializers.ModelSerializer):
     """
     The OCRedFile model serializer 2019-03-18
     """
+    md5 = None  # the md5 of the validated file
+    stage_timer = None  # the StageTimer of the upload, the hash stage is measured by is_valid
+    # fields which are calculated by properties of OCRedFile and the model fields they need
+    COMPUTED_FIELDS = {
+        'download_file': ('file', ),
+        'download_ocred_pdf': ('ocred_pdf', ),
+        'can_create_pdf': ('file', 'ocred_pdf', 'file_type', 'ocred', 'text_page_offsets', ),
+        'can_remove_file': ('file', ),
+        'can_remove_pdf': ('ocred_pdf', ),
+    }
+
     def __init__(self, *args, **kwargs):
         """
         OCRedFileSerializer constructor
         :param args:
-        :param kwargs:
+        :param kwargs: 'fields' - the names of fields to serialize, all fields if it is None
         """
+        fields = kwargs.pop('fields', None)
         super(OCRedFileSerializer, self).__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
 
     def is_valid(self, raise_exception=False):
         """
@@ -39,12 +55,29 @@ class OCRedFileSerializer(serializers.ModelSerializer):
         self.initial_data['file'].seek(0)
         if not OCRedFile.is_valid_file_type(file_type=file_type, raise_exception=raise_exception):
             return False
-        md5_value = md5(content)
+        if not OCRedFile.is_valid_lang(self.initial_data.get('lang', ''), raise_exception=raise_exception):
+            return False
+        self.stage_timer = StageTimer()
+        with self.stage_timer.stage('hash', len(content)):
+            md5_value = md5(content)
         print('OCRedFileSerializer.is_valid md5='+md5_value)
+        self.md5 = md5_value
         if not OCRedFile.is_valid_ocr_md5(md5_value=md5_value, raise_exception=raise_exception):
             return False
         return super(OCRedFileSerializer, self).is_valid(raise_exception)
 
+    def create(self, validated_data):
+        """
+        Creates the OCRedFile, the md5 of the file was validated by is_valid, so it is not validated again
+        :param validated_data:
+        :return: the created instance of OCRedFile
+        """
+        ocred_file = OCRedFile(**validated_data)
+        ocred_file.md5 = self.md5
+        ocred_file.stage_timer = self.stage_timer
+        ocred_file.save(md5_validated=True)
+        return ocred_file
+
     @property
     def data(self):
         """
@@ -82,6 +115,7 @@ class OCRedFileSerializer(serializers.ModelSerializer):
             'can_create_pdf',
             'can_remove_file',
             'can_remove_pdf',
+            'lang',
         )
         extra_kwargs = {
             'id': {'read_only': True},
@@ -104,3 +138,41 @@ class OCRedFileSerializer(serializers.ModelSerializer):
             'can_remove_file': {'read_only': True},
             'can_remove_pdf': {'read_only': True},
         }
+
+
+class OCRJobSerializer(serializers.ModelSerializer):
+    """
+    The OCRJob model serializer
+    """
+    class Meta:
+        model = OCRJob
+        fields = (
+            'id',
+            'md5',
+            'file_type',
+            'lang',
+            'status',
+            'error',
+            'queued',
+            'started',
+            'finished',
+        )
+        read_only_fields = fields
+
+
+class TtlSweepSerializer(serializers.ModelSerializer):
+    """
+    The TtlSweep model serializer
+    """
+    class Meta:
+        model = TtlSweep
+        fields = (
+            'started',
+            'updated',
+            'finished',
+            'removed',
+            'files_removed',
+            'pdf_removed',
+            'lag',
+        )
+        read_only_fields = fields
@@ -8,6 +8,46 @@ STORE_FILES = True  # store uploaded files or not (True for debug)
 FILE_PREVIEW = True  # show file preview in admin
 TESSERACT_LANG = 'rus+eng'  # languages used by tesseract
 STORE_PDF = True  # generate ocred_pdf from uploaded file and store it
+STORE_HOCR = False  # store hOCR of OCRed images, it is used to create ocred_pdf without OCRing the image again
+PDF_PROCESSES = 1  # the number of ocrmypdf processes OCRing page ranges of a multi-page PDF concurrently
+TIFF_PROCESSES = 4  # the number of tesseract processes OCRing frames of a multi-page TIFF concurrently
+
+"""
+Languages of tesseract of an uploaded file, they are recorded in OCRedFile.lang
+ALLOWED_LANGS  # languages which can be requested by the 'lang' parameter of upload/, e.g. 'eng' or 'rus+eng'
+DEFAULT_LANG  # languages of a file uploaded without 'lang', '' - TESSERACT_LANG, 'auto' - languages of its script
+SCRIPT_LANGS  # languages of scripts detected by the 'auto' mode, keys are script names of tesseract OSD
+LANG_DETECT_MIN_CONFIDENCE  # the script confidence of tesseract OSD, TESSERACT_LANG is used for a lower one
+LANG_DETECT_MIN_CHARS  # the number of letters of a text of a PDF which is enough to detect its script
+LANG_DETECT_MIN_SHARE  # languages of scripts of at least this part of letters of a text of a PDF are used
+"""
+ALLOWED_LANGS = ('eng', 'rus')
+DEFAULT_LANG = ''
+SCRIPT_LANGS = {
+    'Latin': 'eng',
+    'Cyrillic': 'rus',
+}
+LANG_DETECT_MIN_CONFIDENCE = 2.0
+LANG_DETECT_MIN_CHARS = 50
+LANG_DETECT_MIN_SHARE = 0.1
+
+"""
+Preprocessing of images before tesseract, the searchable PDF is created from the preprocessed image too
+PREPROCESS = True  # images are preprocessed before OCR
+PREPROCESS_STAGES  # applied stages of 'downscale', 'grayscale', 'binarize', 'trim'
+PREPROCESS_DPI  # images of the greater resolution are downscaled to it
+PREPROCESS_MAX_SIZE  # pixels, images with the longer side are downscaled, e.g. photos without the resolution
+PREPROCESS_BINARIZE_RADIUS  # pixels, the radius of the neighbourhood of the adaptive threshold
+PREPROCESS_BINARIZE_THRESHOLD  # a pixel is black if it is darker than the mean of the neighbourhood by this part of it
+PREPROCESS_TRIM_MARGIN  # pixels of borders kept around the content
+"""
+PREPROCESS = False
+PREPROCESS_STAGES = ('downscale', 'grayscale', 'binarize', 'trim')
+PREPROCESS_DPI = 300
+PREPROCESS_MAX_SIZE = 4000
+PREPROCESS_BINARIZE_RADIUS = 15
+PREPROCESS_BINARIZE_THRESHOLD = 0.15
+PREPROCESS_TRIM_MARGIN = 10
 
 STORE_FILES_DISABLED_LABEL = 'store_files_disabled'
 STORE_PDF_DISABLED_LABEL = 'store_pdf_disabled'
@@ -26,6 +66,127 @@ ALLOWED_FILE_TYPES = (
 
 FILES_UPLOAD_TO = __package__ + '/upload/'
 PDF_UPLOAD_TO = __package__ + '/pdf/'
+HOCR_UPLOAD_TO = __package__ + '/hocr/'
+
+"""
+Compression of OCRedFile.text, it is applied on save, 'manage.py ocr_compress_text' converts existing texts
+TEXT_COMPRESSION  # '' - texts are stored as is, 'zlib' or 'zstd' (requires the zstandard package)
+TEXT_COMPRESSION_LEVEL  # the level of compression, 1-9 for zlib, 1-22 for zstd
+TEXT_COMPRESSION_MIN_SIZE  # shorter texts are stored as is
+"""
+TEXT_COMPRESSION = ''
+TEXT_COMPRESSION_LEVEL = 6
+TEXT_COMPRESSION_MIN_SIZE = 256
+
+"""
+The content-addressed layout of stored files, a file is stored as {UPLOAD_TO}ab/cd/{md5}{extension},
+'manage.py ocr_migrate_storage' moves files stored before to the layout
+STORAGE_SHARD_LEVELS  # the number of nested folders, 0 - files are stored flat in {UPLOAD_TO}
+STORAGE_SHARD_WIDTH  # the number of characters of the md5 in the name of a folder
+"""
+STORAGE_SHARD_LEVELS = 2
+STORAGE_SHARD_WIDTH = 2
+
+"""
+Asynchronous processing settings
+ASYNC = True  # /upload/ stores the file as an OCRJob and returns 202, OCR is done by 'manage.py ocr_worker'
+JOBS_UPLOAD_TO  # the folder where files of OCRJobs are stored until they will be processed
+WORKER_PROCESSES  # the number of worker processes started by 'manage.py ocr_worker'
+WORKER_POLL_INTERVAL  # seconds between polls of the queue when it is empty
+"""
+ASYNC = False
+JOBS_UPLOAD_TO = __package__ + '/jobs/'
+WORKER_PROCESSES = 2
+WORKER_POLL_INTERVAL = 1
+
+"""
+Full-text search settings
+SEARCH_INDEX = True  # OCRed texts are indexed by SQLite FTS5 and /search/ is available (sqlite backend only)
+SEARCH_HIGHLIGHT  # HTML marks of the start and the end of found words in snippets, the text of snippets is escaped
+SEARCH_SNIPPET_TOKENS  # the maximum number of words in a snippet
+SEARCH_LIMIT  # the number of found pages returned by /search/ by default
+SEARCH_MAX_LIMIT  # the maximum number of found pages returned by /search/
+"""
+SEARCH_INDEX = True
+SEARCH_HIGHLIGHT = ('<b>', '</b>')
+SEARCH_SNIPPET_TOKENS = 16
+SEARCH_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+
+"""
+Settings of list/, the default number of OCRedFiles of a page is PAGE_SIZE of REST_FRAMEWORK settings
+LIST_MAX_LIMIT  # the maximum number of OCRedFiles of a page of list/
+"""
+LIST_MAX_LIMIT = 100
+
+"""
+Settings of the NDJSON export of OCRedFiles by export/ and 'manage.py ocr_export'
+EXPORT_CHUNK_SIZE  # the number of rows fetched from the database at once
+EXPORT_WATERMARK_LAG  # seconds, the returned watermark is the start of the export minus the lag,
+    # rows committed by long transactions during the export are exported again by the next incremental export
+"""
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_WATERMARK_LAG = 60
+
+"""
+The cache of responses of <md5:md5>/, it is a per process LRU cache
+MD5_CACHE_SIZE  # the maximum number of cached OCRedFiles, 0 disables the cache
+MD5_CACHE_TTL  # seconds after which a cached OCRedFile expires
+MD5_CACHE_MAX_BYTES  # the maximum sum of lengths of texts of cached OCRedFiles, 0 - unlimited
+"""
+MD5_CACHE_SIZE = 1024
+MD5_CACHE_TTL = 60
+MD5_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+"""
+Subprocesses of tesseract and ocrmypdf, see ocr/supervisor.py
+SUBPROCESS_CONCURRENCY  # the number of subprocesses running on the host at once, 0 - the number of cores
+SUBPROCESS_SLOTS_DIR  # the folder of lock files of slots shared by processes of the server, '' - a temporary folder
+SUBPROCESS_TIMEOUT  # seconds after which tesseract of an image is killed, 0 - no timeout
+SUBPROCESS_PDF_TIMEOUT  # seconds after which ocrmypdf of a PDF document or a range of its pages is killed
+SUBPROCESS_MEMORY_LIMIT  # MiB of the address space of each subprocess and its children, 0 - unlimited
+SUBPROCESS_CPU_LIMIT  # CPU seconds of each subprocess and its children, 0 - unlimited
+"""
+SUBPROCESS_CONCURRENCY = 0
+SUBPROCESS_SLOTS_DIR = ''
+SUBPROCESS_TIMEOUT = 300
+SUBPROCESS_PDF_TIMEOUT = 1800
+SUBPROCESS_MEMORY_LIMIT = 4096
+SUBPROCESS_CPU_LIMIT = 3600
+
+"""
+Metrics, see ocr/metrics.py, they are returned by metrics/ in the text format of Prometheus
+METRICS_FLUSH_INTERVAL  # seconds between flushes of metrics of a process to the database, 0 - on each increment
+METRICS_BUCKETS  # upper bounds of buckets of histograms of seconds
+"""
+METRICS_FLUSH_INTERVAL = 10
+METRICS_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+"""
+Bulk removal settings, they are used by remove/all/ and TTL
+BULK_DELETE_CHUNK_SIZE  # the number of OCRedFiles removed from the database by one DELETE
+BULK_DELETE_THREADS  # the number of threads which remove files of OCRedFiles from a disk
+"""
+BULK_DELETE_CHUNK_SIZE = 1000
+BULK_DELETE_THREADS = 8
+
+"""
+Download settings of download/file|pdf/<filename>/
+DOWNLOAD_ACCEL  # '' - files are streamed by Django, 'nginx' - X-Accel-Redirect, 'sendfile' - X-Sendfile
+DOWNLOAD_ACCEL_LOCATION  # the internal location of nginx which is an alias of MEDIA_ROOT
+"""
+DOWNLOAD_ACCEL = ''
+DOWNLOAD_ACCEL_LOCATION = '/protected/'
+
+"""
+Settings of removing of files that are not related with any OCRedFile by /clean/
+CLEAN_RATE  # the maximum number of removed files per second, 0 - no limit
+CLEAN_MIN_AGE  # seconds, files modified later are not removed, they may belong to an OCRedFile being saved
+CLEAN_REPORT_LIMIT  # the maximum number of paths of removed files reported for each folder
+"""
+CLEAN_RATE = 0
+CLEAN_MIN_AGE = 60
+CLEAN_REPORT_LIMIT = 100
 
 """
 TimeToLive settings
@@ -34,9 +195,15 @@ FILES_TTL = 0  # TTL for OCRedFile.files is disabled
 PDF_TTL = 0  # TTL for OCRedFile.ocred_pdfs is disabled
 TTL = 0  # TTL for OCRedFile is disabled
 When current datetime will grater OCRedFile.uploaded+{PARAM}_TTL corresponding object will be removed
+TTL_BATCH_SIZE  # the number of OCRedFiles processed by the TTL sweeper in one batch
+TTL_TIME_BUDGET  # seconds, /ttl/ stops the sweep after the batch which exceeds it, the next call continues it
+TTL_SWEEP_INTERVAL  # seconds between sweeps of 'manage.py ocr_ttl --loop'
 """
 FILES_TTL = 0
 PDF_TTL = 0
 TTL = 0
+TTL_BATCH_SIZE = 500
+TTL_TIME_BUDGET = 10
+TTL_SWEEP_INTERVAL = 60
 
 
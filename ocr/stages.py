@@ -0,0 +1,161 @@
+"""
+ocr/stages.py
+This file contains the timing of stages of the processing of an uploaded file:
+hash, pdf_parse, preprocess, ocr, storage and index.
+Wall seconds, CPU seconds and processed bytes of each stage are stored in OCRedFile.stage_timings
+as compact JSON {"stage": [wall, cpu, bytes], ...}, seconds of the stage are observed by the metrics too.
+CPU seconds are seconds of the thread and of subprocesses (tesseract, ocrmypdf) finished during the stage.
+Subprocesses are counted for the whole process, so uploads processed concurrently by threads of a server
+may add CPU seconds of subprocesses of each other, ocr_worker processes count them exactly.
+"""
+__author__ = 'shmakovpn <shmakovpn@yandex.ru>'
+__date__ = '2026-10-18'
+
+import json
+import time
+from contextlib import contextmanager
+from .metrics import metrics
+try:
+    import resource
+except ImportError:
+    resource = None  # not a unix, CPU seconds of subprocesses are not counted
+
+
+STAGES = ('hash', 'pdf_parse', 'preprocess', 'ocr', 'storage', 'index')
+PAGE_BUCKETS = (1, 10, 100)  # upper bounds of groups of documents by the number of pages
+
+thread_time = getattr(time, 'thread_time', time.process_time)  # thread_time is available since python 3.7
+
+
+def cpu_seconds():
+    """
+    This function returns CPU seconds of the thread and of finished subprocesses of the process
+    :return: seconds
+    """
+    seconds = thread_time()
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        seconds += usage.ru_utime + usage.ru_stime
+    return seconds
+
+
+class StageTimer:
+    """
+    Measures stages of the processing of a file, a repeated stage (e.g. preprocess of frames) is summed
+    """
+    def __init__(self):
+        """
+        StageTimer constructor
+        """
+        self.stages = {}  # stage: (wall seconds, CPU seconds, bytes)
+
+    @contextmanager
+    def stage(self, name, size=0):
+        """
+        Measures the block of the with statement as the stage
+        :param name: the name of the stage, see STAGES
+        :param size: processed bytes
+        :return: None
+        """
+        wall = time.perf_counter()
+        cpu = cpu_seconds()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - wall, cpu_seconds() - cpu, size)
+
+    def add(self, name, wall, cpu, size):
+        """
+        Adds the measurement to the stage and observes it by the metrics
+        :param name: the name of the stage
+        :param wall: wall seconds
+        :param cpu: CPU seconds
+        :param size: processed bytes
+        :return: None
+        """
+        metrics.observe('ocr_stage_seconds', wall, stage=name)
+        previous = self.stages.get(name, (0.0, 0.0, 0))
+        self.stages[name] = (previous[0] + wall, previous[1] + cpu, previous[2] + size)
+
+    def dumps(self):
+        """
+        Returns stages as compact JSON for OCRedFile.stage_timings
+        :return: a string e.g. '{"hash":[0.0012,0.0012,52340],"ocr":[1.2345,2.1,52340]}'
+        """
+        return json.dumps({name: [round(wall, 4), round(cpu, 4), size]
+                           for name, (wall, cpu, size) in self.stages.items()}, separators=(',', ':'))
+
+
+def parse_stage_timings(value):
+    """
+    This function parses OCRedFile.stage_timings
+    :param value: compact JSON or None
+    :return: a dict {stage: {'wall', 'cpu', 'bytes'}}, an empty dict if stages were not recorded
+    """
+    try:
+        stages = json.loads(value or '{}')
+    except ValueError:
+        return {}
+    return {name: {'wall': wall, 'cpu': cpu, 'bytes': size} for name, (wall, cpu, size) in stages.items()}
+
+
+def percentile(values, percent):
+    """
+    This function returns the percentile of values by the nearest rank
+    :param values: a sorted list of numbers
+    :param percent: from 0 to 100
+    :return: the value or None if values are empty
+    """
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * percent // 100))  # ceil
+    return values[int(min(rank, len(values))) - 1]
+
+
+def page_group(pages, buckets=PAGE_BUCKETS):
+    """
+    This function returns the name of the group of documents by the number of pages
+    :param pages: the number of pages
+    :param buckets: upper bounds of groups
+    :return: e.g. '1', '2-10', '11-100', '>100'
+    """
+    lower = 1
+    for bound in buckets:
+        if pages <= bound:
+            return str(bound) if lower == bound else '{}-{}'.format(lower, bound)
+        lower = bound + 1
+    return '>{}'.format(buckets[-1])
+
+
+def stage_percentiles(rows, stages=None, percents=(50, 95), buckets=PAGE_BUCKETS):
+    """
+    This function aggregates stage timings of documents grouped by the content type and the number of pages
+    :param rows: an iterable of (file_type, pages, stage_timings)
+    :param stages: names of aggregated stages, all stages by default
+    :param percents: percentiles of wall and CPU seconds, e.g. (50, 95)
+    :param buckets: upper bounds of groups by the number of pages
+    :return: a list of dicts {'file_type', 'pages', 'stage', 'count', 'bytes',
+        'wall_p50', 'cpu_p50', 'wall_p95', 'cpu_p95', ...} ordered by the group and the stage
+    """
+    groups = {}
+    for file_type, pages, stage_timings in rows:
+        for name, timing in parse_stage_timings(stage_timings).items():
+            if stages and name not in stages:
+                continue
+            group = groups.setdefault((file_type or '', page_group(pages or 1, buckets), name), ([], [], [0]))
+            group[0].append(timing['wall'])
+            group[1].append(timing['cpu'])
+            group[2][0] += timing['bytes']
+    result = []
+    for (file_type, pages, name), (walls, cpus, size) in groups.items():
+        walls.sort()
+        cpus.sort()
+        row = {'file_type': file_type, 'pages': pages, 'stage': name, 'count': len(walls), 'bytes': size[0]}
+        for percent in percents:
+            row['wall_p{}'.format(percent)] = percentile(walls, percent)
+            row['cpu_p{}'.format(percent)] = percentile(cpus, percent)
+        result.append(row)
+    order = {name: index for index, name in enumerate(STAGES)}
+    result.sort(key=lambda row: (row['file_type'], int(row['pages'].strip('>').split('-')[0]),
+                                 order.get(row['stage'], len(order)), row['stage']))
+    return result
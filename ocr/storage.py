@@ -0,0 +1,98 @@
+"""
+ocr/storage.py
+This file contains the content-addressed layout of stored files of OCRedFiles.
+A file is stored as {upload_to}{shards}{md5}{suffix}, shards are OCR_STORAGE_SHARD_LEVELS folders
+named by OCR_STORAGE_SHARD_WIDTH characters of the md5, e.g. 'ocr/upload/8a/ab/8aabb1f2d2d92893b5604da701f05505.png'.
+Files stored before the layout was enabled keep their flat names until 'manage.py ocr_migrate_storage' moves them,
+both layouts are resolved by a name of a file without scanning folders.
+"""
+__author__ = 'shmakovpn <shmakovpn@yandex.ru>'
+__date__ = '2026-10-18'
+
+import os
+import re
+import shutil
+from django.conf import settings
+from django.core.files.storage import default_storage
+from ocr import settings as ocr_default_settings
+
+
+MD5_RE = re.compile(r'^[0-9a-f]{32}')
+
+
+def shard_dirs(md5_value, levels=None, width=None):
+    """
+    This function returns folders of the file with the md5 in the content-addressed layout
+    :param md5_value: the md5 of the file
+    :param levels: the number of nested folders, OCR_STORAGE_SHARD_LEVELS by default, 0 - the flat layout
+    :param width: the number of characters of the md5 in the name of a folder, OCR_STORAGE_SHARD_WIDTH by default
+    :return: a relative path like 'ab/cd/' or '' for the flat layout
+    """
+    if levels is None:
+        levels = getattr(settings, 'OCR_STORAGE_SHARD_LEVELS', ocr_default_settings.STORAGE_SHARD_LEVELS)
+    if width is None:
+        width = getattr(settings, 'OCR_STORAGE_SHARD_WIDTH', ocr_default_settings.STORAGE_SHARD_WIDTH)
+    return ''.join(md5_value[level * width:(level + 1) * width] + '/' for level in range(levels))
+
+
+def content_name(upload_to, md5_value, suffix):
+    """
+    This function returns the name of the file with the md5 in the content-addressed layout
+    :param upload_to: the folder of files of a FileField, e.g. OCR_FILES_UPLOAD_TO
+    :param md5_value: the md5 of the OCRedFile
+    :param suffix: the extension of the file, e.g. '.pdf'
+    :return: the name of the file relative to MEDIA_ROOT
+    """
+    return upload_to + shard_dirs(md5_value) + md5_value + suffix
+
+
+def resolve_stored_name(upload_to, filename):
+    """
+    This function returns the stored name of the file by its base name,
+    the content-addressed name is checked first, then the flat name of a file stored before
+    :param upload_to: the folder of files of a FileField, e.g. OCR_FILES_UPLOAD_TO
+    :param filename: the base name of the file
+    :return: the name of the file relative to MEDIA_ROOT or None if the file does not exist
+    """
+    names = []
+    match = MD5_RE.match(filename)
+    if match:
+        names.append(upload_to + shard_dirs(match.group(0)) + filename)
+    names.append(upload_to + filename)
+    for name in names:
+        if os.path.isfile(default_storage.path(name)):
+            return name
+    return None
+
+
+def ensure_folder(path):
+    """
+    This function creates the folder of the file if it does not exist
+    :param path: the path of the file
+    :return: None
+    """
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+
+
+def link_stored_file(name, target):
+    """
+    This function links the stored file to the new name, it is the first step of moving the file.
+    The file is accessible by both names until the caller removes the old one,
+    the file is copied if a hard link is not possible
+    :param name: the current name of the file relative to MEDIA_ROOT
+    :param target: the new name of the file relative to MEDIA_ROOT
+    :return: True if the file exists by the new name
+    """
+    path = default_storage.path(name)
+    target_path = default_storage.path(target)
+    if not os.path.isfile(path):
+        return os.path.isfile(target_path)
+    ensure_folder(target_path)
+    if not os.path.isfile(target_path):
+        try:
+            os.link(path, target_path)
+        except OSError:
+            shutil.copy2(path, target_path)
+    return True
@@ -0,0 +1,205 @@
+"""
+ocr/supervisor.py
+This file contains the supervisor of subprocesses of tesseract and ocrmypdf.
+A subprocess waits for a free slot, there are OCR_SUBPROCESS_CONCURRENCY slots (the number of cores by default)
+shared by all processes of the server on the host: a slot is an exclusive flock of a file in OCR_SUBPROCESS_SLOTS_DIR,
+so a burst of uploads does not fork more OCR processes than cores, and a slot is freed when its owner dies.
+A subprocess runs in its own process group with OCR_SUBPROCESS_MEMORY_LIMIT and OCR_SUBPROCESS_CPU_LIMIT,
+the whole group is killed when the timeout expires, so children of ocrmypdf are killed too.
+"""
+__author__ = 'shmakovpn <shmakovpn@yandex.ru>'
+__date__ = '2026-10-18'
+
+import os
+import time
+import signal
+import tempfile
+import threading
+import subprocess
+from django.conf import settings
+from ocr import settings as ocr_default_settings
+from .exceptions import ProcessTimeoutError
+from .metrics import metrics
+try:
+    import fcntl
+    import resource
+except ImportError:
+    # not a unix, slots are shared only by threads of the process and limits are not set
+    fcntl = None
+    resource = None
+
+
+def get_setting(name):
+    """
+    This function returns the OCR_SUBPROCESS_{name} setting
+    :param name: the name of the setting without the prefix
+    :return: the value of the setting
+    """
+    return getattr(settings, 'OCR_SUBPROCESS_' + name, getattr(ocr_default_settings, 'SUBPROCESS_' + name))
+
+
+class Supervisor:
+    """
+    Runs subprocesses in a limited number of slots with timeouts and resource limits, counts them
+    """
+    POLL_INTERVAL = 0.05  # seconds between attempts to take a slot of another process
+
+    def __init__(self, concurrency, slots_dir):
+        """
+        Supervisor constructor
+        :param concurrency: the number of slots, 0 - the number of cores
+        :param slots_dir: the folder of lock files of slots, '' - a folder in the temporary folder
+        """
+        self.concurrency = concurrency or os.cpu_count() or 1
+        self.slots_dir = slots_dir or os.path.join(tempfile.gettempdir(), 'ocr_subprocess_slots')
+        self.started = 0
+        self.failed = 0  # subprocesses exited with a non-zero code
+        self.killed = 0  # subprocesses killed because of the timeout
+        self.signaled = 0  # subprocesses killed by a signal e.g. SIGXCPU of OCR_SUBPROCESS_CPU_LIMIT
+        self.running = 0
+        self.waiting = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self._lock = threading.Lock()
+        self._semaphore = threading.BoundedSemaphore(self.concurrency)
+
+    def acquire(self):
+        """
+        Waits for a free slot
+        :return: the opened lock file of the slot or None if slots are not shared by processes
+        """
+        if fcntl is None:
+            self._semaphore.acquire()
+            return None
+        os.makedirs(self.slots_dir, exist_ok=True)
+        self._semaphore.acquire()  # threads of the process do not poll slots
+        try:
+            interval = self.POLL_INTERVAL
+            while True:
+                for slot in range(self.concurrency):
+                    slot_file = open(os.path.join(self.slots_dir, '{}.lock'.format(slot)), 'a')
+                    try:
+                        fcntl.flock(slot_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        return slot_file
+                    except OSError:
+                        slot_file.close()
+                time.sleep(interval)
+                interval = min(interval * 2, 0.25)
+        except BaseException:
+            # e.g. the lock file can not be opened, the slot of the thread is not lost
+            self._semaphore.release()
+            raise
+
+    def release(self, slot_file):
+        """
+        Frees the slot
+        :param slot_file: the lock file returned by acquire
+        :return: None
+        """
+        if slot_file is not None:
+            slot_file.close()  # it unlocks the file
+        self._semaphore.release()
+
+    @staticmethod
+    def limits_preexec_fn():
+        """
+        Returns the function which sets OCR_SUBPROCESS_MEMORY_LIMIT and OCR_SUBPROCESS_CPU_LIMIT
+        in the child before the command is executed, so the limits apply from its first instruction
+        and its children inherit them. Settings are read in the parent,
+        the child only calls setrlimit, it takes no locks, so it is safe after a fork of a threaded process.
+        :return: the function or None if there are no limits
+        """
+        if resource is None:
+            return None
+        limits = []
+        memory_limit = get_setting('MEMORY_LIMIT')
+        cpu_limit = get_setting('CPU_LIMIT')
+        if memory_limit:
+            limits.append((resource.RLIMIT_AS, memory_limit * 1024 * 1024))
+        if cpu_limit:
+            limits.append((resource.RLIMIT_CPU, cpu_limit))
+        if not limits:
+            return None
+
+        def set_limits():
+            for limit, value in limits:
+                resource.setrlimit(limit, (value, value))
+        return set_limits
+
+    def run(self, cmd, stdin=None, timeout=None, stderr=subprocess.PIPE):
+        """
+        Runs the command in a free slot and returns its output
+        :param cmd: an array of command e.g. ['tesseract', '-l', 'rus+eng', '-', '-']
+        :param stdin: a content to send to the standard input of the command
+        :param timeout: seconds after which the process group of the command is killed,
+            OCR_SUBPROCESS_TIMEOUT by default
+        :param stderr: subprocess.PIPE to drop stderr, subprocess.STDOUT to capture it with stdout
+        :return: (returncode, stdout as bytes)
+        """
+        if timeout is None:
+            timeout = get_setting('TIMEOUT')
+        queued = time.monotonic()
+        with self._lock:
+            self.waiting += 1
+        slot_file = self.acquire()
+        wait_seconds = time.monotonic() - queued
+        with self._lock:
+            self.waiting -= 1
+            self.running += 1
+            self.started += 1
+            self.wait_seconds += wait_seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+        metrics.observe('ocr_subprocess_wait_seconds', wait_seconds)
+        try:
+            popen = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr, stdin=subprocess.PIPE,
+                                     start_new_session=True, preexec_fn=self.limits_preexec_fn())
+            try:
+                stdout = popen.communicate(input=stdin, timeout=timeout or None)[0]
+            except subprocess.TimeoutExpired:
+                try:
+                    os.killpg(popen.pid, signal.SIGKILL)
+                except OSError:
+                    popen.kill()
+                popen.communicate()
+                with self._lock:
+                    self.killed += 1
+                metrics.inc('ocr_subprocesses_total', command=os.path.basename(cmd[0]), result='killed')
+                raise ProcessTimeoutError(cmd[0], timeout)
+            result = 'ok'
+            with self._lock:
+                if popen.returncode < 0:
+                    self.signaled += 1
+                    result = 'signaled'
+                elif popen.returncode:
+                    self.failed += 1
+                    result = 'failed'
+            metrics.inc('ocr_subprocesses_total', command=os.path.basename(cmd[0]), result=result)
+            return popen.returncode, stdout
+        finally:
+            with self._lock:
+                self.running -= 1
+            self.release(slot_file)
+
+    def stats(self):
+        """
+        Returns counters of subprocesses of the process
+        :return: dict {'concurrency', 'running', 'waiting', 'started', 'failed', 'killed', 'signaled',
+            'wait_seconds', 'max_wait_seconds', 'avg_wait_seconds'}
+        """
+        with self._lock:
+            return {
+                'concurrency': self.concurrency,
+                'running': self.running,
+                'waiting': self.waiting,
+                'started': self.started,
+                'failed': self.failed,
+                'killed': self.killed,
+                'signaled': self.signaled,
+                'wait_seconds': self.wait_seconds,
+                'max_wait_seconds': self.max_wait_seconds,
+                'avg_wait_seconds': self.wait_seconds / self.started if self.started else None,
+            }
+
+
+# subprocesses of tesseract and ocrmypdf of the process
+supervisor = Supervisor(get_setting('CONCURRENCY'), get_setting('SLOTS_DIR'))
@@ -12,10 +12,20 @@ from django.contrib.auth.models import Permission
 from django.contrib.contenttypes.models import ContentType
 from bs4 import BeautifulSoup
 from datetime import timedelta
+import tempfile
+import time
+import json
+import re
+import zlib
+import base64
+from io import StringIO
 
 # djnago tests
 from django.test import TestCase, SimpleTestCase, override_settings
 from django.test import Client  # Client to perform test requests
+from django.core.management import call_command
+from django.db import connection
+from django.core.files.storage import default_storage
 
 # settings
 from django.conf import settings
@@ -31,6 +41,25 @@ from django.contrib.auth.models import User
 
 # views
 from .apiviews import *
+from .worker import run_worker
+
+# utils
+from .utils import pdf_page_ranges, pdf_merge, ocr_img2outputs, hocr2pdf, pdf_analyze, image_frames, ocr_img_frames
+from .utils import split_text_pages, text_page_offsets
+from .utils import detect_image_lang, detect_text_lang
+from .utils import ocrmypdf, cmd_stdin
+from .utils import ocr_img2str, pdf2text, ocr_img2pdf, pdf_info, pdf_need_ocr
+from .supervisor import Supervisor, supervisor
+from .metrics import Registry, metrics
+import threading
+from unittest import mock
+from .search import index_pages, unindex, search_pages, make_snippet
+from .cache import LRUCache, md5_cache
+from .reconcile import reconcile
+from .fields import compress_text, decompress_text, is_compressed_text
+from .storage import resolve_stored_name
+from .preprocess import preprocess_image
+from .stages import parse_stage_timings, percentile, page_group
 
 PWD = "%s/%s" % (settings.BASE_DIR, __package__)  # directory of the django-ocr-server/ocr application
 TESTS_DIR = "%s/%s/" % (PWD, 'tests')  # directory of the tests of the django-ocr-server/ocr application
@@ -108,6 +137,8 @@ class OcrTestCaseBase(TestCase):
         ocred_files = OCRedFile.objects.all()
         for ocred_file in ocred_files:
             ocred_file.delete()
+        for job in OCRJob.objects.all():
+            job.delete()
 
     def tearDown(self):
         """
@@ -198,7 +229,8 @@ class OcrTestCaseBase(TestCase):
                     # ocred_file must be ocred and ocred_pdf must 'store_pdf_disabled'
                     self.assertTrue(bool(ocred_file.ocred))
                     self.assertTrue(bool(ocred_file.ocred_pdf))
-                    self.assertTrue(bool(ocred_file.ocred_pdf_md5))  #
+                    # pdf is not generated for an image when store pdf is disabled
+                    self.assertEqual(ocred_file.is_pdf, bool(ocred_file.ocred_pdf_md5))
                     self.assertFalse(os.path.isfile(ocred_file.ocred_pdf.path))
                     self.assertFalse(ocred_file.can_remove_pdf)
                     self.assertTrue(ocred_file.can_create_pdf)
@@ -256,7 +288,9 @@ class OcrTestCaseBase(TestCase):
                     # ocred_file must be ocred and ocred_pdf must 'store_pdf_disabled'
                     self.assertTrue(bool(ocred_file.ocred))
                     self.assertTrue(bool(ocred_file.ocred_pdf))
-                    self.assertTrue(bool(ocred_file.ocred_pdf_md5))  # because we need to prevent md5 duplication
+                    # pdf is not generated for an image when store pdf is disabled,
+                    # md5 of the ocred pdf of a pdf document is needed to prevent md5 duplication
+                    self.assertEqual(ocred_file.is_pdf, bool(ocred_file.ocred_pdf_md5))
                     self.assertFalse(os.path.isfile(ocred_file.ocred_pdf.path))  # because store pdf disabled
                     self.assertFalse(ocred_file.can_remove_pdf)
                     self.assertFalse(ocred_file.can_create_pdf)
@@ -335,16 +369,19 @@ class OcrApiViewTestCase(OcrApiTestCaseBase):
     """
     This class intended to test that views of API of OCR Server works as expected
     """
-    def upload_file(self, filename, ):
+    def upload_file(self, filename, lang=None):
         """
         This function uploads the file to OCR Server using OcrApiClient
         and returns Response 2019-03-24/2019-03-29
         :param filename: the name of uploaded file
+        :param lang: requested languages of tesseract, they are not sent if it is None
         :return: rest framework response
         """
+        data = {} if lang is None else {'lang': lang}
         with open(TESTS_DIR + filename, 'rb') as fp:
+            data['file'] = fp
             return self.client.post(reverse(__package__+':upload'),
-                                    {'file': fp},
+                                    data,
                                     format='multipart', )
 
     def assertUploadFileResponse(self, response, md5=None, text=None):
@@ -425,6 +462,48 @@ class TestMd5(SimpleTestCase):
         self.assertEqual(md5(content), '8aabb1f2d2d92893b5604da701f05505')
 
 
+class TestLRUCache(SimpleTestCase):
+    """
+    This class tests that the LRU cache works as expected
+    """
+    def test_lru_cache(self):
+        """
+        This function tests eviction of the least recently used entry, expiration, invalidation and counters
+        :return: None
+        """
+        cache = LRUCache(2, 60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(1, cache.get('a'))
+        cache.set('c', 3)  # 'b' is the least recently used
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(3, cache.get('c'))
+        cache.invalidate('a', None)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual({'size': 1, 'max_size': 2, 'bytes': 0, 'max_bytes': 0, 'ttl': 60, 'hits': 2, 'misses': 2,
+                          'hit_ratio': 0.5}, cache.stats())
+        cache = LRUCache(2, 0)
+        cache.set('a', 1)
+        self.assertIsNone(cache.get('a'))  # expired
+        cache = LRUCache(0, 60)
+        cache.set('a', 1)
+        self.assertIsNone(cache.get('a'))  # disabled
+        # large texts are limited by bytes
+        cache = LRUCache(10, 60, 100)
+        cache.set('a', 1, 60)
+        cache.set('b', 2, 30)
+        cache.set('c', 3, 30)  # 'a' is evicted, 120 bytes are more than 100
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(60, cache.stats()['bytes'])
+        cache.set('b', 2, 50)  # the replaced entry is not counted twice
+        self.assertEqual(80, cache.stats()['bytes'])
+        cache.set('d', 4, 101)  # larger than the whole cache
+        self.assertIsNone(cache.get('d'))
+        self.assertEqual(80, cache.stats()['bytes'])
+        cache.invalidate('b', 'c')
+        self.assertEqual(0, cache.stats()['bytes'])
+
+
 class TestPdf2text(SimpleTestCase):
     """
     This class tests that extraction text from pdf works as expected   03/10/2019
@@ -437,6 +516,17 @@ class TestPdf2text(SimpleTestCase):
         content = read_binary_file(TESTS_DIR+'test_eng.pdf')
         self.assertIn('A some english text to test Tesseract', pdf2text(content))
 
+    def test_text_page_offsets(self):
+        """
+        This function tests that offsets of pages in the text joined with a separator are calculated as expected
+        :return: None
+        """
+        self.assertEqual([6, 10, 13], text_page_offsets(['page1', 'p2\n', 'p3\n'], '\f'))
+        self.assertEqual([5, 7], text_page_offsets(['page1', 'p2'], ''))
+        self.assertEqual([0], text_page_offsets(['']))
+        self.assertEqual(['page1', 'page2'], split_text_pages('page1\fpage2\f'))
+        self.assertEqual([''], split_text_pages(''))
+
     def test_pdf_need_ocr(self):
         """
         This function tests that the pdf_need_ocr analyzer as works as expected
@@ -447,6 +537,22 @@ class TestPdf2text(SimpleTestCase):
         self.assertFalse(pdf_need_ocr('The string with "the"'))
         self.assertTrue(pdf_need_ocr('3TO ownOKa'))
 
+    def test_pdf_pages_need_ocr(self):
+        """
+        This function tests that only image-only pages of a pdf document with a text need to be OCRed
+        and all pages of a pdf document without a real text need to be OCRed
+        :return: None
+        """
+        self.assertEqual([False, True, False], pdf_pages_need_ocr(['The first page', ' \n', 'The third page']))
+        self.assertEqual([True, True], pdf_pages_need_ocr(['3TO ownOKa', '']))
+        self.assertEqual([True], pdf_pages_need_ocr(['']))
+        content = pdf_merge([read_binary_file(TESTS_DIR + 'the_pdf_withtext.pdf'),
+                             read_binary_file(TESTS_DIR + 'test_eng_notext.pdf')])
+        pages_text = pdf2pages(content)
+        self.assertEqual(2, len(pages_text))
+        self.assertIn('The test if pdf with text', pages_text[0])
+        self.assertEqual([False, True], pdf_pages_need_ocr(pages_text))
+
 
 class TestPdfInfo(SimpleTestCase):
     """
@@ -461,6 +567,20 @@ class TestPdfInfo(SimpleTestCase):
         info = pdf_info(content)
         self.assertIn('Ascensio System SIA Copyright (c) 2018', info['Producer'])
 
+    def test_pdf_analyze(self):
+        """
+        This function tests that pdf_analyze returns pdfInfo, pages count and texts of pages of one parse of pdf
+        :return: None
+        """
+        content = pdf_merge([read_binary_file(TESTS_DIR + 'deming.pdf'),
+                             read_binary_file(TESTS_DIR + 'test_eng_notext.pdf')])
+        analysis = pdf_analyze(content)
+        self.assertEqual(2, analysis['numPages'])
+        self.assertEqual(2, len(analysis['pages_text']))
+        self.assertTrue(analysis['pages_text'][0].strip())
+        self.assertFalse(analysis['pages_text'][1].strip())  # the page is an image
+        self.assertEqual(2, analysis['pdf_reader'].numPages)
+
 
 class TestTesseract(SimpleTestCase):
     """
@@ -493,6 +613,135 @@ class TestTesseract(SimpleTestCase):
         pdf_bytes = ocr_img2pdf(content)
         self.assertIn('A some english text to test Tesseract', pdf2text(pdf_bytes))
 
+    def test_img2outputs_eng(self):
+        """
+        This function tests that one pass of tesseract-ocr of image with english content
+        generates text, pdf and hOCR as expected
+        :return: None
+        """
+        content = read_binary_file(TESTS_DIR + 'test_eng.png')
+        outputs = ocr_img2outputs(content, ('txt', 'pdf', 'hocr'))
+        self.assertIn('A some english text to test Tesseract', outputs['txt'])
+        self.assertIn('A some english text to test Tesseract', pdf2text(outputs['pdf']))
+        self.assertIn('ocr_page', outputs['hocr'])
+        # creating pdf from the hOCR without OCRing the image again
+        self.assertIn('Tesseract', pdf2text(hocr2pdf(outputs['hocr'], content)))
+
+    @override_settings(OCR_PREPROCESS_MAX_SIZE=600)
+    def test_preprocess_image(self):
+        """
+        This function tests that the preprocessing downscales a large color image, binarizes and trims it,
+        returns seconds of each stage and tesseract recognizes the preprocessed image
+        :return: None
+        """
+        from PIL import Image
+        image = Image.open(BytesIO(read_binary_file(TESTS_DIR + 'test_eng.png'))).convert('RGB')
+        large = Image.new('RGB', (image.width * 4, image.height * 4 + 400), (230, 220, 200))
+        large.paste(image.resize((image.width * 4, image.height * 4), Image.LANCZOS), (0, 200))
+        content = BytesIO()
+        large.save(content, 'PNG')
+        preprocessed, timings = preprocess_image(content.getvalue())
+        self.assertEqual(['load', 'downscale', 'grayscale', 'binarize', 'trim', 'encode', 'total'], list(timings))
+        result = Image.open(BytesIO(preprocessed))
+        self.assertEqual('1', result.mode)
+        self.assertLessEqual(max(result.size), 600)
+        self.assertLess(result.height, 600 * large.height / large.width)  # borders are trimmed
+        self.assertIn('A some english text to test Tesseract', ocr_img2str(preprocessed))
+        # a content which is not an image is returned as is
+        self.assertEqual((b'not an image', {}), preprocess_image(b'not an image'))
+
+    def test_multi_page_tiff(self):
+        """
+        This function tests that frames of a multi-page TIFF are recognized concurrently,
+        texts are ordered as frames and searchable PDFs of frames are merged
+        :return: None
+        """
+        from PIL import Image
+        images = [Image.open(TESTS_DIR + name).convert('RGB') for name in ('test_eng.png', 'test_rus.png')]
+        content = BytesIO()
+        images[0].save(content, 'TIFF', save_all=True, append_images=images[1:], dpi=(200, 200))
+        frames = image_frames(content.getvalue())
+        self.assertEqual(2, len(frames))
+        self.assertEqual([], image_frames(read_binary_file(TESTS_DIR + 'test_eng.png')))
+        outputs = ocr_img_frames(frames, ('txt', 'pdf', 'hocr'), processes=2)
+        self.assertEqual(['txt', 'pdf'], list(outputs))
+        pages = split_text_pages(outputs['txt'])
+        self.assertEqual(2, len(pages))
+        self.assertIn('A some english text to test Tesseract', pages[0])
+        self.assertIn('Проверяем', pages[1])
+        self.assertEqual(2, pdf_info(outputs['pdf'])['numPages'])
+
+    def test_detect_lang(self):
+        """
+        This function tests that languages of tesseract are detected by scripts of a text and an image
+        :return: None
+        """
+        self.assertEqual('eng', detect_text_lang('A some english text to test Tesseract ' * 3))
+        self.assertEqual('rus', detect_text_lang('Проверяем распознавание русского текста ' * 3))
+        self.assertEqual('rus+eng', detect_text_lang('Проверяем распознавание текста Tesseract OCR ' * 3))
+        self.assertEqual('', detect_text_lang('short'))
+        # OSD may have a low confidence for a small image, then OCR_TESSERACT_LANG is used
+        self.assertIn(detect_image_lang(read_binary_file(TESTS_DIR + 'test_eng.png')), ('eng', ''))
+
+
+class TestSupervisor(SimpleTestCase):
+    """
+    This class tests that the supervisor runs subprocesses in slots, kills them after the timeout and counts them
+    """
+    def test_run(self):
+        """
+        This function tests outputs, exit codes and the timeout of subprocesses run by the supervisor,
+        the timeout kills the whole process group of a subprocess
+        :return: None
+        """
+        with tempfile.TemporaryDirectory() as slots_dir:
+            runner = Supervisor(2, slots_dir)
+            self.assertEqual((0, b'content'), runner.run(['cat'], b'content'))
+            self.assertEqual(3, runner.run(['sh', '-c', 'exit 3'])[0])
+            started = time.monotonic()
+            with self.assertRaises(ProcessTimeoutError) as raised:
+                # the child sleep keeps stdout open, it is closed only if the process group is killed
+                runner.run(['sh', '-c', 'sleep 30 & wait'], timeout=0.5)
+            self.assertLess(time.monotonic() - started, 10)
+            self.assertIsInstance(raised.exception, ProcessError)
+            self.assertEqual('process_timeout', raised.exception.code)
+            stats = runner.stats()
+            self.assertEqual(3, stats['started'])
+            self.assertEqual(1, stats['failed'])
+            self.assertEqual(1, stats['killed'])
+            self.assertEqual(0, stats['running'])
+            # limits are set in the child before the command is executed
+            with self.settings(OCR_SUBPROCESS_CPU_LIMIT=7, OCR_SUBPROCESS_MEMORY_LIMIT=0):
+                self.assertEqual((0, b'7\n'), runner.run(['sh', '-c', 'ulimit -t']))
+
+    def test_cmd_stdin_error(self):
+        """
+        This function tests that a failed OCR command raises ProcessError instead of returning an empty output
+        :return: None
+        """
+        self.assertEqual(b'content', cmd_stdin(['cat'], b'content'))
+        with self.assertRaises(ProcessError) as raised:
+            cmd_stdin(['sh', '-c', 'exit 3'], b'')
+        self.assertEqual(3, raised.exception.returncode)
+        with self.assertRaises(ProcessError) as raised:
+            cmd_stdin(['sh', '-c', 'kill -9 $$'], b'')
+        self.assertEqual(-9, raised.exception.returncode)
+        self.assertEqual(b'', cmd_stdin(['sh', '-c', 'exit 4'], b'', ok_codes=(0, 4)))
+
+    def test_concurrency(self):
+        """
+        This function tests that subprocesses wait for a free slot, the slot is shared by supervisors of processes
+        :return: None
+        """
+        with tempfile.TemporaryDirectory() as slots_dir:
+            runners = [Supervisor(1, slots_dir), Supervisor(1, slots_dir)]
+            threads = [threading.Thread(target=runner.run, args=(['sleep', '0.5'], )) for runner in runners]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertGreaterEqual(max(runner.stats()['max_wait_seconds'] for runner in runners), 0.3)
+
 
 class TestOcrMyPdf(SimpleTestCase):
     """
@@ -514,6 +763,66 @@ class TestOcrMyPdf(SimpleTestCase):
         self.assertIn('A some english text to test Tesseract', pdf_text)
         self.assertIn('A some english text to test Tesseract', new_pdf_text)
 
+    def test_pdf2pdf_parallel(self):
+        """
+        This function tests that ocrmypdf processes OCR page ranges of a multi-page pdf concurrently
+        and searchable pages and text are merged back in order
+        :return: None
+        """
+        self.assertEqual([(0, 2), (2, 4), (4, 5)], pdf_page_ranges(5, 3))
+        self.assertEqual([(0, 1), (1, 2)], pdf_page_ranges(2, 4))
+        content = pdf_merge([read_binary_file(TESTS_DIR + 'test_eng_notext.pdf'),
+                             read_binary_file(TESTS_DIR + 'shmakovpn.pdf'),
+                             read_binary_file(TESTS_DIR + 'test_eng_notext.pdf')])
+        self.assertEqual(3, pdf_info(content)['numPages'])
+        filename = TESTS_DIR + '/pdf/' + md5(content) + '.pdf'
+        pdf_text = ocr_pdf(content, filename, processes=2)
+        new_content = read_binary_file(filename)
+        if os.path.isfile(filename):
+            os.remove(filename)
+        self.assertEqual(3, pdf_info(new_content)['numPages'])
+        pages = pdf_text.split('\f')
+        self.assertIn('A some english text to test Tesseract', pages[0])
+        self.assertIn('A some english text to test Tesseract', pages[-1])
+        self.assertIn('A some english text to test Tesseract', pdf2text(new_content))
+        # a failed page range falls back to one run of ocrmypdf for the whole document
+        calls = []
+
+        def fail_first_range(stdin, part_filename, jobs=None, lang=None):
+            calls.append(part_filename)
+            if part_filename.endswith(os.sep + '0.pdf'):
+                return ''  # ocrmypdf exited without the searchable pdf
+            return ocrmypdf(stdin, part_filename, jobs=jobs, lang=lang)
+        with mock.patch('ocr.utils.ocrmypdf', side_effect=fail_first_range):
+            failed_text = ocr_pdf(content, filename, processes=2)
+        self.assertEqual(filename, calls[-1])
+        new_content = read_binary_file(filename)
+        if os.path.isfile(filename):
+            os.remove(filename)
+        self.assertEqual(3, pdf_info(new_content)['numPages'])
+        self.assertEqual(3, len(failed_text.split('\f')))
+        self.assertIn('A some english text to test Tesseract', failed_text.split('\f')[0])
+
+    def test_pdf2pdf_hybrid(self):
+        """
+        This function tests that ocrmypdf OCRs only image-only pages of a partly searchable pdf
+        and the other pages are kept in the searchable pdf as is
+        :return: None
+        """
+        content = pdf_merge([read_binary_file(TESTS_DIR + 'the_pdf_withtext.pdf'),
+                             read_binary_file(TESTS_DIR + 'test_eng_notext.pdf')])
+        filename = TESTS_DIR + '/pdf/' + md5(content) + '.pdf'
+        texts = ocr_pdf_pages(content, filename, [False, True])
+        new_content = read_binary_file(filename)
+        if os.path.isfile(filename):
+            os.remove(filename)
+        self.assertEqual(1, len(texts))
+        self.assertIn('A some english text to test Tesseract', texts[0])
+        pages_text = pdf2pages(new_content)
+        self.assertEqual(2, len(pages_text))
+        self.assertIn('The test if pdf with text', pages_text[0])
+        self.assertIn('A some english text to test Tesseract', pages_text[1])
+
 
 class TestSaveModel(OcrTestCase):
     """
@@ -521,6 +830,110 @@ class TestSaveModel(OcrTestCase):
     Then examines that each of these are saves as expected.
      2019-03-16/2019-03-29
     """
+    def get_raw_text(self, pk):
+        """
+        This function returns OCRedFile.text as it is stored in the database
+        :param pk: the id of OCRedFile
+        :return: the stored value
+        """
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT text FROM ocr_ocredfile WHERE id = %s', [pk])
+            return cursor.fetchone()[0]
+
+    @override_settings(OCR_STORE_FILES=True, OCR_STORE_PDF=True)
+    def test_sharded_storage(self):
+        """
+        This function tests that files of an OCRedFile are stored in the content-addressed layout,
+        ocr_migrate_storage moves a file stored flat to it and names of files of both layouts are resolved
+        :return: None
+        """
+        ocred_file = self.createOCRedFile(filename='test_eng.png', file_type='image/png')
+        md5_value = ocred_file.md5
+        shards = md5_value[:2] + '/' + md5_value[2:4] + '/'
+        self.assertEqual('ocr/upload/' + shards + md5_value + '.png', ocred_file.file.name)
+        self.assertEqual('ocr/pdf/' + shards + md5_value + '.pdf', ocred_file.ocred_pdf.name)
+        self.assertTrue(os.path.isfile(ocred_file.file.path))
+        self.assertEqual(ocred_file.file.name, resolve_stored_name('ocr/upload/', md5_value + '.png'))
+        # the file stored flat before the content-addressed layout
+        flat_name = 'ocr/upload/test_eng.png'
+        os.rename(ocred_file.file.path, default_storage.path(flat_name))
+        OCRedFile.objects.filter(pk=ocred_file.pk).update(file=flat_name)
+        self.assertEqual(flat_name, resolve_stored_name('ocr/upload/', 'test_eng.png'))
+        call_command('ocr_migrate_storage', stdout=StringIO())
+        ocred_file = OCRedFile.objects.get(pk=ocred_file.pk)
+        self.assertEqual('ocr/upload/' + shards + md5_value + '.png', ocred_file.file.name)
+        self.assertTrue(os.path.isfile(ocred_file.file.path))
+        self.assertFalse(os.path.isfile(default_storage.path(flat_name)))
+        self.assertIsNone(resolve_stored_name('ocr/upload/', 'test_eng.png'))
+        with self.settings(OCR_STORAGE_SHARD_LEVELS=0):
+            self.assertEqual('ocr/pdf/' + md5_value + '.pdf', set_pdffile_name(ocred_file, True))
+
+    @override_settings(OCR_STORE_FILES=True, OCR_STORE_PDF=False)
+    def test_compressed_text(self):
+        """
+        This function tests that OCRedFile.text is compressed on save if OCR_TEXT_COMPRESSION is set,
+        it is decompressed on the first read, pages are read from a deferred compressed text
+        and ocr_compress_text converts stored texts
+        :return: None
+        """
+        text = 'The first page ' * 40 + '\f' + 'The second page ' * 40
+        self.assertEqual(text, decompress_text(compress_text(text, 'zlib', 6, 0)))
+        self.assertEqual('short', compress_text('short', 'zlib', 6, 0))  # it does not get smaller
+        ocred_file = self.createOCRedFile(filename='test_eng.png', file_type='image/png')
+        ocred_file.set_text_pages(split_text_pages(text))
+        with self.settings(OCR_TEXT_COMPRESSION='zlib'):
+            OCRedFile.objects.filter(pk=ocred_file.pk).update(text=ocred_file.text,
+                                                             text_page_offsets=ocred_file.text_page_offsets)
+        self.assertTrue(is_compressed_text(self.get_raw_text(ocred_file.pk)))
+        loaded = OCRedFile.objects.get(pk=ocred_file.pk)
+        self.assertTrue(is_compressed_text(loaded.__dict__['text']))  # it is not decompressed until it is read
+        self.assertEqual(text, loaded.text)
+        self.assertEqual(text, loaded.__dict__['text'])
+        # a value compressed by a previous version is base64
+        legacy = '\x1bzlib:' + base64.b64encode(zlib.compress(text.encode('utf-8'))).decode('ascii')
+        self.assertEqual(text, decompress_text(legacy))
+        self.assertLess(len(compress_text(text, 'zlib', 6, 0)), len(legacy))
+        self.assertEqual(['The second page ' * 40],
+                         OCRedFile.objects.defer('text').get(pk=ocred_file.pk).get_text_pages(2))
+        call_command('ocr_compress_text', algorithm='none', stdout=StringIO())
+        self.assertEqual(text, self.get_raw_text(ocred_file.pk))
+        self.assertEqual(['The second page ' * 40],
+                         OCRedFile.objects.defer('text').get(pk=ocred_file.pk).get_text_pages(2))
+        call_command('ocr_compress_text', algorithm='zlib', stdout=StringIO())
+        self.assertTrue(is_compressed_text(self.get_raw_text(ocred_file.pk)))
+
+    @override_settings(OCR_STORE_FILES=True, OCR_STORE_PDF=True)
+    def test_stage_timings(self):
+        """
+        This function tests that wall seconds, CPU seconds and bytes of stages of the processing are stored
+        in OCRedFile.stage_timings and they are aggregated by the content type and the number of pages
+        :return: None
+        """
+        ocred_file = self.createOCRedFile(filename='test_eng.png', file_type='image/png')
+        stages = parse_stage_timings(OCRedFile.objects.get(pk=ocred_file.pk).stage_timings)
+        for stage in ('hash', 'ocr', 'storage', 'index'):
+            self.assertIn(stage, stages)
+            self.assertGreaterEqual(stages[stage]['wall'], 0)
+            self.assertGreaterEqual(stages[stage]['cpu'], 0)
+        size = os.path.getsize(TESTS_DIR + 'test_eng.png')
+        self.assertEqual(size, stages['hash']['bytes'])
+        self.assertGreater(stages['ocr']['cpu'], 0)  # tesseract is a subprocess
+        ocred_file = self.createOCRedFile(filename='test_eng_notext.pdf', file_type='application/pdf')
+        stages = parse_stage_timings(OCRedFile.objects.get(pk=ocred_file.pk).stage_timings)
+        self.assertIn('pdf_parse', stages)
+        self.assertIn('ocr', stages)
+        report = OCRedFile.stage_stats(stages=['ocr'], percents=(50, 95))
+        self.assertEqual([('application/pdf', 'ocr'), ('image/png', 'ocr')],
+                         [(row['file_type'], row['stage']) for row in report])
+        self.assertEqual(1, report[1]['count'])
+        self.assertEqual('1', report[1]['pages'])
+        self.assertEqual(report[1]['wall_p50'], report[1]['wall_p95'])
+        self.assertEqual([1, 2, 3, 4, 5], [percentile(list(range(1, 101)), percent) for percent in (1, 2, 3, 4, 5)])
+        self.assertEqual(['1', '2-10', '11-100', '>100'], [page_group(pages) for pages in (1, 5, 100, 101)])
+        output = StringIO()
+        call_command('ocr_stage_stats', stage=['ocr'], json=True, stdout=output)
+        self.assertEqual(report, json.loads(output.getvalue()))
+
     @override_settings(OCR_STORE_FILES=True, OCR_STORE_PDF=True)
     def test_save_model_file_pdf(self):
         """
@@ -592,6 +1005,56 @@ class TestSaveModel(OcrTestCase):
                              md5='13d7a3a85a6d09045d22c1a95fea7d04',
                              text='')
 
+    @override_settings(OCR_STORE_FILES=True, OCR_STORE_PDF=True)
+    def test_save_model_hashes(self):
+        """
+        This function tests that md5 of an uploaded file and md5 of its searchable PDF are indexed in OCRedHash,
+        a duplicate is found with one query, and OCRedHash is removed with the OCRedFile
+        :return: None
+        """
+        ocred_file = OcrTestCase.createOCRedFile(filename='test_eng.png', file_type='image/png')
+        self.assertEqual({(ocred_file.md5, OCRedHash.KIND_FILE), (ocred_file.ocred_pdf_md5, OCRedHash.KIND_PDF)},
+                         set(ocred_file.hashes.values_list('md5', 'kind')))
+        with self.assertNumQueries(1):
+            self.assertFalse(OCRedFile.is_valid_ocr_md5(ocred_file.md5))
+        with self.assertRaises(Md5PdfDuplicationError):
+            OCRedFile.is_valid_ocr_md5(ocred_file.ocred_pdf_md5, raise_exception=True)
+        self.assertEqual(ocred_file.pk, OCRedFile.objects.get(hashes__md5=ocred_file.ocred_pdf_md5).pk)
+        # a created searchable PDF replaces md5 of the removed one
+        ocred_file.remove_pdf()
+        ocred_file.create_pdf()
+        self.assertEqual(ocred_file.ocred_pdf_md5,
+                         ocred_file.hashes.get(kind=OCRedHash.KIND_PDF).md5)
+        ocred_file.delete()
+        self.assertFalse(OCRedHash.objects.exists())
+        with self.assertNumQueries(1):
+            self.assertTrue(OCRedFile.is_valid_ocr_md5('8aabb1f2d2d92893b5604da701f05505'))
+
+    @override_settings(OCR_STORE_FILES=True, OCR_STORE_PDF=True, OCR_STORE_HOCR=True)
+    def test_save_model_file_pdf_hocr(self):
+        """
+        This function tests that when OCR_STORE_HOCR=True \
+        after save model hOCR of an image is stored \
+        and it is used to create ocred_pdf after the removing of ocred_pdf
+        :return: None
+        """
+        ocred_file = OcrTestCase.createOCRedFile(filename='test_eng.png', file_type='image/png')
+        self.assertOCRedFile(ocred_file,
+                             md5='8aabb1f2d2d92893b5604da701f05505',
+                             text='A some english text to test Tesseract')
+        self.assertTrue(ocred_file.has_hocr)
+        hocr_path = ocred_file.ocred_hocr.path
+        ocred_file.remove_pdf()
+        self.assertTrue(ocred_file.can_create_pdf)
+        ocred_file.create_pdf()
+        self.assertTrue(ocred_file.can_remove_pdf)
+        pdf_content = read_binary_file(ocred_file.ocred_pdf.path)
+        self.assertTrue(pdf_content.startswith(b'%PDF'))
+        self.assertIn('Tesseract', pdf2text(pdf_content))
+        # hOCR is removed with the instance of OCRedFile
+        ocred_file.delete()
+        self.assertFalse(os.path.isfile(hocr_path))
+
     @override_settings(OCR_STORE_FILES=True, OCR_STORE_PDF=False)
     def test_save_model_file_nopdf(self):
         """
@@ -611,11 +1074,13 @@ class TestSaveModel(OcrTestCase):
         self.assertFalse(ocred_file.can_remove_pdf)
         self.assertTrue(os.path.isfile(ocred_file.file.path))
         self.assertTrue(ocred_file.can_create_pdf)
+        self.assertTrue(ocred_file.ocred_pdf_md5 is None)  # text only, pdf was not generated
         # 1.2 testing creating pdf
         ocred_file.create_pdf()
         self.assertTrue(ocred_file.can_remove_pdf)
         self.assertFalse(ocred_file.can_create_pdf)
         self.assertTrue(os.path.isfile(ocred_file.ocred_pdf.path))
+        self.assertTrue(bool(ocred_file.ocred_pdf_md5))
         # 2 testing pdf with text
         ocred_file = OcrTestCase.createOCRedFile(filename='the_pdf_withtext.pdf', file_type='application/pdf')
         self.assertOCRedFile(ocred_file,
@@ -699,8 +1164,30 @@ class TestAPISerializer(OcrApiSerializerTestCase):
         # testing list_view
         request = APIRequestFactory().get(reverse(__package__+':list'),
                                           HTTP_AUTHORIZATION='Token {}'.format(self.client.token), )
-        response = OCRedFileList.as_view()(request)
+        with self.assertNumQueries(2):
+            # the token and one page of OCRedFiles, properties do not load deferred columns row by row
+            response = OCRedFileList.as_view()(request)
         self.assertEqual(200, response.status_code, )
+        self.assertEqual(4, len(response.data['data']))
+        self.assertNotIn('text', response.data['data'][0])
+        self.assertIn('download_file', response.data['data'][0])
+        # testing the keyset pagination and the projection of fields
+        md5s = []
+        url = reverse(__package__+':list') + '?limit=3&fields=md5,text'
+        while url:
+            request = APIRequestFactory().get(url, HTTP_AUTHORIZATION='Token {}'.format(self.client.token), )
+            response = OCRedFileList.as_view()(request)
+            self.assertEqual(200, response.status_code, )
+            for item in response.data['data']:
+                self.assertEqual(['md5', 'text'], list(item))
+                md5s.append(item['md5'])
+            url = response.data['next']
+        self.assertEqual(list(OCRedFile.objects.order_by('-uploaded', '-id').values_list('md5', flat=True)), md5s)
+        for query in ('?fields=wrong', '?cursor=wrong', '?limit=wrong'):
+            request = APIRequestFactory().get(reverse(__package__+':list') + query,
+                                              HTTP_AUTHORIZATION='Token {}'.format(self.client.token), )
+            response = OCRedFileList.as_view()(request)
+            self.assertEqual(400, response.status_code, )
 
 
 class TestApiUploadView(OcrApiViewTestCase):
@@ -726,12 +1213,164 @@ class TestApiUploadView(OcrApiViewTestCase):
         # uploading the file with wrong file_type
         response = self.upload_file(filename='not_image.txt')
         self.assertUploadFileWrongTypeResponse(response)
+        self.assertEqual(getattr(settings, 'OCR_TESSERACT_LANG', ocr_default_settings.TESSERACT_LANG),
+                         OCRedFile.objects.get(md5='8aabb1f2d2d92893b5604da701f05505').lang)
+
+    def test_processes_view(self):
+        """
+        This function tests that processes/ returns counters of subprocesses of OCR
+        :return: None
+        """
+        started = supervisor.stats()['started']
+        self.upload_file(filename='test_eng.png')
+        response = self.client.get(reverse(__package__ + ':processes'))
+        self.assertEqual(200, response.status_code)
+        self.assertLess(started, response.data['data']['started'])
+        self.assertEqual(0, response.data['data']['running'])
+        self.assertIn('max_wait_seconds', response.data['data'])
+
+    def test_metrics_view(self):
+        """
+        This function tests that metrics/ returns counters and histograms of stages of uploads
+        in the text format of Prometheus, increments of all registries are aggregated in the database
+        :return: None
+        """
+        before = metrics.values()  # increments of other tests are flushed
+        self.upload_file(filename='test_eng.png')
+        self.upload_file(filename='test_eng.png')
+        response = self.client.get(reverse(__package__ + ':metrics'))
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        text = response.content.decode()
+        self.assertIn('# TYPE ocr_uploads_total counter', text)
+        self.assertIn('# TYPE ocr_stage_seconds histogram', text)
+        values = {series: float(value) for series, value in re.findall(r'^([^#\s]\S*) (\S+)$', text, re.MULTILINE)}
+        for series in ('ocr_uploads_total{result="created"}', 'ocr_uploads_total{result="duplicate"}',
+                       'ocr_files_created_total{file_type="image/png"}'):
+            self.assertEqual(1, values[series] - before.get(series, 0))
+        for stage in ('upload', 'hash', 'ocr', 'storage'):
+            self.assertIn('ocr_stage_seconds_count{{stage="{}"}}'.format(stage), values)
+        buckets = re.findall(r'^ocr_stage_seconds_bucket\{stage="upload",le="([^"]+)"\} (\d+)$', text, re.MULTILINE)
+        self.assertEqual('+Inf', buckets[-1][0])
+        self.assertEqual(values['ocr_stage_seconds_count{stage="upload"}'], int(buckets[-1][1]))
+        self.assertEqual(sorted(int(count) for bound, count in buckets), [int(count) for bound, count in buckets])
+        # increments of a registry of another process are added when it flushes them
+        created = metrics.value('ocr_uploads_total', result='created')
+        registry = Registry((1, ), 3600)
+        with self.assertNumQueries(0):  # increments are flushed by the flushing thread, not by the caller
+            registry.inc('ocr_uploads_total', result='created')
+            registry.observe('ocr_subprocess_wait_seconds', 0.5, command='test')
+        self.assertEqual(created, metrics.value('ocr_uploads_total', result='created'))
+        registry.flush()  # existing series are updated and new series are inserted
+        self.assertEqual(created + 1, metrics.value('ocr_uploads_total', result='created'))
+        self.assertEqual(1, metrics.value('ocr_subprocess_wait_seconds_bucket', command='test', le=1))
+        self.assertEqual(0.5, metrics.value('ocr_subprocess_wait_seconds_sum', command='test'))
+
+    def test_upload_file_lang(self):
+        """
+        This function tests that requested languages of tesseract are used and recorded,
+        'auto' is replaced by languages of the detected script
+        :return: None
+        """
+        response = self.upload_file(filename='test_eng.png', lang='wrong+eng')
+        self.assertEqual(400, response.status_code)
+        self.assertEqual(LangError.CODE, response.data['code'])
+        response = self.upload_file(filename='test_eng.png', lang='eng')
+        self.assertUploadFileResponse(response, text='A some english text to test Tesseract')
+        self.assertEqual('eng', response.data['data']['lang'])
+        response = self.upload_file(filename='test_eng_notext.pdf', lang='auto')
+        self.assertEqual(201, response.status_code)
+        self.assertIn(response.data['data']['lang'],
+                      ('eng', getattr(settings, 'OCR_TESSERACT_LANG', ocr_default_settings.TESSERACT_LANG)))
+        # 'auto' is resolved by the text of a PDF which is not OCRed
+        response = self.upload_file(filename='the_pdf_withtext.pdf', lang='auto')
+        self.assertEqual(201, response.status_code)
+        self.assertTrue(response.data['data']['lang'])
+        self.assertNotEqual(OCRedFile.LANG_AUTO, response.data['data']['lang'])
+        self.assertEqual(response.data['data']['lang'], OCRedFile.objects.get(md5=response.data['data']['md5']).lang)
+
+
+class TestApiAsyncUploadView(OcrApiViewTestCase):
+    """
+    This class intended to test the upload of OCR Server API when OCR_ASYNC is True
+    """
+    @override_settings(OCR_ASYNC=True)
+    def test_async_upload_file_view(self):
+        """
+        This function tests that uploading files via API queues an OCRJob,
+        the job status view reports the status of the OCRJob
+        and the result of OCR after an OCR worker has processed it
+        :return: None
+        """
+        response = self.upload_file(filename='test_eng.png')
+        self.assertEqual(202, response.status_code,
+                         'Expected Response Code 202 received {} instead.'.format(response.status_code))
+        self.assertFalse(response.data['error'])
+        self.assertTrue(response.data['queued'])
+        self.assertEqual('queued', response.data['data']['status'])
+        self.assertEqual('8aabb1f2d2d92893b5604da701f05505', response.data['data']['md5'])
+        job_id = response.data['job']
+        # uploading the same file while it is queued returns the same OCRJob
+        response = self.upload_file(filename='test_eng.png')
+        self.assertEqual(202, response.status_code)
+        self.assertEqual(job_id, response.data['job'])
+        self.assertEqual(0, OCRedFile.objects.count())
+        # job status before processing
+        response = self.client.get(reverse(__package__ + ':job', kwargs={'job_id': job_id}))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('queued', response.data['data']['status'])
+        self.assertTrue('result' not in response.data)
+        # processing of the queue by an OCR worker
+        self.assertEqual(1, run_worker(once=True))
+        response = self.client.get(reverse(__package__ + ':job', kwargs={'job_id': job_id}))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('done', response.data['data']['status'])
+        self.assertTrue(response.data['data']['started'] is not None)
+        self.assertTrue(response.data['data']['finished'] is not None)
+        self.assertIn('A some english text to test Tesseract', response.data['result']['text'])
+        job = OCRJob.objects.get(pk=job_id)
+        self.assertFalse(os.path.isfile(job.file.path))
+        self.assertOCRedFile(job.ocred_file, md5='8aabb1f2d2d92893b5604da701f05505',
+                             text='A some english text to test Tesseract')
+        # uploading the processed file returns the OCRedFile
+        response = self.upload_file(filename='test_eng.png')
+        self.assertUploadFileDuplicationResponse(response, md5='8aabb1f2d2d92893b5604da701f05505')
+        # job that does not exist
+        response = self.client.get(reverse(__package__ + ':job', kwargs={'job_id': job_id + 1}))
+        self.assertEqual(204, response.status_code)
+        self.assertFalse(response.data['exists'])
+
+    @override_settings(OCR_ASYNC=True, OCR_STORE_FILES=True)
+    def test_async_failed_job(self):
+        """
+        This function tests that a failed OCRJob leaves no stored files
+        :return: None
+        """
+        response = self.upload_file(filename='test_eng.png')
+        self.assertEqual(202, response.status_code)
+        job_id = response.data['job']
+        paths = []
+
+        def failing_save(ocred_file, *args, **kwargs):
+            paths.append(ocred_file.file.path)
+            raise RuntimeError('OCR failed')
+
+        with mock.patch.object(OCRedFile, 'save', autospec=True, side_effect=failing_save):
+            self.assertEqual(1, run_worker(once=True))
+        job = OCRJob.objects.get(pk=job_id)
+        self.assertEqual(OCRJob.STATUS_FAILED, job.status)
+        self.assertEqual('OCR failed', job.error)
+        self.assertEqual(1, len(paths))
+        self.assertFalse(os.path.isfile(paths[0]))
+        self.assertFalse(os.path.isfile(job.file.path))
+        self.assertEqual(0, OCRedFile.objects.count())
 
 
 class TestApiMd5Views(OcrApiViewTestCase):
     """
     This class tests next views:
     <md5:md5>/
+    <md5:md5>/text/
     remove/<md5:md5>/
     remove/file/<md5:md5>/
     remove/pdf/<md5:md5>/
@@ -828,6 +1467,113 @@ class TestApiMd5Views(OcrApiViewTestCase):
         self.assertFalse(response_doesnot_exist.data['error'])
         self.assertFalse(response_doesnot_exist.data['exists'])
 
+    @override_settings(OCR_STORE_FILES=True, OCR_STORE_PDF=True)
+    def test_download_view(self):
+        """
+        This function tests that DownloadView streams files, returns ranges of bytes,
+        uses the md5 as the ETag and passes files to the front web server if OCR_DOWNLOAD_ACCEL is set
+        :return: None
+        """
+        self.ocred_file = self.createOCRedFile(filename=self.filename, file_type=self.file_type)
+        url = self.get_self_md5_view().data['data']['download_file']
+        with open(self.ocred_file.file.path, 'rb') as file:
+            content = file.read()
+        response = self.client.get(url)
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(response.streaming)
+        self.assertEqual(content, b''.join(response.streaming_content))
+        self.assertEqual('"{}"'.format(self.md5), response['ETag'])
+        self.assertEqual('bytes', response['Accept-Ranges'])
+        # ranges of bytes
+        response = self.client.get(url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(206, response.status_code)
+        self.assertEqual('bytes 10-19/{}'.format(len(content)), response['Content-Range'])
+        self.assertEqual(content[10:20], b''.join(response.streaming_content))
+        response = self.client.get(url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(206, response.status_code)
+        self.assertEqual(content[-5:], b''.join(response.streaming_content))
+        response = self.client.get(url, HTTP_RANGE='bytes={}-'.format(len(content)))
+        self.assertEqual(416, response.status_code)
+        response = self.client.get(url, HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE='"wrong"')
+        self.assertEqual(200, response.status_code)
+        response.close()
+        # conditional requests
+        response = self.client.get(url, HTTP_IF_NONE_MATCH='"{}"'.format(self.md5))
+        self.assertEqual(304, response.status_code)
+        # the front web server
+        with self.settings(OCR_DOWNLOAD_ACCEL='nginx'):
+            response = self.client.get(url)
+            self.assertEqual(200, response.status_code)
+            self.assertEqual(b'', response.content)
+            self.assertTrue(response['X-Accel-Redirect'].startswith('/protected/ocr/upload/'))
+        with self.settings(OCR_DOWNLOAD_ACCEL='sendfile'):
+            response = self.client.get(url)
+            self.assertEqual(self.ocred_file.file.path, response['X-Sendfile'])
+
+    @override_settings(OCR_STORE_FILES=True, OCR_STORE_PDF=True)
+    def test_md5_view_cache(self):
+        """
+        This function tests that the Md5 apiview caches the serialized OCRedFile,
+        the cache is invalidated by remove_pdf and delete, counters of the cache are returned by cache/
+        :return: None
+        """
+        md5_cache.clear()
+        self.ocred_file = self.createOCRedFile(filename=self.filename, file_type=self.file_type)
+        self.get_self_md5_view()
+        response = self.get_self_md5_view()
+        self.assertEqual(1, md5_cache.hits)
+        self.assertTrue(response.data['data']['can_remove_pdf'])
+        self.ocred_file.remove_pdf()
+        self.assertFalse(self.get_self_md5_view().data['data']['can_remove_pdf'])
+        response = self.client.get(reverse(__package__ + ':cache'))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, response.data['data']['hits'])
+        self.assertEqual(2, response.data['data']['misses'])
+        self.ocred_file.delete()
+        response = self.client.get(reverse(__package__ + ':md5', kwargs={'md5': self.md5}))
+        self.assertEqual(204, response.status_code)
+
+    @override_settings(OCR_STORE_FILES=True, OCR_STORE_PDF=True)
+    def test_md5_text_view(self):
+        """
+        This function tests that Md5Text apiview returns only texts of the requested pages:
+        1. the first page by default
+        2. a range of pages
+        3. 400 for a page that does not exist and for a wrong 'page' parameter
+        4. 204 for md5 that does not exist
+        :return: None
+        """
+        self.ocred_file = self.createOCRedFile(filename=self.filename, file_type=self.file_type)
+        url = reverse(__package__ + ':md5_text', kwargs={'md5': self.md5})
+        response = self.client.get(url)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, response.data['num_pages'])
+        self.assertEqual(1, response.data['pages'][0]['page'])
+        self.assertIn(self.text, response.data['pages'][0]['text'])
+        # a document of three pages
+        ocred_file = OCRedFile(text='')
+        ocred_file.set_text_pages(['The first page', 'The second\npage\f', 'The third page'])
+        OCRedFile.objects.filter(pk=self.ocred_file.pk).update(text=ocred_file.text,
+                                                              text_page_offsets=ocred_file.text_page_offsets)
+        response = self.client.get(url, {'page': '2-3'})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(3, response.data['num_pages'])
+        self.assertEqual([{'page': 2, 'text': 'The second\npage'}, {'page': 3, 'text': 'The third page'}],
+                         response.data['pages'])
+        response = self.client.get(url, {'page': '1'})
+        self.assertEqual([{'page': 1, 'text': 'The first page'}], response.data['pages'])
+        response = self.client.get(url, {'page': '4'})
+        self.assertEqual(400, response.status_code)
+        self.assertTrue(response.data['error'])
+        self.assertEqual(3, response.data['num_pages'])
+        response = self.client.get(url, {'page': 'first'})
+        self.assertEqual(400, response.status_code)
+        self.assertTrue(response.data['error'])
+        response = self.client.get(reverse(__package__ + ':md5_text',
+                                           kwargs={'md5': '7aabb1f2d2d92893b5604da701f05500'}))
+        self.assertEqual(204, response.status_code)
+        self.assertFalse(response.data['exists'])
+
     @override_settings(OCR_STORE_FILES=True, OCR_STORE_PDF=False)
     def test_md5_view_files_nopdf(self):
         """
@@ -851,7 +1597,7 @@ class TestApiMd5Views(OcrApiViewTestCase):
         self.assertFalse(response.data['data']['can_remove_pdf'])
         self.assertTrue(response.data['data']['can_create_pdf'])
         self.assertTrue(response.data['data']['download_ocred_pdf'] is None)
-        self.assertTrue(response.data['data']['ocred_pdf_md5'] is not None)
+        self.assertTrue(response.data['data']['ocred_pdf_md5'] is None)  # pdf was not generated
         # create pdf
         self.ocred_file.create_pdf()
         response_create_pdf = self.get_self_md5_view()
@@ -1004,6 +1750,112 @@ class TestApiMd5Views(OcrApiViewTestCase):
         self.assertFalse(response.data['can_create_pdf'])
         self.assertFalse(response.data['created'])
 
+class TestApiSearchView(OcrApiViewTestCase):
+    """
+    This class tests the full-text search index and the search/ view
+    """
+    def test_search_index(self):
+        """
+        This function tests that pages are indexed, found by all words of a query and removed from the index
+        :return: None
+        """
+        index_pages(7, ['The first page with a word', '', 'The third page without it'])
+        found = search_pages('page word')
+        self.assertEqual(1, len(found))
+        self.assertEqual(7, found[0]['id'])
+        self.assertEqual(1, found[0]['page'])
+        self.assertEqual([1, 3], sorted(page['page'] for page in search_pages('page')))
+        # the contentless index removes pages by texts as they were indexed
+        unindex(7, ['The first page with a word', '', 'The third page without it'])
+        self.assertEqual([], search_pages('page'))
+        index_pages(7, ['The only page'])
+        self.assertEqual([], search_pages('word'))
+        self.assertEqual(1, len(search_pages('only')))
+        unindex(7, ['The only page'])
+        self.assertEqual([], search_pages('only'))
+        # the markup of an OCRed text is escaped, only found words are highlighted
+        snippet = make_snippet('A page with <script>alert("Word")</script> and <b>bold</b>', ['word'], ('<b>', '</b>'))
+        self.assertNotIn('<script>', snippet)
+        self.assertIn('&lt;script&gt;alert(&quot;<b>Word</b>&quot;)&lt;/script&gt;', snippet)
+        self.assertIn('&lt;b&gt;bold&lt;/b&gt;', snippet)
+        # a snippet is the window of words with the most of found words
+        text = ' '.join(['filler'] * 20 + ['first', 'second'] + ['filler'] * 20)
+        self.assertEqual('...filler <b>first</b> <b>second</b> filler...',
+                         make_snippet(text, ['first', 'SECOND'], ('<b>', '</b>'), tokens=4))
+        with self.assertRaises(SearchQueryError):
+            search_pages('  ')
+
+    @override_settings(OCR_STORE_FILES=True, OCR_STORE_PDF=False)
+    def test_search_view(self):
+        """
+        This function tests that the search/ view:
+        1. finds an uploaded file by words of its text
+        2. returns 400 for an empty query
+        3. does not find a removed file
+        :return: None
+        """
+        ocred_file = self.createOCRedFile(filename='test_eng.png', file_type='image/png')
+        response = self.client.get(reverse(__package__ + ':search'), {'q': 'english tesseract'})
+        self.assertEqual(200, response.status_code)
+        self.assertFalse(response.data['error'])
+        self.assertEqual(1, len(response.data['results']))
+        self.assertEqual('8aabb1f2d2d92893b5604da701f05505', response.data['results'][0]['md5'])
+        self.assertEqual(1, response.data['results'][0]['page'])
+        self.assertIn('<b>', response.data['results'][0]['snippet'])
+        response = self.client.get(reverse(__package__ + ':search'), {'q': 'russian'})
+        self.assertEqual([], response.data['results'])
+        response = self.client.get(reverse(__package__ + ':search'))
+        self.assertEqual(400, response.status_code)
+        self.assertTrue(response.data['error'])
+        ocred_file.delete()
+        response = self.client.get(reverse(__package__ + ':search'), {'q': 'english'})
+        self.assertEqual([], response.data['results'])
+
+
+class TestApiExportView(OcrApiViewTestCase):
+    """
+    This class tests the NDJSON export of OCRedFiles
+    """
+    def get_export(self, **params):
+        """
+        This function requests export/ and returns the response and exported rows
+        :param params: query parameters
+        :return: (response, rows)
+        """
+        response = self.client.get(reverse(__package__ + ':export'), params)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('application/x-ndjson', response['Content-Type'])
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        return response, [json.loads(line) for line in lines]
+
+    @override_settings(OCR_STORE_FILES=True, OCR_STORE_PDF=False, OCR_EXPORT_WATERMARK_LAG=0)
+    def test_export_view(self):
+        """
+        This function tests that the export/ view:
+        1. streams all OCRedFiles with requested fields
+        2. filters OCRedFiles by 'uploaded'
+        3. exports only updated OCRedFiles since the watermark
+        4. returns 400 for wrong fields or filters
+        :return: None
+        """
+        first = self.createOCRedFile(filename='test_eng.png', file_type='image/png')
+        second = self.createOCRedFile(filename='the_pdf_withtext.pdf', file_type='application/pdf')
+        response, rows = self.get_export(fields='md5,text')
+        self.assertEqual([{'md5': first.md5, 'text': first.text}, {'md5': second.md5, 'text': second.text}], rows)
+        response, rows = self.get_export(uploaded_from=second.uploaded.isoformat())
+        self.assertEqual([second.md5], [row['md5'] for row in rows])
+        self.assertIn('updated', rows[0])
+        watermark = response['X-OCR-Watermark']
+        response, rows = self.get_export(since=watermark)
+        self.assertEqual([], rows)
+        first.remove_file()
+        response, rows = self.get_export(since=watermark, fields='md5')
+        self.assertEqual([{'md5': first.md5}], rows)
+        for params in ({'fields': 'file'}, {'since': 'yesterday'}):
+            response = self.client.get(reverse(__package__ + ':export'), params)
+            self.assertEqual(400, response.status_code)
+
+
 class TestApiAllViews(OcrApiViewTestCase):
     """
     This class tests next views:
@@ -1048,6 +1900,30 @@ class TestApiAllViews(OcrApiViewTestCase):
         self.assertFalse(response.data['error'])
         self.assertTrue(response.data['removed'])
         self.assertEqual(3, response.data['count'])
+        self.assertFalse(OCRedFile.objects.exists())
+
+    @override_settings(OCR_STORE_FILES=True, OCR_STORE_PDF=True, OCR_BULK_DELETE_CHUNK_SIZE=2)
+    def test_bulk_delete(self):
+        """
+        This functions tests that OCRedFile.bulk_delete removes OCRedFiles of the queryset chunk by chunk,
+        removes their files and OCRedHashes and counts removed instances like OCRedFile.delete() does
+        :return: None
+        """
+        self.set_up()
+        paths = [path for ocred_file in OCRedFile.objects.all()
+                 for path in (ocred_file.file.path, ocred_file.ocred_pdf.path if ocred_file.ocred_pdf else None)
+                 if path and os.path.isfile(path)]
+        self.assertEqual(5, len(paths))  # three files and two searchable PDFs
+        num_removed_instances = metrics.value('ocr_files_removed_total')
+        num_removed_pdf = metrics.value('ocr_stored_files_removed_total', kind='pdf')
+        result = OCRedFile.bulk_delete(OCRedFile.objects.exclude(md5='55afdb2874e53370a1565776a6bd4ad7'))
+        self.assertEqual(2, result['count'])
+        self.assertEqual(4, result['files'])
+        self.assertEqual(num_removed_instances + 2, metrics.value('ocr_files_removed_total'))
+        self.assertEqual(num_removed_pdf + 2, metrics.value('ocr_stored_files_removed_total', kind='pdf'))
+        self.assertEqual(['55afdb2874e53370a1565776a6bd4ad7'], list(OCRedFile.objects.values_list('md5', flat=True)))
+        self.assertEqual(1, OCRedHash.objects.count())
+        self.assertEqual(1, len([path for path in paths if os.path.isfile(path)]))
 
     @override_settings(OCR_STORE_FILES=True)
     def test_remove_file_all_view(self):
@@ -1317,6 +2193,53 @@ class TestAdmin(OcrAdminTestCase):
         self.assertEqual(1, len(file_download_field2))
 
 
+class TestCleanup(OcrTestCase):
+    """
+    Tests removing of files that are not related with any OCRedFile
+    """
+    def test_reconcile(self):
+        """
+        Tests that reconcile finds files which are not known, removes them unless dry_run and bounds the report
+        :return: None
+        """
+        with tempfile.TemporaryDirectory() as folder:
+            os.makedirs(os.path.join(folder, 'sub'))
+            paths = [os.path.join(folder, 'a'), os.path.join(folder, 'b'), os.path.join(folder, 'sub', 'c')]
+            for path in paths:
+                with open(path, 'wb') as f:
+                    f.write(b'12')
+            report = reconcile(folder, {paths[0]}, dry_run=True, report_limit=1)
+            self.assertEqual(3, report['scanned'])
+            self.assertEqual(2, report['orphans'])
+            self.assertEqual(4, report['bytes'])
+            self.assertEqual(0, report['removed'])
+            self.assertEqual(1, len(report['paths']))
+            self.assertTrue(report['truncated'])
+            self.assertTrue(all(os.path.isfile(path) for path in paths))
+            report = reconcile(folder, {paths[0]}, min_age=3600)
+            self.assertEqual(0, report['orphans'])
+            report = reconcile(folder, {paths[0]})
+            self.assertEqual(2, report['removed'])
+            self.assertEqual([True, False, False], [os.path.isfile(path) for path in paths])
+
+    @override_settings(OCR_STORE_FILES=True, OCR_STORE_PDF=True)
+    def test_cleanup(self):
+        """
+        Tests that OCRedFile.cleanup removes only files that are not related with any OCRedFile
+        :return: None
+        """
+        ocred_file = OcrTestCase.createOCRedFile(filename='test_eng.png', file_type='image/png')
+        orphan = os.path.join(os.path.dirname(ocred_file.file.path), 'orphan.png')
+        with open(orphan, 'wb') as f:
+            f.write(b'12')
+        reports = OCRedFile.cleanup(min_age=0)
+        self.assertFalse(os.path.isfile(orphan))
+        self.assertIn(orphan, reports['files']['paths'])
+        self.assertTrue(os.path.isfile(ocred_file.file.path))
+        self.assertTrue(os.path.isfile(ocred_file.ocred_pdf.path))
+        self.assertNotIn(ocred_file.ocred_pdf.path, reports['pdf']['paths'])
+
+
 class TestTtl(OcrTestCase):
     """
     Tests the time to live feature 2019-04-14
@@ -1374,4 +2297,56 @@ class TestTtl(OcrTestCase):
         self.assertTrue(ocred_file.file_removed)
         self.assertTrue(ocred_file.pdf_removed)
 
+    @override_settings(OCR_TTL=0,
+                       OCR_FILES_TTL=timedelta(days=-1),
+                       OCR_PDF_TTL=0,
+                       OCR_STORE_FILES=True,
+                       OCR_STORE_PDF=True)
+    def test_ttl_sweep(self):
+        """
+        Tests that the TTL sweeper stops when the time budget is spent and publishes the lag,
+        the next sweep continues it, and rows whose file is already removed are skipped
+        :return: None
+        """
+        ocred_file = OcrTestCase.createOCRedFile(filename='test_eng.png', file_type='image/png')
+        result = OCRedFile.ttl_sweep(time_budget=0)
+        self.assertFalse(result['complete'])
+        self.assertEqual(0, result['files_removed'])
+        self.assertGreater(result['lag'], 0)
+        self.assertIsNone(TtlSweep.get().finished)
+        result = OCRedFile.ttl_sweep(batch_size=1)
+        self.assertTrue(result['complete'])
+        self.assertEqual(1, result['files_removed'])
+        self.assertEqual(0, result['lag'])
+        self.assertTrue(OCRedFile.objects.get(pk=ocred_file.pk).file_removed)
+        self.assertFalse(os.path.isfile(ocred_file.file.path))
+        sweep = TtlSweep.get()
+        self.assertIsNotNone(sweep.finished)
+        self.assertEqual(1, sweep.files_removed)
+        self.assertEqual(ocred_file.pk, sweep.file_cursor_id)
+        result = OCRedFile.ttl_sweep()
+        self.assertEqual(0, result['files_removed'])
+        self.assertEqual(0, TtlSweep.get().file_cursor_id)  # the finished sweep found nothing after its start
+
+    @override_settings(OCR_TTL=0,
+                       OCR_FILES_TTL=0,
+                       OCR_PDF_TTL=timedelta(days=-1),
+                       OCR_STORE_FILES=True,
+                       OCR_STORE_PDF=True)
+    def test_ttl_sweep_restart(self):
+        """
+        Tests that a new sweep starts from the oldest row, so a searchable PDF created again
+        behind the cursor of the previous sweep is removed by the next sweep
+        :return: None
+        """
+        ocred_file = OcrTestCase.createOCRedFile(filename='test_eng.png', file_type='image/png')
+        self.assertEqual(1, OCRedFile.ttl_sweep()['pdf_removed'])
+        self.assertEqual(ocred_file.pk, TtlSweep.get().ocred_pdf_cursor_id)
+        ocred_file = OCRedFile.objects.get(pk=ocred_file.pk)
+        self.assertTrue(ocred_file.pdf_removed)
+        self.assertTrue(ocred_file.create_pdf())
+        self.assertTrue(os.path.isfile(ocred_file.ocred_pdf.path))
+        self.assertEqual(1, OCRedFile.ttl_sweep()['pdf_removed'])
+        self.assertTrue(OCRedFile.objects.get(pk=ocred_file.pk).pdf_removed)
+        self.assertFalse(os.path.isfile(ocred_file.ocred_pdf.path))
 
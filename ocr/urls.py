@@ -30,7 +30,13 @@ urlpatterns = [
     path('', RedirectView.as_view(url=reverse_lazy('admin:index'), permanent=False), name='root'),
     path('login/', views.obtain_auth_token, name='login'),
     path('upload/', UploadFile.as_view(), name='upload'),
+    path('job/<int:job_id>/', JobStatus.as_view(), name='job'),
     path('list/', OCRedFileList.as_view(), name='list'),
+    path('search/', Search.as_view(), name='search'),
+    path('export/', Export.as_view(), name='export'),
+    path('cache/', Md5CacheStats.as_view(), name='cache'),
+    path('processes/', SubprocessStats.as_view(), name='processes'),
+    path('metrics/', Metrics.as_view(), name='metrics'),
     path('remove/file/all/', RemoveFileAll.as_view(), name='remove_file_all'),
     path('remove/file/<md5:md5>/', RemoveFileMd5.as_view(), name='remove_file_md5'),
     path('remove/pdf/all/', RemovePdfAll.as_view(), name='remove_pdf_all'),
@@ -40,9 +46,11 @@ urlpatterns = [
     path('remove/all/', RemoveAll.as_view(), name='remove_all'),
     path('remove/<md5:md5>/', RemoveMd5.as_view(), name='remove_md5'),
     path('<md5:md5>/', Md5.as_view(), name='md5'),
+    path('<md5:md5>/text/', Md5Text.as_view(), name='md5_text'),
     path('swagger/', schema_view),
     path('download/<download_target:download_target>/<str:filename>/', DownloadView.as_view(), name='download'),
     path('clean/', Clean.as_view(), name='clean'),
     path('ttl/', Ttl.as_view(), name='ttl'),
+    path('ttl/status/', TtlStatus.as_view(), name='ttl_status'),
 ]
 
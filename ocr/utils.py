@@ -9,6 +9,8 @@ import os
 import re
 import hashlib  # needed to md5 hash calculation
 import subprocess  # needed to run tesseract
+import tempfile
+from concurrent.futures import ThreadPoolExecutor  # needed to run ocrmypdf processes concurrently
 import re
 import regex
 from io import BytesIO  # for conversion a pdf content represented as bytes to an inmemory pdf file
@@ -16,10 +18,25 @@ import pdftotext  # needed to extraction text from pdf
 import PyPDF2  # needed to get pdfInfo
 # from datetime import datetime
 from .settings import TESSERACT_LANG as default_tesseract_lang
+from .settings import PDF_PROCESSES as default_pdf_processes
+from .settings import TIFF_PROCESSES as default_tiff_processes
+from .settings import SCRIPT_LANGS as default_script_langs
+from .settings import LANG_DETECT_MIN_CONFIDENCE as default_lang_detect_min_confidence
+from .settings import LANG_DETECT_MIN_CHARS as default_lang_detect_min_chars
+from .settings import LANG_DETECT_MIN_SHARE as default_lang_detect_min_share
+from .settings import SUBPROCESS_PDF_TIMEOUT as default_subprocess_pdf_timeout
+from .supervisor import supervisor
+from .exceptions import ProcessError, ProcessTimeoutError
 from django.conf import settings
 
 
-TESSERACT_LANG = getattr(settings, 'OCR_TESSERACT_LANG', default_tesseract_lang)
+def tesseract_lang(lang=None):
+    """
+    It returns languages of tesseract, the setting is read on each call, so it can be overridden at runtime
+    :param lang: languages e.g. 'rus+eng' or 'eng', OCR_TESSERACT_LANG if it is empty
+    :return: languages of tesseract as a string
+    """
+    return lang or getattr(settings, 'OCR_TESSERACT_LANG', default_tesseract_lang)
 
 
 def read_binary_file(path):
@@ -34,6 +51,7 @@ def read_binary_file(path):
     return content
 
 
+# every tesseract uses one thread, OCR of a multi-page PDF is parallelized by ocr_pdf using OCR_PDF_PROCESSES
 os.environ['OMP_THREAD_LIMIT'] = '1'
 
 
@@ -48,17 +66,64 @@ def md5(content):
     return hash_md5.hexdigest()
 
 
+def pdf2pages(pdf_content):
+    """
+    It extracts texts of pages of a pdf document
+    :param pdf_content: a content of a pdf file as bytes
+    :return: a list of texts of pages
+    """
+    pdfs = pdftotext.PDF(BytesIO(pdf_content))
+    return [pdfs[page] for page in range(len(pdfs))]
+
+
 def pdf2text(pdf_content):
     """
     It converts pdf_content as bytes to string 2019-03-10
     :param pdf_content: a content of a pdf file as bytes
     :return: text of pdf
     """
-    pdfs = pdftotext.PDF(BytesIO(pdf_content))
-    pdf_text = ''
-    for page in range(len(pdfs)):
-        pdf_text += pdfs[page]
-    return pdf_text
+    return ''.join(pdf2pages(pdf_content))
+
+
+def split_text_pages(text):
+    """
+    It splits a recognized text into texts of pages, pages are separated by the form feed
+    :param text: a recognized text
+    :return: a list of texts of pages
+    """
+    pages_text = text.split('\f')
+    if len(pages_text) > 1 and not pages_text[-1]:
+        pages_text.pop()  # the form feed after the last page
+    return pages_text
+
+
+def text_page_offsets(pages_text, separator=''):
+    """
+    It returns offsets of the ends of pages in the text made by separator.join(pages_text),
+    the separator belongs to the page before it
+    :param pages_text: a list of texts of pages
+    :param separator: a separator of pages
+    :return: a list of offsets
+    """
+    offsets = []
+    offset = 0
+    for page_text in pages_text:
+        offset += len(page_text) + len(separator)
+        offsets.append(offset)
+    if offsets:
+        offsets[-1] -= len(separator)
+    return offsets
+
+
+def get_pdf_reader(pdf):
+    """
+    It returns a PyPDF2.PdfFileReader of a pdf document
+    :param pdf: a content of a pdf file as bytes or an already opened PyPDF2.PdfFileReader
+    :return: PyPDF2.PdfFileReader
+    """
+    if isinstance(pdf, PyPDF2.PdfFileReader):
+        return pdf
+    return PyPDF2.PdfFileReader(BytesIO(pdf))
 
 
 def pdf_info(pdf_content):
@@ -67,6 +132,15 @@ def pdf_info(pdf_content):
     :param pdf_content: a content of a pdf file as bytes
     :return: pdf info as {}-object
     """
+    return pdf_reader_info(get_pdf_reader(pdf_content))
+
+
+def pdf_reader_info(pdf_reader):
+    """
+    It extract pdfInfo from an opened pdf document 2019-03-11
+    :param pdf_reader: PyPDF2.PdfFileReader of a pdf document
+    :return: pdf info as {}-object
+    """
     def parse_pdf_datetime(pdf_datetime_str):
         """
         This inner function parse a datetime from a string returned the PdfFileReader.getDocumentInfo()['/CreationDate'] or ['/ModDate'] 2019-03-11
@@ -105,7 +179,6 @@ def pdf_info(pdf_content):
                + ':' + pdf_datetime_str[14:16] \
                + '+' + pdf_datetime_str[17:19]
 
-    pdf_reader = PyPDF2.PdfFileReader(BytesIO(pdf_content))
     info = pdf_reader.getDocumentInfo()
     info_out = {'Author': '', 'CreationDate': '', 'Creator': '', 'ModDate': '', 'Producer': '', 'Title': '', 'numPages': pdf_reader.numPages}
     if '/Author' in info:
@@ -123,37 +196,159 @@ def pdf_info(pdf_content):
     return info_out
 
 
-def cmd_stdin(cmd, stdin):
+def pdf_analyze(pdf_content):
+    """
+    It analyses a pdf document. One in-memory file of the document is parsed once by PyPDF2
+    (metadata, structure) and once by pdftotext (text), every later stage uses the result.
+    :param pdf_content: a content of a pdf file as bytes
+    :return: {'info': pdf info as pdf_info returns it,
+              'numPages': the number of pages,
+              'pages_text': [a text of the page, ...],
+              'pdf_reader': PyPDF2.PdfFileReader of the document, it is reused to split the document}
+    """
+    stream = BytesIO(pdf_content)
+    pdf_reader = PyPDF2.PdfFileReader(stream)
+    info = pdf_reader_info(pdf_reader)
+    stream.seek(0)
+    pages_text = list(pdftotext.PDF(stream))
+    return {'info': info, 'numPages': info['numPages'], 'pages_text': pages_text, 'pdf_reader': pdf_reader}
+
+
+# exit codes of ocrmypdf which are not errors, the searchable pdf and the text are written:
+# 4 - the output is not a valid PDF/A, 10 - the conversion to PDF/A failed
+OCRMYPDF_OK_CODES = (0, 4, 10)
+
+
+def cmd_stdin(cmd, stdin, timeout=None, ok_codes=(0, )):
     """
     It launches command 'cmd' and sends it to the standard input 'stdin'. 2019-03-10
+    The command is run by the supervisor, it waits for a free slot and it is killed after the timeout.
     :param cmd: an array of command e.g. ['tesseract','-l','rus+eng','-','-']
     :param stdin: a content to send to the standart input of a command
+    :param timeout: seconds after which the command is killed, OCR_SUBPROCESS_TIMEOUT by default
+    :param ok_codes: exit codes of the command which are not errors
     :return: the decoded stdout of result of command
     """
-    popen = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE)
-    return popen.communicate(input=stdin)[0]
-
-
-TESSERACT_STRARG = ['tesseract', '-l', TESSERACT_LANG, '-', '-', ]
-TESSERACT_PDFARG = TESSERACT_STRARG+['pdf']
+    returncode, stdout = supervisor.run(cmd, stdin, timeout)
+    if returncode not in ok_codes:
+        # e.g. tesseract killed by OCR_SUBPROCESS_MEMORY_LIMIT, its empty output is not an empty text
+        raise ProcessError(os.path.basename(cmd[0]), returncode)
+    return stdout
 
 
-def ocr_img2str(stdin):
+def ocr_img2str(stdin, lang=None):
     """
     It recognize image from 'stdin' to string 2019-03-10
     :param stdin: image as bytes
+    :param lang: languages of tesseract, OCR_TESSERACT_LANG by default
     :return: content of recognized image as a string
     """
-    return cmd_stdin(TESSERACT_STRARG, stdin).decode()
+    return cmd_stdin(['tesseract', '-l', tesseract_lang(lang), '-', '-'], stdin).decode()
 
 
-def ocr_img2pdf(stdin):
+def ocr_img2pdf(stdin, lang=None):
     """
     It recognize image from 'stdin' to pdf 2019-03-10
     :param stdin: image as bytes
+    :param lang: languages of tesseract, OCR_TESSERACT_LANG by default
     :return: content of recognuzed image as pdf (bytes)
     """
-    return cmd_stdin(TESSERACT_PDFARG, stdin)
+    return cmd_stdin(['tesseract', '-l', tesseract_lang(lang), '-', '-', 'pdf'], stdin)
+
+
+def ocr_img2outputs(stdin, configs=('txt', 'pdf'), lang=None):
+    """
+    It recognizes an image from 'stdin' once and captures every requested output of tesseract
+    :param stdin: image as bytes
+    :param configs: tesseract output configs e.g. ('txt', 'pdf', 'hocr')
+    :param lang: languages of tesseract, OCR_TESSERACT_LANG by default
+    :return: {config: output}, the 'pdf' output is bytes, the others are strings
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_base = os.path.join(tmp_dir, 'out')
+        cmd_stdin(['tesseract', '-l', tesseract_lang(lang), '-', output_base] + list(configs), stdin)
+        outputs = {}
+        for config in configs:
+            path = output_base + '.' + config
+            if os.path.isfile(path):
+                output = read_binary_file(path)
+                outputs[config] = output if config == 'pdf' else output.decode()
+        return outputs
+
+
+def image_frames(content):
+    """
+    It splits a multi-frame image (e.g. a multi-page fax TIFF) into frames
+    :param content: an image as bytes
+    :return: a list of frames as PNG images (bytes), an empty list if the image has only one frame
+    """
+    from PIL import Image, ImageSequence  # Pillow is needed only for multi-frame images
+    try:
+        image = Image.open(BytesIO(content))
+    except IOError:
+        return []
+    if getattr(image, 'n_frames', 1) < 2:
+        return []
+    frames = []
+    for frame in ImageSequence.Iterator(image):
+        if frame.mode in ('CMYK', 'YCbCr', 'LAB', 'HSV'):
+            frame = frame.convert('RGB')
+        elif frame.mode in ('I', 'F'):
+            frame = frame.convert('L')
+        kwargs = {'compress_level': 1}
+        if frame.info.get('dpi'):
+            kwargs['dpi'] = tuple(round(value) for value in frame.info['dpi'])  # faxes have different x and y dpi
+        output = BytesIO()
+        frame.save(output, 'PNG', **kwargs)
+        frames.append(output.getvalue())
+    return frames
+
+
+def ocr_img_frames(frames, configs=('txt', 'pdf'), processes=None, lang=None):
+    """
+    It recognizes frames of a multi-frame image by tesseract processes concurrently
+    :param frames: a list of images as bytes
+    :param configs: tesseract output configs e.g. ('txt', 'pdf'), 'hocr' is not supported
+    :param processes: the number of concurrent tesseract processes, OCR_TIFF_PROCESSES by default
+    :param lang: languages of tesseract, OCR_TESSERACT_LANG by default
+    :return: {config: output} like ocr_img2outputs, texts of frames are separated by the form feed,
+        searchable pdfs of frames are merged in the order of frames
+    """
+    if processes is None:
+        processes = getattr(settings, 'OCR_TIFF_PROCESSES', default_tiff_processes)
+    configs = [config for config in configs if config != 'hocr']
+    with ThreadPoolExecutor(max_workers=max(1, min(processes, len(frames)))) as executor:
+        frames_outputs = list(executor.map(lambda frame: ocr_img2outputs(frame, configs, lang), frames))
+    outputs = {}
+    if 'txt' in configs:
+        texts = [frame_outputs.get('txt', '').rstrip('\f') for frame_outputs in frames_outputs]
+        outputs['txt'] = '\f'.join(text if text.strip() else '' for text in texts)
+    if 'pdf' in configs and all(frame_outputs.get('pdf') for frame_outputs in frames_outputs):
+        outputs['pdf'] = pdf_merge([frame_outputs['pdf'] for frame_outputs in frames_outputs])
+    return outputs
+
+
+def hocr2pdf(hocr, image):
+    """
+    It creates a searchable pdf from an image and its hOCR without recognizing the image again
+    :param hocr: hOCR of the image as a string
+    :param image: image as bytes
+    :return: content of the searchable pdf (bytes)
+    """
+    from PIL import Image  # Pillow and ocrmypdf are needed only if hOCR is stored
+    from ocrmypdf.hocrtransform import HocrTransform
+    dpi = Image.open(BytesIO(image)).info.get('dpi', (300, 300))[0] or 300
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        hocr_filename = os.path.join(tmp_dir, 'image.hocr')
+        image_filename = os.path.join(tmp_dir, 'image')
+        pdf_filename = os.path.join(tmp_dir, 'image.pdf')
+        with open(hocr_filename, 'w') as f:
+            f.write(hocr)
+        with open(image_filename, 'wb') as f:
+            f.write(image)
+        # out_filename, image_filename, show_bounding_boxes, fontname, invisible_text
+        HocrTransform(hocr_filename, dpi).to_pdf(pdf_filename, image_filename, False, 'Helvetica', True)
+        return read_binary_file(pdf_filename)
 
 
 def pdf_need_ocr(pdf_text):
@@ -171,22 +366,256 @@ def pdf_need_ocr(pdf_text):
     return True  # a pdf document needs to be OCRed by default
 
 
-def ocr_pdf(stdin, filename):
+def pdf_page_ranges(num_pages, num_ranges):
     """
-    This function OCRs a pdf document from the stdin, \
-    then saves searchable pdf to a disk if filename does not equal 'store_pdf_disabled', returns a recognized text 2019-04-11
+    It divides pages of a pdf document into contiguous ranges of nearly equal length
+    :param num_pages: the number of pages of a pdf document
+    :param num_ranges: the maximum number of ranges
+    :return: a list of (start, stop) page indexes
+    """
+    num_ranges = max(1, min(num_ranges, num_pages))
+    size, rest = divmod(num_pages, num_ranges)
+    ranges = []
+    start = 0
+    for i in range(num_ranges):
+        stop = start + size + (1 if i < rest else 0)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+def pdf_split(pdf_content, ranges):
+    """
+    It splits a pdf document into pdf documents containing page ranges
+    :param pdf_content: a content of a pdf file as bytes or PyPDF2.PdfFileReader
+    :param ranges: a list of (start, stop) page indexes
+    :return: a list of contents of pdf files as bytes
+    """
+    pdf_reader = get_pdf_reader(pdf_content)
+    pdf_contents = []
+    for start, stop in ranges:
+        pdf_writer = PyPDF2.PdfFileWriter()
+        for page in range(start, stop):
+            pdf_writer.addPage(pdf_reader.getPage(page))
+        out = BytesIO()
+        pdf_writer.write(out)
+        pdf_contents.append(out.getvalue())
+    return pdf_contents
+
+
+def pdf_assemble(pdf_contents, pages):
+    """
+    It assembles a pdf document from pages of pdf documents
+    :param pdf_contents: a list of contents of pdf files as bytes or PyPDF2.PdfFileReaders
+    :param pages: a list of (index of a pdf document in pdf_contents, page index) in order of the assembled document
+    :return: a content of the assembled pdf file as bytes
+    """
+    pdf_readers = [get_pdf_reader(pdf_content) for pdf_content in pdf_contents]
+    pdf_writer = PyPDF2.PdfFileWriter()
+    for document, page in pages:
+        pdf_writer.addPage(pdf_readers[document].getPage(page))
+    out = BytesIO()
+    pdf_writer.write(out)
+    return out.getvalue()
+
+
+def pdf_merge(pdf_contents):
+    """
+    It merges pdf documents into one pdf document keeping the order of pages
+    :param pdf_contents: a list of contents of pdf files as bytes
+    :return: a content of the merged pdf file as bytes
+    """
+    pdf_readers = [get_pdf_reader(pdf_content) for pdf_content in pdf_contents]
+    pages = []
+    for document, pdf_reader in enumerate(pdf_readers):
+        pages += [(document, page) for page in range(pdf_reader.numPages)]
+    return pdf_assemble(pdf_readers, pages)
+
+
+def ocrmypdf(stdin, filename, jobs=None, lang=None):
+    """
+    It runs ocrmypdf for a pdf document from the stdin 2019-04-11
     :param stdin: a pdf document as bytes
     :param filename: a filename of a searchable pdf that will be created
-    :return: a recognized text
+    :param jobs: the number of pages that ocrmypdf OCRs concurrently, None - the number of cores
+    :param lang: languages of tesseract, OCR_TESSERACT_LANG by default
+    :return: a recognized text, pages are separated by the form feed
     """
-    popen = subprocess.Popen([
+    cmd = [
         'ocrmypdf',
         '-l',
-        TESSERACT_LANG,
+        tesseract_lang(lang),
         '-',  # using STDIN
         filename,  #
         '--force-ocr',
         '--sidecar',
         '-'  # using STDOUT for sidecar
-    ], stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE)
-    return popen.communicate(input=stdin)[0].decode()
+    ]
+    if jobs:
+        cmd += ['--jobs', str(jobs)]
+    timeout = getattr(settings, 'OCR_SUBPROCESS_PDF_TIMEOUT', default_subprocess_pdf_timeout)
+    return cmd_stdin(cmd, stdin, timeout, OCRMYPDF_OK_CODES).decode()
+
+
+def pdf_pages_need_ocr(pages_text):
+    """
+    This function determines which pages of a pdf document need to be OCRed.
+    If the text of the whole document is missing or does not look like a real text all pages need to be OCRed,
+    otherwise only pages without text (image-only pages) need to be OCRed.
+    :param pages_text: a list of texts of pages of a pdf document
+    :return: a list of booleans, True for each page that needs to be OCRed
+    """
+    if pdf_need_ocr(''.join(pages_text)):
+        return [True] * len(pages_text)
+    return [not page_text.strip() for page_text in pages_text]
+
+
+def ocr_pdf_range(stdin, filename, lang=None):
+    """
+    It runs ocrmypdf for a range of pages of a pdf document split by ocr_pdf
+    :param stdin: a pdf document of the range as bytes
+    :param filename: a filename of a searchable pdf of the range
+    :param lang: languages of tesseract, OCR_TESSERACT_LANG by default
+    :return: a recognized text, '' and the searchable pdf is not written if ocrmypdf failed
+    """
+    try:
+        return ocrmypdf(stdin, filename, jobs=1, lang=lang)
+    except ProcessTimeoutError:
+        raise  # the whole document would not be OCRed in time either
+    except ProcessError:
+        return ''
+
+
+def ocr_pdf(stdin, filename, processes=None, pdf_reader=None, lang=None):
+    """
+    This function OCRs a pdf document from the stdin, \
+    then saves searchable pdf to a disk if filename does not equal 'store_pdf_disabled', returns a recognized text 2019-04-11.
+    When processes is greater than 1 the pdf document is split into page ranges
+    which are OCRed by ocrmypdf processes concurrently,
+    then searchable pages and recognized text are merged back in order.
+    :param stdin: a pdf document as bytes
+    :param filename: a filename of a searchable pdf that will be created
+    :param processes: the number of concurrent ocrmypdf processes, OCR_PDF_PROCESSES by default
+    :param pdf_reader: PyPDF2.PdfFileReader of the pdf document if it is already opened
+    :param lang: languages of tesseract, OCR_TESSERACT_LANG by default
+    :return: a recognized text
+    """
+    if processes is None:
+        processes = getattr(settings, 'OCR_PDF_PROCESSES', default_pdf_processes)
+    if processes <= 1:
+        return ocrmypdf(stdin, filename, lang=lang)
+    try:
+        pdf_reader = get_pdf_reader(pdf_reader or stdin)
+        if pdf_reader.numPages <= 1:
+            return ocrmypdf(stdin, filename, jobs=1, lang=lang)
+        pdf_contents = pdf_split(pdf_reader, pdf_page_ranges(pdf_reader.numPages, processes))
+    except (PyPDF2.utils.PdfReadError, NotImplementedError):
+        # PyPDF2 can not split the document (e.g. it is encrypted), let ocrmypdf process it as a whole
+        return ocrmypdf(stdin, filename, lang=lang)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filenames = [os.path.join(tmp_dir, '{}.pdf'.format(i)) for i in range(len(pdf_contents))]
+        with ThreadPoolExecutor(max_workers=len(pdf_contents)) as executor:
+            texts = list(executor.map(lambda args: ocr_pdf_range(*args, lang=lang), zip(pdf_contents, filenames)))
+        if not all(os.path.isfile(part_filename) for part_filename in filenames):
+            # ocrmypdf failed on a page range, its text is missing, so the pages of the merged text would not match
+            # the pages of the document, the whole document is OCRed by one ocrmypdf run as without processes
+            return ocrmypdf(stdin, filename, lang=lang)
+        with open(filename, 'wb') as pdf:
+            pdf.write(pdf_merge([read_binary_file(part_filename) for part_filename in filenames]))
+    return '\f'.join(texts)
+
+
+def ocr_pdf_pages(stdin, filename, need_ocr, processes=None, pdf_reader=None, lang=None):
+    """
+    This function OCRs only pages of a pdf document from the stdin that need to be OCRed,
+    then saves a searchable pdf to a disk where the other pages are kept as is
+    :param stdin: a pdf document as bytes
+    :param filename: a filename of a searchable pdf that will be created
+    :param need_ocr: a list of booleans, True for each page that needs to be OCRed
+    :param processes: the number of concurrent ocrmypdf processes, OCR_PDF_PROCESSES by default
+    :param pdf_reader: PyPDF2.PdfFileReader of the pdf document if it is already opened
+    :param lang: languages of tesseract, OCR_TESSERACT_LANG by default
+    :return: a list of recognized texts of pages that need to be OCRed
+    """
+    pdf_reader = get_pdf_reader(pdf_reader or stdin)
+    pages = [page for page, need in enumerate(need_ocr) if need]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        ocred_filename = os.path.join(tmp_dir, 'ocred.pdf')
+        texts = ocr_pdf(pdf_assemble([pdf_reader], [(0, page) for page in pages]), ocred_filename, processes,
+                        lang=lang).split('\f')
+        if os.path.isfile(ocred_filename):
+            ocred_pages = iter(range(len(pages)))
+            with open(filename, 'wb') as pdf:
+                pdf.write(pdf_assemble([pdf_reader, read_binary_file(ocred_filename)],
+                                       [(1, next(ocred_pages)) if need else (0, page)
+                                        for page, need in enumerate(need_ocr)]))
+    texts += [''] * (len(pages) - len(texts))
+    return texts[:len(pages)]
+
+
+def osd_script(stdin):
+    """
+    It detects the script of an image by the orientation and script detection of tesseract,
+    it does not recognize the text, so it is much faster than OCR
+    :param stdin: image as bytes
+    :return: (script, confidence) e.g. ('Cyrillic', 5.3), (None, 0.0) if the script is not detected
+    """
+    output = supervisor.run(['tesseract', '-', '-', '--psm', '0'], stdin, stderr=subprocess.STDOUT)[1]\
+        .decode(errors='replace')
+    script = re.search(r'^Script: (\w+)', output, re.MULTILINE)
+    confidence = re.search(r'^Script confidence: ([\d.]+)', output, re.MULTILINE)
+    if not script:
+        return None, 0.0
+    return script.group(1), float(confidence.group(1)) if confidence else 0.0
+
+
+def detect_image_lang(stdin):
+    """
+    It returns languages of tesseract for the script of an image detected by tesseract OSD
+    :param stdin: image as bytes
+    :return: languages of OCR_SCRIPT_LANGS e.g. 'rus', '' if the script is not detected or it is unknown
+    """
+    script, confidence = osd_script(stdin)
+    if confidence < getattr(settings, 'OCR_LANG_DETECT_MIN_CONFIDENCE', default_lang_detect_min_confidence):
+        return ''
+    return getattr(settings, 'OCR_SCRIPT_LANGS', default_script_langs).get(script, '')
+
+
+def detect_text_lang(text):
+    """
+    It returns languages of tesseract for scripts of letters of a text,
+    e.g. 'rus+eng' for a russian text with english terms
+    :param text: a text
+    :return: languages of OCR_SCRIPT_LANGS ordered by the number of letters of their scripts,
+        '' if the text has less than OCR_LANG_DETECT_MIN_CHARS letters of known scripts
+    """
+    script_langs = getattr(settings, 'OCR_SCRIPT_LANGS', default_script_langs)
+    counts = {}
+    for script in script_langs:
+        try:
+            counts[script] = len(regex.findall(r'\p{' + script + '}', text))
+        except regex.error:
+            continue  # OSD names some scripts by languages e.g. 'Japanese', they are not unicode scripts
+    total = sum(counts.values())
+    if not total or total < getattr(settings, 'OCR_LANG_DETECT_MIN_CHARS', default_lang_detect_min_chars):
+        return ''
+    min_count = total * getattr(settings, 'OCR_LANG_DETECT_MIN_SHARE', default_lang_detect_min_share)
+    langs = []
+    for script in sorted(counts, key=counts.get, reverse=True):
+        if counts[script] < min_count:
+            break
+        langs += [lang for lang in script_langs[script].split('+') if lang not in langs]
+    return '+'.join(langs)
+
+
+def pdf_sample_text(pdf, page, lang=None):
+    """
+    It recognizes one page of a pdf document, the text is a sample to detect the script of the document
+    :param pdf: a content of a pdf file as bytes or an already opened PyPDF2.PdfFileReader
+    :param page: the number of the page from 0
+    :param lang: languages of tesseract, OCR_TESSERACT_LANG by default
+    :return: the recognized text of the page
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        return ocrmypdf(pdf_assemble([get_pdf_reader(pdf)], [(0, page)]), os.path.join(tmp_dir, 'sample.pdf'),
+                        jobs=1, lang=lang)
@@ -8,25 +8,101 @@ __date__ = '2019-03-19'
 from django.views.generic import View
 from django.views.static import was_modified_since
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.utils.http import http_date
+from django.utils.http import http_date, parse_etags
 from django.urls import reverse_lazy
-from django.http import HttpResponse, Http404, HttpResponseNotModified
+from django.http import HttpResponse, FileResponse, Http404, HttpResponseNotModified
 from django.conf import settings
+from ocr import settings as ocr_default_settings
+from django.core.files.storage import default_storage
+from .models import OCRedFile
+from .storage import resolve_stored_name
 import os
+import re
 import mimetypes
 
 
 PWD = "%s/%s" % (settings.BASE_DIR, __package__)  # directory of the django-ocr-server/ocr application
-UPLOAD_DIR = "%s/upload/" % PWD
-PDF_DIR = "%s/pdf/" % PWD
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeFile:
+    """
+    A file-like object which reads only a range of bytes of a file, it is streamed by FileResponse
+    """
+    def __init__(self, file, start, length):
+        """
+        RangeFile constructor
+        :param file: a file opened in binary mode
+        :param start: the offset of the first byte of the range
+        :param length: the length of the range
+        """
+        self.file = file
+        self.file.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """
+    This function parses the value of the Range header of a request for one range of bytes
+    :param header: the value of the Range header
+    :param size: the size of the file
+    :return: (start, end) of the range including the end, None if the header is not a single range of bytes,
+        () if the range is not satisfiable
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or not (match.group(1) or match.group(2)):
+        return None  # a wrong or a multiple range, the whole file will be returned
+    if not match.group(1):
+        # the last N bytes
+        length = int(match.group(2))
+        if not length or not size:
+            return ()
+        return max(0, size - length), size - 1
+    start = int(match.group(1))
+    end = int(match.group(2)) if match.group(2) else size - 1
+    if start >= size or end < start:
+        return ()
+    return start, min(end, size - 1)
 
 
 class DownloadView(LoginRequiredMixin, View):
     """
-    View for downloading OCRedFile.file or OCRedFile.ocred_pdf 2019-04-09
+    View for downloading OCRedFile.file or OCRedFile.ocred_pdf 2019-04-09.
+    Files are streamed by chunks, a single range of bytes is supported,
+    the ETag is the md5 of the file stored in OCRedFile.
+    If OCR_DOWNLOAD_ACCEL is 'nginx' or 'sendfile' the transfer is passed to the front web server
+    by X-Accel-Redirect or X-Sendfile.
     """
     login_url = reverse_lazy('admin:index')
 
+    @staticmethod
+    def get_etag(download_target, name, stat):
+        """
+        Returns the ETag of the file, the md5 stored in OCRedFile or a weak ETag of mtime and size of an unknown file
+        :param download_target: 'file' or 'pdf'
+        :param name: the stored name of the file
+        :param stat: os.stat_result of the file
+        :return: the ETag
+        """
+        if download_target == 'file':
+            md5_value = OCRedFile.objects.filter(file=name).values_list('md5', flat=True).first()
+        else:
+            md5_value = OCRedFile.objects.filter(ocred_pdf=name).values_list('ocred_pdf_md5', flat=True).first()
+        if md5_value:
+            return '"{}"'.format(md5_value)
+        return 'W/"{:x}-{:x}"'.format(int(stat.st_mtime), stat.st_size)
+
     def get(self, request, download_target, filename):
         """
         The view class for downloading files 2019-04-09
@@ -34,21 +110,57 @@ class DownloadView(LoginRequiredMixin, View):
         :return: HttpResponse
         """
         if download_target == 'file':
-            path = UPLOAD_DIR + filename
+            upload_to = getattr(settings, 'OCR_FILES_UPLOAD_TO', ocr_default_settings.FILES_UPLOAD_TO)
         else:
-            path = PDF_DIR + filename
-        if not os.path.isfile(path):
-            raise Http404('"%s" does not exist' % path)
+            upload_to = getattr(settings, 'OCR_PDF_UPLOAD_TO', ocr_default_settings.PDF_UPLOAD_TO)
+        name = resolve_stored_name(upload_to, filename)
+        if name is None:
+            raise Http404('"%s" does not exist' % (upload_to + filename))
+        path = default_storage.path(name)
         stat = os.stat(path)
         content_type, encoding = mimetypes.guess_type(path)
         content_type = content_type or 'application/octet-stream'
-        if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'),
-                                  stat.st_mtime, stat.st_size):
+        etag = self.get_etag(download_target, name, stat)
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            if etag in parse_etags(if_none_match) or if_none_match.strip() == '*':
+                response = HttpResponseNotModified(content_type=content_type)
+                response['ETag'] = etag
+                return response
+        elif not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'),
+                                    stat.st_mtime, stat.st_size):
             return HttpResponseNotModified(content_type=content_type)
-        response = HttpResponse(open(path, 'rb').read(), content_type=content_type)
+        accel = getattr(settings, 'OCR_DOWNLOAD_ACCEL', ocr_default_settings.DOWNLOAD_ACCEL)
+        if accel:
+            # the front web server sends the file, it also serves Range requests
+            response = HttpResponse(content_type=content_type)
+            if accel == 'nginx':
+                location = getattr(settings, 'OCR_DOWNLOAD_ACCEL_LOCATION',
+                                   ocr_default_settings.DOWNLOAD_ACCEL_LOCATION)
+                response['X-Accel-Redirect'] = location + name
+            else:
+                response['X-Sendfile'] = os.path.abspath(path)
+        else:
+            start, length = 0, stat.st_size
+            byte_range = None
+            if_range = request.META.get('HTTP_IF_RANGE')
+            if 'HTTP_RANGE' in request.META and (if_range is None or if_range.strip() in (etag, http_date(stat.st_mtime))):
+                byte_range = parse_range(request.META['HTTP_RANGE'], stat.st_size)
+            if byte_range == ():
+                response = HttpResponse(status=416, content_type=content_type)
+                response['Content-Range'] = 'bytes */{}'.format(stat.st_size)
+                return response
+            file = open(path, 'rb')
+            if byte_range:
+                start, length = byte_range[0], byte_range[1] - byte_range[0] + 1
+                response = FileResponse(RangeFile(file, start, length), status=206, content_type=content_type)
+                response['Content-Range'] = 'bytes {}-{}/{}'.format(byte_range[0], byte_range[1], stat.st_size)
+            else:
+                response = FileResponse(file, content_type=content_type)
+            response['Content-Length'] = length
+        response['Accept-Ranges'] = 'bytes'
+        response['ETag'] = etag
         response['Last-Modified'] = http_date(stat.st_mtime)
-        response['Content-Length'] = stat.st_size
         if encoding:
             response['Content-Encoding'] = encoding
         return response
-
@@ -0,0 +1,65 @@
+"""
+ocr/worker.py
+This file contains the loop of an OCR worker process that processes queued OCRJobs
+"""
+__author__ = 'shmakovpn <shmakovpn@yandex.ru>'
+__date__ = '2026-10-18'
+
+import time
+import signal
+import multiprocessing
+from django.conf import settings
+from django.db import connections
+from ocr import settings as ocr_default_settings
+from .models import OCRJob
+
+
+def run_worker(interval=None, once=False):
+    """
+    Claims queued OCRJobs one by one and runs them until SIGTERM or SIGINT is received
+    :param interval: seconds between polls of the queue when it is empty
+    :param once: if True the worker exits when the queue becomes empty
+    :return: the number of processed OCRJobs
+    """
+    if interval is None:
+        interval = getattr(settings, 'OCR_WORKER_POLL_INTERVAL', ocr_default_settings.WORKER_POLL_INTERVAL)
+    stopped = []
+
+    def stop(signum, frame):
+        stopped.append(signum)
+
+    old_handlers = signal.signal(signal.SIGTERM, stop), signal.signal(signal.SIGINT, stop)
+    counter = 0
+    try:
+        while not stopped:
+            job = OCRJob.next_queued()
+            if job:
+                job.run()
+                counter += 1
+                continue
+            if once:
+                break
+            time.sleep(interval)
+    finally:
+        signal.signal(signal.SIGTERM, old_handlers[0])
+        signal.signal(signal.SIGINT, old_handlers[1])
+    return counter
+
+
+def run_workers(processes=None, interval=None, once=False):
+    """
+    Starts the pool of worker processes and waits for them
+    :param processes: the number of worker processes
+    :param interval: seconds between polls of the queue when it is empty
+    :param once: if True the workers exit when the queue becomes empty
+    :return: None
+    """
+    if processes is None:
+        processes = getattr(settings, 'OCR_WORKER_PROCESSES', ocr_default_settings.WORKER_PROCESSES)
+    connections.close_all()  # each worker process has to open its own database connection
+    workers = [multiprocessing.Process(target=run_worker, kwargs={'interval': interval, 'once': once})
+               for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()